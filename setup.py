@@ -19,6 +19,7 @@ setup(name='MeshDD',
               'meshdd_tricolor_earth = meshdd.tools.tricolor_earth:main',
               'meshdd_bicolor_mesh = meshdd.tools.bicolor_mesh:main',
               'meshdd_topo_bathy_earth = meshdd.tools.topo_bathy_earth:main',
+              'meshdd_serve = meshdd.tools.server:main',
           ]
       },
 )
@@ -21,9 +21,13 @@ def get_texture_from_image(image):
     return np.swapaxes(image, 0, 1)[:, ::-1, ...]
 
 
-def displace_vertices(vertices, directions, length=1., mask=True):
+def displace_vertices(vertices, directions, length=1., mask=True, out=None, chunk_size=None):
     """
     Displaces vertices by given length along directions where mask is True
+
+    Set out to the output array (e.g. vertices to displace them in place)
+    and chunk_size to displace the vertices by chunks, bounding the size of
+    the temporary arrays.
     
     Parameters
     ----------
@@ -33,8 +37,12 @@ def displace_vertices(vertices, directions, length=1., mask=True):
         Directions of displacement (e.g. the mesh normals)
     length: scalar, (n) or (n, d) float
         Length of displacement
-    mask: (n) bool
+    mask: (n) bool or PackedMask
         Mask of which vertices will be displaced
+    out: (n, d) float or None
+        Array where to store the displaced vertices (new array if None)
+    chunk_size: int or None
+        Number of vertices displaced at once (all if None)
 
     Returns
     -------
@@ -42,8 +50,56 @@ def displace_vertices(vertices, directions, length=1., mask=True):
         Displaced vertices
     """
 
-    # Multiplicating length by mask beforehand to allow broadcasting
-    return vertices + np.atleast_1d(length * mask)[:, None] * directions
+    if out is None and chunk_size is None:
+        if isinstance(mask, PackedMask):
+            mask = mask.unpack()
+
+        # Multiplicating length by mask beforehand to allow broadcasting
+        return vertices + np.atleast_1d(length * mask)[:, None] * directions
+
+    if out is None:
+        out = np.empty_like(vertices)
+    chunk_size = chunk_size or vertices.shape[0]
+
+    def chunk(values, start, stop):
+        if isinstance(values, PackedMask):
+            return values.gather(np.arange(start, min(stop, values.size)))
+        return values[start:stop] if np.ndim(values) > 0 else values
+
+    for start in range(0, vertices.shape[0], chunk_size):
+        stop = start + chunk_size
+        factor = np.atleast_1d(chunk(length, start, stop) * chunk(mask, start, stop))[:, None]
+        np.add(vertices[start:stop], factor * directions[start:stop], out=out[start:stop])
+
+    return out
+
+
+def get_texture_indexes(tcoords, shape):
+    """
+    Returns the indexes of the texture pixels pointed by the given texture coords
+
+    Parameters
+    ----------
+    tcoords: (n, 2) float
+        Texture coordinates for each vertice
+    shape: (p, q,) int
+        Shape of the texture (only the two first dimensions are used)
+
+    Returns
+    -------
+    i: (n,) int
+        Pixel index along the first texture axis
+    j: (n,) int
+        Pixel index along the second texture axis
+    """
+
+    shape = np.asarray(shape[:2])
+    tcoords_scaled = np.minimum(
+        shape - 1,
+        np.maximum((0, 0),
+                   np.floor(tcoords * shape).astype(np.int64)))
+
+    return tcoords_scaled[:, 0], tcoords_scaled[:, 1]
 
 
 def get_vertex_color_from_texture(tcoords, texture):
@@ -63,12 +119,247 @@ def get_vertex_color_from_texture(tcoords, texture):
         texture sampled at each texture coordinate
     """
 
-    tcoords_scaled = np.minimum(
-        np.array(texture.shape) - 1,
-        np.maximum((0, 0),
-                   np.floor(tcoords * texture.shape).astype(np.int64)))
+    i, j = get_texture_indexes(tcoords, texture.shape)
+    return texture[i, j, ...]
+
+
+def get_texture_resolution(tcoords, faces, oversampling=1., samples=2**16):
+    """
+    Shape of a texture matching the resolution of a mesh
+
+    The steps of the texture coordinates along the edges of (a subset of)
+    the faces are measured and the shape is chosen so that the median step
+    covers the given number of pixels along each texture axis. A larger
+    texture may then be decoded at a reduced scale (see
+    `meshdd.tools.read_texture`) with little effect on the sampled colors.
+
+    Parameters
+    ----------
+    tcoords: (n, 2) float
+        Texture coordinates for each vertice
+    faces: (m, d) int
+        Mesh faces defined by vertices indexes
+    oversampling: float
+        Number of texture pixels per edge
+    samples: int
+        Maximal number of faces used to measure the steps
+
+    Returns
+    -------
+    shape: (p, q) int
+        Shape of the texture (two first dimensions)
+    """
+
+    faces = faces[::max(1, faces.shape[0] // samples)]
+    steps = np.abs(np.concatenate([tcoords[faces[:, (k + 1) % faces.shape[1]]] - tcoords[faces[:, k]]
+                                   for k in range(faces.shape[1])]))
+
+    shape = []
+    for axis in range(2):
+        axis_steps = steps[steps[:, axis] > 0, axis]
+        shape.append(int(np.ceil(oversampling / np.median(axis_steps))) if axis_steps.size > 0 else 1)
+
+    return tuple(shape)
+
+
+def map_vertex_color(vertex_color, function):
+    """
+    Applies a function on the mean of the channels of the color per vertex
+
+    For integer colors (e.g. sampled from uint8 or uint16 textures), the
+    channels are summed in integer arithmetic and the function is evaluated
+    once per possible sum, as a lookup table (of 256 or 65536 entries per
+    channel) applied to the sampled values. Other colors are averaged and
+    passed to the function directly.
+
+    Parameters
+    ----------
+    vertex_color: (n,) or (n, c) any
+        Color per vertex (see `get_vertex_color_from_texture`)
+    function: callable
+        Vectorized function of the (float) mean of the channels, e.g.
+        `lambda value: value >= threshold` or `lambda value: depth * value / 255.`
+
+    Returns
+    -------
+    values: (n,) any
+        Function value for each vertex
+    """
+
+    vertex_color = np.asarray(vertex_color)
+    channels = 1 if vertex_color.ndim == 1 else vertex_color.shape[1]
+
+    if not np.issubdtype(vertex_color.dtype, np.integer) or vertex_color.dtype.itemsize > 2:
+        if vertex_color.ndim > 1:
+            vertex_color = np.mean(vertex_color, axis=1)
+        return function(vertex_color)
+
+    # Lookup table indexed by the sum of the channels (shifted for signed types)
+    info = np.iinfo(vertex_color.dtype)
+    table = function((channels * info.min + np.arange(channels * (info.max - info.min) + 1)) / channels)
+    # Column-wise sum (much faster than summing along the last axis)
+    index = vertex_color.reshape(len(vertex_color), channels)[:, 0].astype(np.intp)
+    for c in range(1, channels):
+        index += vertex_color[:, c]
+    index -= channels * info.min
+
+    return table[index]
+
+
+class PackedMask:
+    """
+    Boolean mask stored with one bit per element (see `numpy.packbits`)
+
+    The mask-based functions of this module accept such masks instead of
+    boolean arrays and then return packed masks too, so that the masks use
+    8 times less memory.
+
+    Parameters
+    ----------
+    bits: (ceil(n / 8)) uint8
+        Packed bits (big bit order, padding bits set to 0)
+    size: int
+        Number of elements n
+    """
+
+    #: Number of elements unpacked or gathered at once
+    chunk_size = 2**16
+
+    def __init__(self, bits, size):
+        assert bits.dtype == np.uint8 and bits.size == (size + 7) // 8, "Invalid packed bits!"
+        self.bits = bits
+        self.size = size
+
+    @classmethod
+    def pack(cls, mask):
+        """ Packs a boolean array """
+        return cls(np.packbits(mask), mask.size)
+
+    @classmethod
+    def from_indexes(cls, indexes, size):
+        """ Mask of given size where only the elements at given indexes are True """
+        bits = np.zeros((size + 7) // 8, dtype=np.uint8)
+        np.bitwise_or.at(bits, indexes >> 3, np.right_shift(128, indexes & 7).astype(np.uint8))
+        return cls(bits, size)
+
+    @property
+    def shape(self):
+        return (self.size,)
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes
+
+    def __len__(self):
+        return self.size
+
+    def unpack(self):
+        """ Returns the corresponding boolean array """
+        return np.unpackbits(self.bits, count=self.size).view(bool)
+
+    def gather(self, indexes):
+        """
+        Values of the mask at given indexes
+
+        Equivalent to `mask.unpack()[indexes]` without unpacking the mask,
+        by chunks so that the temporary arrays stay small.
+
+        Parameters
+        ----------
+        indexes: (...) int
+            Indexes of the elements
+
+        Returns
+        -------
+        values: (...) bool
+            Mask values
+        """
+
+        indexes = np.asarray(indexes)
+        flat_indexes = indexes.reshape(-1)
+        values = np.empty(flat_indexes.size, dtype=np.uint8)
+        for i in range(0, flat_indexes.size, self.chunk_size):
+            chunk = flat_indexes[i:i + self.chunk_size]
+            shift = (7 - (chunk & 7)).astype(np.uint8)
+            values[i:i + self.chunk_size] = np.right_shift(self.bits[chunk >> 3], shift) & 1
+
+        return values.view(bool).reshape(indexes.shape)
+
+    def count(self):
+        """ Number of True elements """
+        return int(np.sum(_popcount[self.bits], dtype=np.int64))
+
+    def nonzero(self):
+        """ Sorted indexes of the True elements (like `numpy.flatnonzero`) """
+        step = self.chunk_size // 8
+        return np.concatenate([np.flatnonzero(np.unpackbits(self.bits[i:i + step])) + 8 * i
+                               for i in range(0, self.bits.size, step)] or [np.empty(0, dtype=np.int64)])
+
+    def __invert__(self):
+        bits = np.invert(self.bits)
+        if self.size % 8:
+            bits[-1] &= np.uint8((0xFF << (8 - self.size % 8)) & 0xFF)
+        return PackedMask(bits, self.size)
+
+    def __and__(self, other):
+        return PackedMask(self.bits & other.bits, self.size)
+
+    def __or__(self, other):
+        return PackedMask(self.bits | other.bits, self.size)
+
+
+# Number of bits set in each byte
+_popcount = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
+
+
+def _gather(vertices_mask, indexes):
+    """ Values of a boolean or packed mask at given indexes """
+    if isinstance(vertices_mask, PackedMask):
+        return vertices_mask.gather(indexes)
+    return vertices_mask[indexes]
+
+
+def _nonzero(mask):
+    """ Indexes of the True elements of a boolean or packed mask """
+    if isinstance(mask, PackedMask):
+        return mask.nonzero()
+    return np.flatnonzero(mask)
+
+
+def _count(mask):
+    """ Number of True elements of a boolean or packed mask """
+    if isinstance(mask, PackedMask):
+        return mask.count()
+    return int(np.count_nonzero(mask))
+
+
+def _like(mask, result):
+    """ Packs the boolean result if the given mask is packed """
+    if isinstance(mask, PackedMask):
+        return PackedMask.pack(result)
+    return result
+
+
+def _get_faces_mask(faces, vertices_mask, predicate):
+    """
+    Mask of the faces whose number of vertices inside the mask satisfies the predicate
+
+    Vertices are counted one column at a time and, for packed masks, by
+    chunks of faces so that no (n, d) temporary array is created.
+    """
 
-    return texture[tcoords_scaled[:, 0], tcoords_scaled[:, 1], ...]
+    def faces_mask(faces):
+        inside_vertices_count = np.zeros(faces.shape[0], dtype=np.uint8)
+        for k in range(faces.shape[1]):
+            inside_vertices_count += _gather(vertices_mask, faces[:, k])
+        return predicate(inside_vertices_count)
+
+    if not isinstance(vertices_mask, PackedMask):
+        return faces_mask(faces)
+
+    step = PackedMask.chunk_size
+    bits = [np.packbits(faces_mask(faces[i:i + step])) for i in range(0, faces.shape[0], step)]
+    return PackedMask(np.concatenate(bits) if bits else np.empty(0, dtype=np.uint8), faces.shape[0])
 
 
 def get_border_faces_mask(faces, vertices_mask):
@@ -79,20 +370,19 @@ def get_border_faces_mask(faces, vertices_mask):
     ----------
     faces: (n, d) int
         Mesh faces defined by vertices indexes
-    vertices_mask: (m) bool
+    vertices_mask: (m) bool or PackedMask
         Mask corresponding to a subset of vertices
 
     Returns
     -------
-    border_faces_mask: (n) bool
+    border_faces_mask: (n) bool or PackedMask
         Mask of the faces that cross the border of the vertices mask
+        (packed if vertices_mask is packed)
     """
 
     # Per face, count vertices that are inside the mask
-    inside_vertices_count = vertices_mask[faces].sum(axis=1)
-
-    # Get faces that cross the border (0 < count < vertices per faces)
-    return (0 < inside_vertices_count) & (inside_vertices_count < faces.shape[1])
+    # and get faces that cross the border (0 < count < vertices per faces)
+    return _get_faces_mask(faces, vertices_mask, lambda count: (0 < count) & (count < faces.shape[1]))
 
 
 def get_inside_faces_mask(faces, vertices_mask, border=False):
@@ -105,22 +395,22 @@ def get_inside_faces_mask(faces, vertices_mask, border=False):
     ----------
     faces: (n, d) int
         Mesh faces defined by vertices indexes
-    vertices_mask: (m) bool
+    vertices_mask: (m) bool or PackedMask
         Mask corresponding to a subset of vertices
     border: bool
         True to also includes faces that cross the border
 
     Returns
     -------
-    inside_faces_mask: (n) bool
+    inside_faces_mask: (n) bool or PackedMask
         Mask of the faces that are fully (or partially with border set to True)
-        inside the vertices mask.
+        inside the vertices mask (packed if vertices_mask is packed).
     """
 
     if border:
-        return np.any(vertices_mask[faces], axis=1)
+        return _get_faces_mask(faces, vertices_mask, lambda count: count > 0)
     else:
-        return np.all(vertices_mask[faces], axis=1)
+        return _get_faces_mask(faces, vertices_mask, lambda count: count == faces.shape[1])
 
 
 def get_border_vertices_mask(faces, vertices_mask, border_faces_mask=None, outside=False):
@@ -134,9 +424,9 @@ def get_border_vertices_mask(faces, vertices_mask, border_faces_mask=None, outsi
     ----------
     faces: (n, d) int
         Mesh faces defined by vertices indexes
-    vertices_mask: (m) bool
+    vertices_mask: (m) bool or PackedMask
         Mask corresponding to a subset of vertices
-    border_faces_mask: (n) bool or None
+    border_faces_mask: (n) bool or PackedMask or None
         Precalculated mask of faces that cross the border of the vertices mask
         See `get_border_faces_mask`.
     outside: bool
@@ -144,35 +434,133 @@ def get_border_vertices_mask(faces, vertices_mask, border_faces_mask=None, outsi
 
     Returns
     -------
-    border_vertices_mask: (m) bool
+    border_vertices_mask: (m) bool or PackedMask
         Mask of the vertices that are on the border (inside or outside)
-        of the given vertices subset.
+        of the given vertices subset (packed if vertices_mask is packed).
     """
 
     # Mask of faces that lie on the border
     if border_faces_mask is None:
         border_faces_mask = get_border_faces_mask(faces, vertices_mask)
-    border_faces = faces[border_faces_mask, :]
+    border_faces = faces[_nonzero(border_faces_mask), :]
 
     # From these faces, get the (non-unique) id of their vertices that are inside the input mask
     if outside:
-        border_vertices_id = border_faces[np.logical_not(vertices_mask[border_faces])]
+        border_vertices_id = border_faces[np.logical_not(_gather(vertices_mask, border_faces))]
     else:
-        border_vertices_id = border_faces[vertices_mask[border_faces]]
+        border_vertices_id = border_faces[_gather(vertices_mask, border_faces)]
 
     # Define the corresponding mask
+    if isinstance(vertices_mask, PackedMask):
+        return PackedMask.from_indexes(border_vertices_id, vertices_mask.size)
+
     border_vertices_mask = np.full_like(vertices_mask, False)
     border_vertices_mask[border_vertices_id] = True
 
     return border_vertices_mask
 
 
-def get_boolean_difference(verticesA, verticesB, faces, vertices_mask=None, rtol=1e-5, atol=1e-8):
+def cut_border_faces(faces, vertices_mask, values, threshold, *vertex_arrays, min_ratio=0.01):
+    """
+    Cuts the faces crossing the border of a mask along the iso-line of vertex values
+
+    The border faces (see `get_border_faces_mask`) are triangulated and each
+    edge between a vertex inside the mask and a vertex outside is split where
+    the linear interpolation of the values reaches the threshold (marching
+    triangles). The new vertices are shared by the faces of an edge and are
+    outside the mask, so that the border of the displaced region follows the
+    iso-line instead of the mesh edges.
+
+    The cut faces are appended to the other faces and repeat their last vertex
+    to keep the number of columns (see `triangulate_faces`).
+
+    Parameters
+    ----------
+    faces: (n, d) int
+        Mesh faces defined by vertices indexes
+    vertices_mask: (m) bool
+        Mask corresponding to a subset of vertices (e.g. the values above the
+        threshold, or below it)
+    values: (m) float or int
+        Values of the vertices (e.g. the mean of the vertex color channels,
+        or the gray level of an integer texture)
+    threshold: float
+        Iso-value where the faces are cut
+    vertex_arrays: (m, ...) any
+        Vertex arrays (e.g. vertices, normals, texture coordinates) whose
+        values are linearly interpolated for the new vertices
+    min_ratio: float
+        Minimal distance of the new vertices from the edge ends, relatively
+        to the edge length (avoids thin faces when the iso-line passes close
+        to a vertex)
+
+    Returns
+    -------
+    faces: (k, d) int
+        Faces of the cut mesh
+    vertices_mask: (p) bool
+        Mask of the cut mesh (the new vertices being outside of it)
+    vertex_arrays: (p, ...) any
+        Vertex arrays with the new vertices appended
+    """
+
+    n = vertices_mask.shape[0]
+    border_faces_mask = get_border_faces_mask(faces, vertices_mask)
+    triangles = triangulate_faces(faces[border_faces_mask])
+
+    # Triangles of the border faces that cross the border (some triangles of
+    # a polygon may not), rotated so that their lonely vertex comes first
+    inside_count = np.count_nonzero(vertices_mask[triangles], axis=1)
+    crossing_mask = (0 < inside_count) & (inside_count < 3)
+    kept_triangles = triangles[~crossing_mask]
+    triangles = triangles[crossing_mask]
+    lonely = np.argmax(vertices_mask[triangles] == (inside_count[crossing_mask] == 1)[:, None], axis=1)
+    triangles = np.take_along_axis(triangles, (lonely[:, None] + np.arange(3)) % 3, axis=1)
+    a, b, c = triangles.T
+
+    # One new vertex per crossing edge (a, b) and (a, c)
+    # (keys in int64 since they overflow int32 faces for more than 46341 vertices)
+    edges = np.sort(np.concatenate((np.stack((a, b), axis=1), np.stack((a, c), axis=1))), axis=1)
+    edges = edges.astype(np.int64, copy=False)
+    keys, new_id = np.unique(edges[:, 0] * n + edges[:, 1], return_inverse=True)
+    start, end = np.divmod(keys, n)
+    p, q = np.split(n + new_id.reshape(-1), 2)
+
+    # Ratios in floating point (integer values, e.g. uint8 gray levels, would wrap around)
+    values = np.asarray(values, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = (threshold - values[start]) / (values[end] - values[start])
+    ratio = np.clip(np.nan_to_num(ratio, nan=0.5), min_ratio, 1. - min_ratio)
+
+    # Lonely vertex triangle and the remaining quadrangle split in two triangles
+    cut_triangles = np.concatenate((np.stack((a, p, q), axis=1),
+                                    np.stack((p, b, c), axis=1),
+                                    np.stack((p, c, q), axis=1),
+                                    kept_triangles)).astype(faces.dtype, copy=False)
+    padding = np.repeat(cut_triangles[:, -1:], faces.shape[1] - 3, axis=1)
+    faces = np.concatenate((faces[~border_faces_mask], np.hstack((cut_triangles, padding))))
+
+    vertices_mask = np.concatenate((vertices_mask, np.zeros(keys.size, dtype=bool)))
+
+    def interpolate(array):
+        weight = ratio.reshape(-1, *(1,) * (array.ndim - 1))
+        start_values = array[start].astype(float, copy=False)
+        new_values = start_values + weight * (array[end] - start_values)
+        return np.concatenate((array, new_values.astype(array.dtype, copy=False)))
+
+    return (faces, vertices_mask, *(interpolate(array) for array in vertex_arrays))
+
+
+def get_boolean_difference(verticesA, verticesB, faces, vertices_mask=None, rtol=1e-5, atol=1e-8, return_index=False):
     """
     Boolean difference of a mesh and a displacement of the same mesh.
 
     Optional mask of vertices on which the two meshes differ.
 
+    Polygonal faces (e.g. quadrangles) are kept as is, except those crossing
+    the border of the mask that are split in triangles repeating their last
+    vertex (see `triangulate_faces`).
+
     Parameters
     ----------
     verticesA: (n, d) float
@@ -181,7 +569,7 @@ def get_boolean_difference(verticesA, verticesB, faces, vertices_mask=None, rtol
         Vertices of the second mesh
     faces: (n, d) int
         Faces of both meshes defined by vertices indexes
-    vertices_mask: (n) bool or None
+    vertices_mask: (n) bool or PackedMask or None
         Mask of the vertices for which to calculate the boolean difference.
         If None, the mask is calculated from the vertices that differ between
         the two meshes, using `numpy.isclose`.
@@ -189,49 +577,714 @@ def get_boolean_difference(verticesA, verticesB, faces, vertices_mask=None, rtol
         Relative tolerance when calculating vertices mask (see numpy.isclose)
     atol: float
         Abslute tolerance when calculating vertices mask (see numpy.isclose)
+    return_index: bool
+        If True, also returns the index of each vertex of the resulting mesh
+        in the concatenation of verticesA and verticesB (e.g. to stitch
+        differences calculated on parts of a mesh)
     """
 
-    # TODO: using ids (from nonzero) instead of mask is maybe faster (if needed)
-
     # Difference mask
     if vertices_mask is None:
         vertices_mask = np.logical_not(np.all(np.isclose(verticesA, verticesB, rtol, atol), axis=1))
-    vertices_cnt = vertices_mask.sum()
+    vertices_id = _nonzero(vertices_mask)
+    vertices_cnt = vertices_id.size
 
     # Faces
-    faces_mask = get_inside_faces_mask(faces, vertices_mask, border=True)
-    faces_cnt = faces_mask.sum()
+    faces_id = _nonzero(get_inside_faces_mask(faces, vertices_mask, border=True))
+    if faces.shape[1] > 3:
+        faces = _split_border_faces(faces[faces_id], vertices_mask)
+        faces_id = np.arange(faces.shape[0])
+    faces_cnt = faces_id.size
 
     # Border faces
     border_faces_mask = get_border_faces_mask(faces, vertices_mask)
-    border_faces_cnt = border_faces_mask.sum()
 
     # Outside border vertices
-    outside_border_vertices_mask = get_border_vertices_mask(faces, vertices_mask, border_faces_mask, outside=True)
-    outside_border_vertices_cnt = outside_border_vertices_mask.sum()
+    outside_border_vertices_id = _nonzero(get_border_vertices_mask(faces, vertices_mask, border_faces_mask, outside=True))
+    outside_border_vertices_cnt = outside_border_vertices_id.size
+    del border_faces_mask
 
     # Allocate vertices and faces of the resulting mesh
     diff_vertices = np.empty((outside_border_vertices_cnt + 2*vertices_cnt, verticesA.shape[1]), verticesA.dtype)
     diff_faces = np.empty((2 * faces_cnt, faces.shape[1]), faces.dtype)
 
-    # Initialiazing vertices id map
-    # TODO: reduced length depending on maximum of vertices id
-    vertices_id_map = np.arange(verticesA.shape[0])
+    # Vertices id map (only the entries of the vertices of the selected faces are set and read)
+    id_dtype = np.int32 if diff_vertices.shape[0] <= np.iinfo(np.int32).max else np.int64
+    vertices_id_map = np.empty(verticesA.shape[0], dtype=id_dtype)
 
     # Renumbering vertices of the outside border
-    vertices_id_map[outside_border_vertices_mask] = np.arange(outside_border_vertices_cnt)
-    diff_vertices[:outside_border_vertices_cnt] = verticesA[outside_border_vertices_mask, :]
+    vertices_id_map[outside_border_vertices_id] = np.arange(outside_border_vertices_cnt)
+    diff_vertices[:outside_border_vertices_cnt] = verticesA[outside_border_vertices_id, :]
 
     # Inserting front faces
-    vertices_id_map[vertices_mask] = outside_border_vertices_cnt + np.arange(vertices_cnt)
-    diff_vertices[outside_border_vertices_cnt:(outside_border_vertices_cnt + vertices_cnt)] = verticesA[vertices_mask]
-    diff_faces[:faces_cnt] = vertices_id_map[faces[faces_mask, :]]
+    vertices_id_map[vertices_id] = outside_border_vertices_cnt + np.arange(vertices_cnt)
+    diff_vertices[outside_border_vertices_cnt:(outside_border_vertices_cnt + vertices_cnt)] = verticesA[vertices_id]
+    diff_faces[:faces_cnt] = vertices_id_map[faces[faces_id, :]]
+
+    # Inserting back faces with flipped orientation
+    # (polygonal faces keep their first vertex so that they are triangulated along the same diagonals)
+    vertices_id_map[vertices_id] = outside_border_vertices_cnt + vertices_cnt + np.arange(vertices_cnt)
+    diff_vertices[-vertices_cnt:] = verticesB[vertices_id]
+    flipped = slice(None, None, -1) if faces.shape[1] == 3 else np.r_[0, faces.shape[1] - 1:0:-1]
+    diff_faces[-faces_cnt:] = vertices_id_map[faces[faces_id][:, flipped]]
 
-    # Inserting back faces with flipped triangles
-    vertices_id_map[vertices_mask] = outside_border_vertices_cnt + vertices_cnt + np.arange(vertices_cnt)
-    diff_vertices[-vertices_cnt:] = verticesB[vertices_mask]
-    diff_faces[-faces_cnt:] = vertices_id_map[faces[faces_mask, ::-1]]
+    if return_index:
+        vertices_index = np.concatenate((outside_border_vertices_id, vertices_id, verticesA.shape[0] + vertices_id))
+        return diff_vertices, diff_faces, vertices_index
 
     return diff_vertices, diff_faces
 
 
+def _split_border_faces(faces, vertices_mask):
+    """
+    Splits the polygonal faces crossing the border of a mask in triangles
+
+    Only the triangles touching the mask are kept (e.g. a quadrangle with a
+    single vertex inside the mask may have one triangle fully outside) and
+    they repeat their last vertex to keep the number of columns.
+    """
+
+    inside_faces_mask = get_inside_faces_mask(faces, vertices_mask)
+    triangles = triangulate_faces(faces[_nonzero(~inside_faces_mask)])
+    triangles = triangles[_nonzero(get_inside_faces_mask(triangles, vertices_mask, border=True))]
+    padding = np.repeat(triangles[:, -1:], faces.shape[1] - 3, axis=1)
+
+    return np.concatenate((faces[_nonzero(inside_faces_mask)], np.hstack((triangles, padding))))
+
+
+def estimate_boolean_difference(faces, vertices_mask, dim=3, dtype=np.float64):
+    """
+    Sizes of the boolean difference mesh without calculating it
+
+    Counts the vertices and faces that `get_boolean_difference` allocates
+    and estimates its peak memory usage (outputs and temporary arrays).
+
+    Parameters
+    ----------
+    faces: (n, d) int
+        Faces of both meshes defined by vertices indexes
+    vertices_mask: (m) bool or PackedMask
+        Mask of the vertices for which to calculate the boolean difference
+    dim: int
+        Dimension of the vertices
+    dtype: data-type
+        Datatype of the vertices
+
+    Returns
+    -------
+    estimate: dict
+        Number of vertices (`vertices_cnt`) and faces (`faces_cnt`) of the
+        difference mesh, size of these arrays in bytes (`nbytes`) and peak
+        memory usage in bytes (`peak_nbytes`, excluding the input arrays).
+    """
+
+    vertices_cnt = _count(vertices_mask)
+
+    # Polygonal faces crossing the border are split (see `get_boolean_difference`)
+    split_nbytes = 0
+    if faces.shape[1] > 3:
+        faces = _split_border_faces(faces[_nonzero(get_inside_faces_mask(faces, vertices_mask, border=True))], vertices_mask)
+        split_nbytes = faces.nbytes
+
+    faces_cnt = _count(get_inside_faces_mask(faces, vertices_mask, border=True))
+    outside_border_vertices_cnt = _count(get_border_vertices_mask(faces, vertices_mask, outside=True))
+
+    diff_vertices_cnt = outside_border_vertices_cnt + 2 * vertices_cnt
+    diff_faces_cnt = 2 * faces_cnt
+    nbytes = (diff_vertices_cnt * dim * np.dtype(dtype).itemsize
+              + diff_faces_cnt * faces.shape[1] * faces.dtype.itemsize)
+
+    # Indexes of the masked vertices and faces, vertices id map and renumbered faces
+    index_itemsize = np.dtype(np.intp).itemsize
+    temporary_nbytes = ((vertices_cnt + faces_cnt + outside_border_vertices_cnt + vertices_mask.size) * index_itemsize
+                        + faces_cnt * faces.shape[1] * (faces.dtype.itemsize + index_itemsize)
+                        + split_nbytes)
+
+    return {
+        'vertices_cnt': diff_vertices_cnt,
+        'faces_cnt': diff_faces_cnt,
+        'nbytes': nbytes,
+        'peak_nbytes': nbytes + temporary_nbytes,
+    }
+
+
+def get_vertices_components(faces, vertices_mask=None, num_vertices=None):
+    """
+    Labels the connected components of the vertices of a mask
+
+    Two vertices of the mask are connected if they share an edge of the mesh.
+    Uses a vectorized union-find (hooking and pointer jumping).
+
+    Parameters
+    ----------
+    faces: (n, d) int
+        Mesh faces defined by vertices indexes
+    vertices_mask: (m) bool or PackedMask or None
+        Mask corresponding to a subset of vertices (all vertices if None)
+    num_vertices: int or None
+        Number of vertices if vertices_mask is None (deduced from faces otherwise)
+
+    Returns
+    -------
+    labels: (m) int
+        Component id of each vertex (from 0 to the number of components - 1),
+        -1 for vertices outside the mask.
+    """
+
+    if vertices_mask is None:
+        if num_vertices is None:
+            num_vertices = faces.max() + 1
+        vertices_mask = np.full(num_vertices, True)
+
+    # Edges between vertices of the mask
+    edges_a, edges_b = faces.ravel(), np.roll(faces, -1, axis=1).ravel()
+    inside = _gather(vertices_mask, edges_a) & _gather(vertices_mask, edges_b)
+    edges_a, edges_b = edges_a[inside], edges_b[inside]
+
+    # Union-find: hooking roots to the smallest root, then pointer jumping
+    parent = np.arange(vertices_mask.size)
+    while True:
+        parent_a, parent_b = parent[edges_a], parent[edges_b]
+        different = parent_a != parent_b
+        if not np.any(different):
+            break
+
+        edges_a, edges_b = edges_a[different], edges_b[different]
+        parent_a, parent_b = parent_a[different], parent_b[different]
+        np.minimum.at(parent, np.maximum(parent_a, parent_b), np.minimum(parent_a, parent_b))
+
+        while True:
+            grand_parent = parent[parent]
+            if np.array_equal(grand_parent, parent):
+                break
+            parent = grand_parent
+
+    # Renumbering the components
+    vertices_id = _nonzero(vertices_mask)
+    roots, labels = np.unique(parent[vertices_id], return_inverse=True)
+    result = np.full(vertices_mask.size, -1)
+    result[vertices_id] = labels.ravel()
+
+    return result
+
+
+def get_vertices_area(vertices, faces):
+    """
+    Area associated to each vertex (one third of the area of its triangles)
+
+    Polygonal faces are split in triangles like in `triangulate_faces`.
+
+    Parameters
+    ----------
+    vertices: (m, 3) float
+        Mesh vertices
+    faces: (n, d) int
+        Mesh faces defined by vertices indexes
+
+    Returns
+    -------
+    vertices_area: (m) float
+        Area of each vertex
+    """
+
+    vertices_area = np.zeros(vertices.shape[0])
+    for k in range(1, faces.shape[1] - 1):
+        triangles = faces[:, [0, k, k + 1]]
+        a, b, c = (vertices[triangles[:, i]] for i in range(3))
+        triangles_area = 0.5 * np.linalg.norm(np.cross(b - a, c - a), axis=1)
+        vertices_area += np.bincount(triangles.ravel(), weights=np.repeat(triangles_area / 3, 3), minlength=vertices.shape[0])
+
+    return vertices_area
+
+
+def remove_small_components(vertices, faces, vertices_mask, min_area=0., min_count=0, fill=True):
+    """
+    Removes the small islands of a vertices mask
+
+    Connected components of the mask with an area below min_area, or with
+    less than min_count vertices, are removed from the mask. If fill is True,
+    the small holes (components of the complementary mask) are also filled.
+
+    Parameters
+    ----------
+    vertices: (m, 3) float
+        Mesh vertices
+    faces: (n, 3) int
+        Triangulated mesh faces defined by vertices indexes
+    vertices_mask: (m) bool or PackedMask
+        Mask corresponding to a subset of vertices
+    min_area: float
+        Minimal area of a component (see `get_vertices_area`)
+    min_count: int
+        Minimal number of vertices of a component
+    fill: bool
+        True to also fill the small holes of the mask
+
+    Returns
+    -------
+    filtered_mask: (m) bool or PackedMask
+        Mask without its small components (packed if vertices_mask is packed)
+    """
+
+    vertices_area = get_vertices_area(vertices, faces)
+
+    def small_components(mask):
+        labels = get_vertices_components(faces, mask)
+        inside = labels >= 0
+        area = np.bincount(labels[inside], weights=vertices_area[inside], minlength=1)
+        count = np.bincount(labels[inside], minlength=1)
+        small = (area < min_area) | (count < min_count)
+        return _like(mask, inside & small[np.maximum(labels, 0)])
+
+    filtered_mask = vertices_mask & ~small_components(vertices_mask)
+    if fill:
+        filtered_mask = filtered_mask | small_components(~filtered_mask)
+
+    return filtered_mask
+
+
+def split_mesh_components(vertices, faces):
+    """
+    Splits a mesh in its connected components
+
+    Useful e.g. to process or write independently each body of the mesh
+    returned by `get_boolean_difference`.
+
+    Parameters
+    ----------
+    vertices: (m, d) float
+        Mesh vertices
+    faces: (n, d) int
+        Mesh faces defined by vertices indexes
+
+    Returns
+    -------
+    components: list of (vertices, faces)
+        Vertices and faces of each connected component
+    """
+
+    # Component of each used vertex and face
+    used_mask = np.full(vertices.shape[0], False)
+    used_mask[faces] = True
+    vertices_label = get_vertices_components(faces, used_mask)
+    faces_label = vertices_label[faces[:, 0]]
+    num_components = vertices_label.max() + 1
+
+    # Grouping vertices and faces by component, and local renumbering of the vertices
+    vertices_order = np.argsort(vertices_label, kind='stable')[vertices.shape[0] - used_mask.sum():]
+    vertices_cnt = np.bincount(vertices_label[used_mask], minlength=num_components)
+    vertices_start = np.cumsum(vertices_cnt) - vertices_cnt
+    local_id = np.empty(vertices.shape[0], dtype=faces.dtype)
+    local_id[vertices_order] = np.arange(vertices_order.size) - np.repeat(vertices_start, vertices_cnt)
+
+    faces_order = np.argsort(faces_label, kind='stable')
+    faces_cnt = np.bincount(faces_label, minlength=num_components)
+    faces_start = np.cumsum(faces_cnt) - faces_cnt
+
+    return [(vertices[vertices_order[vs:vs + vc]], local_id[faces[faces_order[fs:fs + fc]]])
+            for vs, vc, fs, fc in zip(vertices_start, vertices_cnt, faces_start, faces_cnt)]
+
+
+def dilate_vertices_mask(faces, vertices_mask, iterations=1):
+    """
+    Morphological dilation of a vertices mask on the mesh
+
+    At each iteration, the vertices of the faces that touch the mask are added.
+
+    Parameters
+    ----------
+    faces: (n, d) int
+        Mesh faces defined by vertices indexes
+    vertices_mask: (m) bool or PackedMask
+        Mask corresponding to a subset of vertices
+    iterations: int
+        Number of dilations (in number of edges)
+
+    Returns
+    -------
+    dilated_mask: (m) bool or PackedMask
+        Dilated mask (packed if vertices_mask is packed)
+    """
+
+    dilated_mask = vertices_mask
+    for _ in range(iterations):
+        touching_faces_id = _nonzero(get_inside_faces_mask(faces, dilated_mask, border=True))
+        touching_vertices_id = faces[touching_faces_id].ravel()
+        if isinstance(dilated_mask, PackedMask):
+            dilated_mask = dilated_mask | PackedMask.from_indexes(touching_vertices_id, dilated_mask.size)
+        else:
+            dilated_mask = dilated_mask.copy()
+            dilated_mask[touching_vertices_id] = True
+
+    return dilated_mask
+
+
+def erode_vertices_mask(faces, vertices_mask, iterations=1):
+    """
+    Morphological erosion of a vertices mask on the mesh
+
+    At each iteration, the vertices of the faces that cross the border of
+    the mask are removed.
+
+    Parameters
+    ----------
+    faces: (n, d) int
+        Mesh faces defined by vertices indexes
+    vertices_mask: (m) bool or PackedMask
+        Mask corresponding to a subset of vertices
+    iterations: int
+        Number of erosions (in number of edges)
+
+    Returns
+    -------
+    eroded_mask: (m) bool or PackedMask
+        Eroded mask (packed if vertices_mask is packed)
+    """
+
+    return ~dilate_vertices_mask(faces, ~vertices_mask, iterations)
+
+
+def open_vertices_mask(faces, vertices_mask, iterations=1):
+    """
+    Morphological opening (erosion then dilation) of a vertices mask
+
+    Removes the parts of the mask that are thinner than the given number of edges.
+    See `erode_vertices_mask` for the parameters.
+    """
+
+    return dilate_vertices_mask(faces, erode_vertices_mask(faces, vertices_mask, iterations), iterations)
+
+
+def close_vertices_mask(faces, vertices_mask, iterations=1):
+    """
+    Morphological closing (dilation then erosion) of a vertices mask
+
+    Fills the gaps of the mask that are thinner than the given number of edges.
+    See `dilate_vertices_mask` for the parameters.
+    """
+
+    return erode_vertices_mask(faces, dilate_vertices_mask(faces, vertices_mask, iterations), iterations)
+
+
+def triangulate_faces(faces):
+    """
+    Splits polygonal faces in triangles
+
+    Faces with fewer vertices than the number of columns (e.g. the triangles
+    of a mixed triangles and quadrangles mesh) repeat one of their vertices,
+    like `[a, b, c, c]`. Each face is split in a fan of triangles from its
+    first vertex and the triangles with a repeated vertex are removed.
+
+    Parameters
+    ----------
+    faces: (n, d) int
+        Mesh faces defined by vertices indexes
+
+    Returns
+    -------
+    triangles: (k, 3) int
+        Triangles defined by vertices indexes (the triangles of a face are
+        consecutive and faces order is kept)
+    """
+
+    if faces.shape[1] == 3:
+        return faces
+
+    triangles = np.stack([faces[:, [0, k, k + 1]] for k in range(1, faces.shape[1] - 1)], axis=1).reshape(-1, 3)
+    return triangles[(triangles[:, 0] != triangles[:, 1])
+                     & (triangles[:, 1] != triangles[:, 2])
+                     & (triangles[:, 2] != triangles[:, 0])]
+
+
+def get_edges(faces):
+    """
+    Returns the edges of a mesh
+
+    Parameters
+    ----------
+    faces: (n, d) int
+        Mesh faces defined by vertices indexes
+
+    Returns
+    -------
+    edges: (k, 2) int
+        Unique edges defined by vertices indexes (smallest index first)
+    """
+
+    edges = np.stack((faces.ravel(), np.roll(faces, -1, axis=1).ravel()), axis=1)
+    edges = edges[edges[:, 0] != edges[:, 1]] # Repeated vertices of faces with fewer vertices
+    return np.unique(np.sort(edges, axis=1), axis=0)
+
+
+def validate(vertices, faces, rtol=1e-12, chunk_size=2**20):
+    """
+    Checks that a mesh is a closed, manifold and consistently oriented surface
+
+    Each edge of the faces is encoded as one integer (from its vertices
+    indexes and its direction) so that sorting these codes groups the faces
+    sharing an edge. An edge should be shared by exactly two faces, going
+    through it in opposite directions.
+
+    Parameters
+    ----------
+    vertices: (m, 3) float
+        Mesh vertices
+    faces: (n, d) int
+        Mesh faces defined by vertices indexes
+    rtol: float
+        Faces whose area is below rtol times the squared length of their
+        longest edge are degenerated
+    chunk_size: int
+        Number of faces whose area is calculated at once
+
+    Returns
+    -------
+    report: dict
+        `boundary_edges` ((k, 2) int, edges of only one face),
+        `non_manifold_edges` ((k, 2) int, edges of more than two faces),
+        `inconsistent_edges` ((k, 2) int, edges of two faces with the same
+        direction, i.e. inconsistent winding) and `degenerate_faces`
+        ((k) int, indexes of the faces with less than 3 distinct vertices or
+        with a null area). The mesh is valid if they are all empty.
+    """
+
+    num_vertices = vertices.shape[0]
+    num_faces, d = faces.shape
+
+    # Edges codes: (smallest index * number of vertices + largest index) * 2 + direction
+    # Repeated vertices (faces with fewer vertices) are skipped
+    codes = np.empty(num_faces * d, dtype=np.int64)
+    for k in range(d):
+        a, b = faces[:, k].astype(np.int64, copy=False), faces[:, (k + 1) % d].astype(np.int64, copy=False)
+        code = codes[k * num_faces:(k + 1) * num_faces]
+        np.multiply(np.minimum(a, b), num_vertices, out=code)
+        code += np.maximum(a, b)
+        code *= 2
+        code += a > b
+        code[a == b] = -1
+    del a, b, code
+    codes.sort()
+    codes = codes[np.searchsorted(codes, 0):]
+
+    # Number of faces and sum of the directions for each edge
+    starts = np.flatnonzero(np.diff(codes >> 1, prepend=-1))
+    counts = np.diff(starts, append=codes.size)
+    directions = np.add.reduceat(codes & 1, starts) if starts.size > 0 else starts
+    edges = codes[starts] >> 1
+    del codes
+
+    def decode(mask):
+        return np.stack(np.divmod(edges[mask], num_vertices), axis=1)
+
+    # Degenerated faces, by chunks
+    degenerate_faces = []
+    for i in range(0, num_faces, chunk_size):
+        chunk = faces[i:i + chunk_size]
+        corners = [vertices[chunk[:, k]] for k in range(d)]
+        distinct = np.zeros(chunk.shape[0], dtype=np.int64)
+        longest = np.zeros(chunk.shape[0])
+        for k in range(d):
+            distinct += chunk[:, k] != chunk[:, (k + 1) % d]
+            edge = corners[(k + 1) % d] - corners[k]
+            np.maximum(longest, np.einsum('ij,ij->i', edge, edge), out=longest)
+
+        # Vector area (sum of the cross products of a fan of triangles)
+        area = sum(np.cross(corners[k] - corners[0], corners[k + 1] - corners[0]) for k in range(1, d - 1))
+        area = 0.5 * np.sqrt(np.einsum('ij,ij->i', area, area))
+
+        degenerate_faces.append(i + np.flatnonzero((distinct < 3) | (area <= rtol * longest)))
+
+    return {
+        'boundary_edges': decode(counts == 1),
+        'non_manifold_edges': decode(counts > 2),
+        'inconsistent_edges': decode((counts == 2) & (directions != 1)),
+        'degenerate_faces': np.concatenate(degenerate_faces) if degenerate_faces else np.empty(0, dtype=np.int64),
+    }
+
+
+def smooth_vertices_values(faces, values, iterations=1, weight=0.5, edges=None):
+    """
+    Laplacian smoothing of values defined per vertex
+
+    At each iteration, each value is moved toward the mean of its neighbors:
+    `values += weight * (neighbors_mean - values)`.
+
+    Smoothing a float mask (e.g. `mask.astype(float)`) and thresholding it
+    at 0.5 gives a cleaned mask, like a Gaussian blur of the texture.
+
+    Parameters
+    ----------
+    faces: (n, d) int
+        Mesh faces defined by vertices indexes
+    values: (m,) float
+        Values of each vertex (with optional trailing channels axes)
+    iterations: int
+        Number of smoothing steps (see `get_smoothing_iterations`)
+    weight: float
+        Weight of the neighbors mean at each step, between 0 and 1
+    edges: (k, 2) int or None
+        Mesh edges if already calculated (see `get_edges`)
+
+    Returns
+    -------
+    smoothed_values: (m,) float
+        Smoothed values
+    """
+
+    if edges is None:
+        edges = get_edges(faces)
+
+    num_vertices = values.shape[0]
+    smoothed_values = values.reshape(num_vertices, -1).astype(float)
+
+    source = np.concatenate((edges[:, 0], edges[:, 1]))
+    target = np.concatenate((edges[:, 1], edges[:, 0]))
+    degree = np.maximum(1, np.bincount(source, minlength=num_vertices))
+
+    for _ in range(iterations):
+        neighbors_mean = np.stack([np.bincount(source, weights=smoothed_values[target, k], minlength=num_vertices)
+                                   for k in range(smoothed_values.shape[1])], axis=1) / degree[:, None]
+        smoothed_values += weight * (neighbors_mean - smoothed_values)
+
+    return smoothed_values.reshape(values.shape)
+
+
+def get_smoothing_iterations(coords, faces, sigma, weight=0.5):
+    """
+    Number of Laplacian smoothing steps approximating a Gaussian blur
+
+    Each step of `smooth_vertices_values` spreads the values like a Gaussian
+    kernel with a variance (per axis) of weight times half the mean squared
+    length of the edges. Gaussian blur of a texture can be approximated by
+    giving the vertices position in pixels (e.g. `tcoords * texture.shape[:2]`).
+
+    Parameters
+    ----------
+    coords: (m, d) float
+        Position of each vertex in the unit of sigma
+    faces: (n, d) int
+        Mesh faces defined by vertices indexes
+    sigma: float
+        Standard deviation of the Gaussian kernel
+    weight: float
+        Weight used for the smoothing
+
+    Returns
+    -------
+    iterations: int
+        Number of smoothing steps (0 when sigma is small compared to the edges)
+    """
+
+    edges = get_edges(faces)
+    edges_sqr_length = np.sum(np.square(coords[edges[:, 1]] - coords[edges[:, 0]]), axis=1)
+
+    # Ignoring the outliers like the edges crossing a texture seam
+    edges_sqr_length = edges_sqr_length[edges_sqr_length <= 16 * np.median(edges_sqr_length)]
+
+    return int(round(2 * sigma**2 / (weight * np.mean(edges_sqr_length))))
+
+
+def get_space_filling_codes(points, curve='hilbert', bits=10):
+    """
+    Position of points along a space-filling curve
+
+    Points are quantized on a regular grid of 2**bits cells per axis over
+    their bounding box. Sorting the points by their code groups together the
+    points that are close in space.
+
+    Parameters
+    ----------
+    points: (n, d) float
+        Points coordinates
+    curve: str
+        'morton' (Z-order) or 'hilbert' (better locality, slightly slower)
+    bits: int
+        Number of bits per axis (d * bits must not exceed 64)
+
+    Returns
+    -------
+    codes: (n) uint64
+        Index of the cell of each point along the curve
+    """
+
+    assert curve in ('morton', 'hilbert'), "Unknown space-filling curve!"
+    dim = points.shape[1]
+    assert dim * bits <= 64, "Too many bits for the dimension!"
+
+    # Quantization
+    lower, upper = np.amin(points, axis=0), np.amax(points, axis=0)
+    scale = (2**bits - 1) / np.where(upper > lower, upper - lower, 1)
+    axes = [np.round((points[:, i] - lower[i]) * scale[i]).astype(np.uint64) for i in range(dim)]
+
+    # Hilbert transposed coordinates (J. Skilling, "Programming the Hilbert curve", 2004)
+    if curve == 'hilbert':
+        # Inverse undo
+        q = 1 << (bits - 1)
+        while q > 1:
+            p = np.uint64(q - 1)
+            for i in range(dim):
+                inverted = (axes[i] & np.uint64(q)) != 0
+                t = np.where(inverted, np.uint64(0), (axes[0] ^ axes[i]) & p)
+                axes[0] = np.where(inverted, axes[0] ^ p, axes[0] ^ t)
+                if i > 0:
+                    axes[i] = axes[i] ^ t
+            q >>= 1
+
+        # Gray encoding
+        for i in range(1, dim):
+            axes[i] = axes[i] ^ axes[i - 1]
+        t = np.zeros_like(axes[0])
+        q = 1 << (bits - 1)
+        while q > 1:
+            t = np.where((axes[-1] & np.uint64(q)) != 0, t ^ np.uint64(q - 1), t)
+            q >>= 1
+        axes = [a ^ t for a in axes]
+
+    # Interleaving the bits (first axis is the most significant)
+    codes = np.zeros(points.shape[0], dtype=np.uint64)
+    for k in range(bits):
+        for i in range(dim):
+            codes |= ((axes[i] >> np.uint64(k)) & np.uint64(1)) << np.uint64(k * dim + dim - 1 - i)
+
+    return codes
+
+
+def reorder_mesh(vertices, faces, curve='hilbert', bits=10):
+    """
+    Reorders vertices and faces for memory locality
+
+    Vertices are sorted along a space-filling curve (see
+    `get_space_filling_codes`) and faces by their smallest vertex index in
+    this order (the vertices of each face keep their order) so that the
+    gathers like `vertices_mask[faces]` access close memory locations.
+
+    Parameters
+    ----------
+    vertices: (m, d) float
+        Mesh vertices
+    faces: (n, d) int
+        Mesh faces defined by vertices indexes
+    curve: str
+        'morton' or 'hilbert'
+    bits: int
+        Number of bits per axis of the curve
+
+    Returns
+    -------
+    reordered_faces: (n, d) int
+        Reordered faces referring to the reordered vertices
+    vertices_order: (m) int
+        Permutation of the vertices so that e.g. `vertices[vertices_order]`
+        and `normals[vertices_order]` are the reordered vertex attributes
+    faces_order: (n) int
+        Permutation of the faces (for the faces attributes)
+    """
+
+    vertices_order = np.argsort(get_space_filling_codes(vertices, curve, bits), kind='stable')
+    vertices_rank = np.empty(vertices_order.size, dtype=faces.dtype)
+    vertices_rank[vertices_order] = np.arange(vertices_order.size)
+
+    reordered_faces = vertices_rank[faces]
+    faces_order = np.argsort(np.amin(reordered_faces, axis=1), kind='stable')
+
+    return reordered_faces[faces_order], vertices_order, faces_order
@@ -1,6 +1,17 @@
 from .shapes import create_sphere, create_torus
-from .mesh_interfaces import MeshIOInterface, PyMeshInterface, TriMeshInterface
-from .bicolor_sphere import create_bicolor_sphere
-from .tricolor_earth import create_tricolor_earth
-from .bicolor_mesh import create_bicolor_mesh
-from .topo_bathy_earth import create_topo_bathy_earth
+from .mesh_interfaces import MeshIOInterface, PyMeshInterface, TriMeshInterface, MeshCache, BackgroundWriter, reorder_mesh
+from .backends import AutoInterface, get_mesh_interface, register_interface
+from .mesh_3mf import write_3mf
+from .decimation import decimate
+from .decomposition import partition_mesh, get_bicolor_tiles
+from .planner import Plan, MemoryBudget
+from .validation import iter_validated
+from .preview import render_views, iter_previewed
+from .image_reader import read_image, read_texture
+from .texture_sampler import TextureSampler
+from .texture_expressions import TextureExpression, LazyTexture
+from .bicolor_sphere import create_bicolor_sphere, iter_bicolor_sphere
+from .tricolor_earth import create_tricolor_earth, iter_tricolor_earth
+from .bicolor_mesh import create_bicolor_mesh, iter_bicolor_mesh
+from .topo_bathy_earth import create_topo_bathy_earth, iter_topo_bathy_earth
+from .server import JobRunner, create_server
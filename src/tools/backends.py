@@ -0,0 +1,252 @@
+import os
+import threading
+
+from .mesh_interfaces import MeshIOInterface, PyMeshInterface, TriMeshInterface
+
+# Registered mesh interfaces (by order of preference): name -> (interface class, required module)
+interfaces = {
+    'trimesh': (TriMeshInterface, 'trimesh'),
+    'meshio': (MeshIOInterface, 'meshio'),
+    'pymesh': (PyMeshInterface, 'pymesh'),
+}
+
+
+def register_interface(name, interface_class, module=None):
+    """
+    Registers a mesh interface so that it can be selected
+
+    Parameters
+    ----------
+    name: str
+        Backend name (e.g. for the `--backend` option of the scripts)
+    interface_class: type
+        Interface class with `read(mesh_file)` and/or `write(mesh_file, vertices, faces)`
+        methods (and optionally `clean`, see `TriMeshInterface`, and
+        `writes_polygons(extension)` if the polygonal faces are not
+        triangulated when writing, see `MeshIOInterface`)
+    module: str or None
+        Module required by the interface (None if always available)
+    """
+    interfaces[name] = (interface_class, module)
+
+
+def get_available_interfaces():
+    """ Names of the registered interfaces whose required module is installed (without importing it) """
+    import importlib.util
+
+    return [name for name, (_, module) in interfaces.items()
+            if module is None or importlib.util.find_spec(module) is not None]
+
+
+def _get_version(module):
+    """ Installed version of a module """
+    import importlib.metadata
+
+    try:
+        return importlib.metadata.version(module)
+    except importlib.metadata.PackageNotFoundError:
+        return 'unknown'
+
+
+def _writes_polygons(name, extension):
+    """ True if an interface writes the polygonal faces as such to a file format (triangulated otherwise) """
+    interface_class = interfaces[name][0]
+    return hasattr(interface_class, 'writes_polygons') and interface_class.writes_polygons(extension)
+
+
+def benchmark_interface(name, extension, operation, size=(200, 100), repeat=3):
+    """
+    Measures the time to read or write a sphere mesh with a given interface
+
+    Parameters
+    ----------
+    name: str
+        Name of a registered interface
+    extension: str
+        File format extension (e.g. '.stl')
+    operation: str
+        'read' or 'write'
+    size: (int, int)
+        Discretization of the sphere (see `meshdd.tools.create_sphere`)
+    repeat: int
+        Number of measures (the best one is returned)
+
+    Returns
+    -------
+    duration: float or None
+        Best duration in seconds, None if the interface can't do the operation for this format
+    """
+
+    import tempfile
+    import time
+    from .shapes import create_sphere
+
+    assert operation in ('read', 'write'), "Unknown operation!"
+
+    interface = interfaces[name][0]()
+    vertices, faces, _, _ = create_sphere(*size)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_name = os.path.join(tmp_dir, 'benchmark' + extension)
+
+        # Sample file to read, written by any available interface
+        if operation == 'read':
+            for writer_name in get_available_interfaces():
+                try:
+                    interfaces[writer_name][0]().write(file_name, vertices, faces)
+                    break
+                except Exception:
+                    continue
+            else:
+                return None
+
+        durations = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            try:
+                if operation == 'read':
+                    interface.read(file_name)
+                else:
+                    interface.write(file_name, vertices, faces)
+            except Exception:
+                return None # e.g. missing module or unsupported format
+            durations.append(time.perf_counter() - start)
+
+    return min(durations)
+
+
+class AutoInterface:
+    """
+    Mesh reader/writer interface dispatching to the fastest installed backend
+
+    For each file format, the installed interfaces (see
+    `get_available_interfaces`) are benchmarked once when writing (see
+    `benchmark_interface`) and the fastest one that succeeds is used, among
+    the interfaces that write the same faces as the first one by order of
+    preference (polygons kept or triangulated). The backends don't return
+    the same arrays when reading (e.g. normals computed or not), so meshes
+    are always read by the first interface that succeeds. Measures are
+    cached in a JSON file along with the versions of the backends, NumPy and
+    meshdd, and are discarded when any of them changes. Cleaning uses the
+    first installed interface that supports it. The interface can be shared
+    between threads.
+
+    Parameters
+    ----------
+    cache_file: str or None
+        Benchmark cache file (defaults to `backends.json` in `$XDG_CACHE_HOME/meshdd` or `~/.cache/meshdd`),
+        empty string to disable the cache
+    candidates: list of str or None
+        Names of the interfaces to choose from, by order of preference (installed interfaces if None)
+    """
+
+    def __init__(self, cache_file=None, candidates=None):
+        if cache_file is None:
+            cache_file = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+                                      'meshdd', 'backends.json')
+
+        self.cache_file = cache_file
+        self.candidates = candidates if candidates is not None else get_available_interfaces()
+        self._selected = {}
+        self._lock = threading.Lock()
+
+    def _get_versions(self):
+        """ Installed versions of the modules that the measures depend on """
+        modules = {interfaces[name][1] for name in self.candidates if interfaces[name][1] is not None}
+        return {module: _get_version(module) for module in sorted(modules | {'numpy', 'meshdd'})}
+
+    def _load_measures(self, versions):
+        import json
+
+        try:
+            with open(self.cache_file) as file:
+                cache = json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+        # Measures of other versions are discarded
+        if not isinstance(cache, dict) or cache.get('versions') != versions:
+            return {}
+        return cache.get('measures', {})
+
+    def _store_measures(self, versions, measures):
+        import json
+        import tempfile
+
+        # Written atomically since other processes may read it concurrently
+        try:
+            os.makedirs(os.path.dirname(self.cache_file) or '.', exist_ok=True)
+            fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(self.cache_file) or '.', prefix='.tmp')
+            with os.fdopen(fd, 'w') as file:
+                json.dump({'versions': versions, 'measures': measures}, file, indent=1)
+            os.replace(tmp_file, self.cache_file)
+        except OSError:
+            pass # The cache is optional
+
+    def select(self, extension, operation):
+        """
+        Name of the interface used for a file format and an operation
+
+        The first interface that can read the format, or the fastest one
+        that writes the same faces as the first one that can write it.
+
+        Parameters
+        ----------
+        extension: str
+            File format extension (e.g. '.stl')
+        operation: str
+            'read' or 'write'
+        """
+
+        extension = extension.lower()
+        with self._lock:
+            if (extension, operation) in self._selected:
+                return self._selected[extension, operation]
+
+            versions = self._get_versions()
+            measures = self._load_measures(versions) if self.cache_file else {}
+            durations = {}
+            for name in self.candidates:
+                # Interfaces with the same output as the first one that succeeds
+                if durations and (operation == 'read'
+                                  or _writes_polygons(name, extension) != _writes_polygons(next(iter(durations)), extension)):
+                    continue
+
+                key = f"{name}:{extension}:{operation}"
+                if key not in measures:
+                    measures[key] = benchmark_interface(name, extension, operation)
+                if measures[key] is not None:
+                    durations[name] = measures[key]
+
+            if self.cache_file:
+                self._store_measures(versions, measures)
+
+            assert len(durations) > 0, f"No installed mesh backend can {operation} {extension} files!"
+            self._selected[extension, operation] = min(durations, key=durations.get)
+            return self._selected[extension, operation]
+
+    def _get_interface(self, mesh_file, operation):
+        return interfaces[self.select(os.path.splitext(mesh_file)[1], operation)][0]()
+
+    def read(self, mesh_file):
+        return self._get_interface(mesh_file, 'read').read(mesh_file)
+
+    def clean(self, *args, **kwargs):
+        names = [name for name in self.candidates if hasattr(interfaces[name][0], 'clean')]
+        assert len(names) > 0, "No installed mesh backend can clean meshes!"
+        return interfaces[names[0]][0]().clean(*args, **kwargs)
+
+    def write(self, mesh_file, vertices, faces):
+        self._get_interface(mesh_file, 'write').write(mesh_file, vertices, faces)
+
+
+def get_mesh_interface(backend='auto'):
+    """
+    Mesh interface from a backend name ('auto' for `AutoInterface`, else a registered interface name)
+    """
+
+    if backend == 'auto':
+        return AutoInterface()
+
+    assert backend in interfaces, f"Unknown mesh backend {backend}!"
+    return interfaces[backend][0]()
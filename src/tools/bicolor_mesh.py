@@ -3,57 +3,207 @@
 import numpy as np
 
 import meshdd
+from meshdd.tools.image_reader import read_texture
+from meshdd.tools.mesh_3mf import write_3mf
+from meshdd.tools.decimation import decimate
+from meshdd.tools.decomposition import get_bicolor_tiles
 
 # Default values for the parameters
 defaults = {
     'threshold': 128,
     'scale': 50,
     'depth': 0.5,
+    'cache_size': 8192,
 }
 
-def create_bicolor_mesh(vertices, faces, normals, tcoords, texture,
-                        threshold=defaults['threshold'],
-                        depth=defaults['depth'],
-                        reverse=False,
-                        verbose=False):
-    """ Split a mesh in two parts based on a given texture. """
+# Colors of each part when exporting to 3MF
+colors = {
+    'displaced': '#E0E0E0',
+    'difference': '#C83232',
+}
+
+def iter_bicolor_mesh(vertices, faces, normals, tcoords, texture,
+                      threshold=defaults['threshold'],
+                      depth=defaults['depth'],
+                      reverse=False,
+                      min_area=None,
+                      decimation=None,
+                      oversampling=None,
+                      cut_border=False,
+                      tiles=None,
+                      partition='uv',
+                      processes=None,
+                      plan=None,
+                      memory_budget=None,
+                      verbose=False):
+    """
+    Split a mesh in two parts based on a given texture.
+
+    Yields each part as (name, vertices, faces) as soon as it is calculated.
+
+    Set min_area to remove the islands and holes of the displacement mask
+    smaller than this area, see `meshdd.remove_small_components`.
+
+    Set decimation to the maximal geometric error to simplify the uniform
+    regions of the mesh, see `meshdd.tools.decimation.decimate`.
+
+    Set oversampling to read the texture image at a reduced scale (JPEG or
+    pyramidal TIFF) keeping this number of pixels per mesh edge, see
+    `meshdd.get_texture_resolution` and `meshdd.tools.read_texture`.
+
+    Set cut_border to True to cut the faces along the threshold iso-line of
+    the texture, so that the border of the carved region is smooth instead
+    of following the mesh edges, see `meshdd.cut_border_faces`.
+
+    Set tiles to a number of tiles to calculate the displacement and the
+    difference by tiles in `processes` processes, partitioned as given by
+    partition, see `meshdd.tools.decomposition.get_bicolor_tiles` (not
+    compatible with min_area, cut_border and decimation that need the whole
+    mesh).
+
+    Set plan to a `meshdd.tools.Plan` to predict the size of the parts
+    instead of calculating them (dry run, nothing is yielded). The sizes are
+    upper bounds when decimating.
+
+    Set memory_budget to a `meshdd.tools.MemoryBudget` to decode the
+    texture at a reduced scale if it doesn't fit, displace the vertices by
+    chunks, check before the displacement and the difference that their
+    predicted memory fits (see `meshdd.tools.MemoryBudget.reserve`) and check
+    the memory used by each stage. With tiles, the number of tiles is
+    increased so that the tiles being processed fit in the remaining budget
+    (see `meshdd.tools.decomposition.get_bicolor_tiles`).
+    """
 
     # Verbose messages
     def info(*args, **kwargs):
         if verbose:
             print(*args, **kwargs)
 
+    # Memory used by each stage, and predicted memory checked before the large ones
+    def check(stage):
+        if memory_budget is not None:
+            memory_budget.check(stage)
+
+    def reserve(stage, nbytes):
+        if memory_budget is not None:
+            memory_budget.reserve(stage, nbytes)
+
     # Reading texture image if needed
     if type(texture) is str:
         info("Reading texture...", end='', flush=True)
-        import imageio
-        texture = meshdd.get_texture_from_image(imageio.imread(texture))
+        min_shape = None if oversampling is None else meshdd.get_texture_resolution(tcoords, faces, oversampling)
+        max_nbytes = None if memory_budget is None else memory_budget.get_available(0.25)
+        texture = read_texture(texture, min_shape=min_shape, max_nbytes=max_nbytes)
         info("Done.")
+        check("texture")
+
+    # Domain decomposition: both parts calculated by tiles in separate processes
+    if tiles is not None and plan is None:
+        assert min_area is None and not cut_border and decimation is None, "Small components removal, border cutting and decimation need the whole mesh!"
+        info("Displacing mesh and difference mesh by tiles... ", end='', flush=True)
+        max_nbytes = None
+        if memory_budget is not None:
+            # Displaced vertices and stitched difference (at most three times the vertices and twice the faces)
+            results_nbytes = 4 * vertices.nbytes + 4 * faces.nbytes
+            reserve("tiles", results_nbytes)
+            max_nbytes = memory_budget.get_available() - results_nbytes
+        _, displaced_vertices, diff_vertices, diff_faces = get_bicolor_tiles(
+            vertices, faces, normals, tcoords, texture, threshold, depth, reverse,
+            tiles_cnt=tiles, partition=partition, processes=processes, max_nbytes=max_nbytes)
+        info("Done.")
+        check("tiles")
+
+        yield "displaced", displaced_vertices, faces
+        yield "difference", diff_vertices, diff_faces
+        return
 
     # Displacing mesh
     info("Displacing mesh... ", end='', flush=True)
     vertex_color = meshdd.get_vertex_color_from_texture(tcoords, texture)
-    if vertex_color.ndim > 1:
-        vertex_color = np.mean(vertex_color, axis=1)
 
-    displace_mask = vertex_color >= threshold
+    # Thresholding the channels mean (lookup table for integer textures)
+    displace_mask = meshdd.map_vertex_color(vertex_color, lambda value: value >= threshold)
     if reverse:
         displace_mask = np.logical_not(displace_mask)
+    if min_area is not None:
+        displace_mask = meshdd.remove_small_components(vertices, faces, displace_mask, min_area)
+
+    # Cutting the border faces along the iso-line of the channels mean
+    if cut_border:
+        values = vertex_color.mean(axis=1) if vertex_color.ndim > 1 else vertex_color
+        faces, displace_mask, vertices, normals, tcoords = meshdd.cut_border_faces(
+            faces, displace_mask, values, threshold, vertices, normals, tcoords)
+
+    # Dry run: predicting the parts instead of calculating them
+    if plan is not None:
+        info("Skipped (dry run).")
+        plan.add_stage("mesh", vertices, faces, normals, tcoords)
+        plan.add_stage("texture", texture)
+        plan.add_stage("displacement mask", displace_mask, temporary=(vertex_color,))
+        plan.add_part("displaced", vertices.shape[0], faces.shape[0], vertices.nbytes, 2 * vertices.nbytes)
+        plan.add_part("difference", **meshdd.estimate_boolean_difference(faces, displace_mask, vertices.shape[1], vertices.dtype))
+        return
 
-    displaced_vertices = meshdd.displace_vertices(vertices, normals, -depth, displace_mask)
+    reserve("displacement", vertices.nbytes)
+    chunk_size = None if memory_budget is None else memory_budget.get_chunk_size(2 * vertices[0].nbytes)
+    displaced_vertices = meshdd.displace_vertices(vertices, normals, -depth, displace_mask, chunk_size=chunk_size)
     info("Done.")
+    check("displacement")
+
+    # Decimating the uniform regions (the borders of the displacement mask are kept unchanged)
+    if decimation is not None:
+        info("Decimating mesh... ", end='', flush=True)
+        border_faces_mask = meshdd.get_border_faces_mask(faces, displace_mask)
+        locked_mask = np.logical_or(
+            meshdd.get_border_vertices_mask(faces, displace_mask, border_faces_mask),
+            meshdd.get_border_vertices_mask(faces, displace_mask, border_faces_mask, outside=True))
+        num_faces = faces.shape[0]
+        faces, vertices_id = decimate((vertices, displaced_vertices), faces, locked_mask, max_error=decimation)
+        vertices, displaced_vertices, displace_mask = vertices[vertices_id], displaced_vertices[vertices_id], displace_mask[vertices_id]
+        info(f"Done ({faces.shape[0] - num_faces} faces).")
+        check("decimation")
+
+    yield "displaced", displaced_vertices, faces
 
     # Difference mesh
     info("Difference mesh... ", end='', flush=True)
+    if memory_budget is not None:
+        reserve("difference", meshdd.estimate_boolean_difference(faces, displace_mask, vertices.shape[1], vertices.dtype)['peak_nbytes'])
     diff_vertices, diff_faces = meshdd.get_boolean_difference(vertices, displaced_vertices, faces, displace_mask)
     info("Done.")
+    check("difference")
+
+    yield "difference", diff_vertices, diff_faces
+
+
+def create_bicolor_mesh(vertices, faces, normals, tcoords, texture,
+                        threshold=defaults['threshold'],
+                        depth=defaults['depth'],
+                        reverse=False,
+                        min_area=None,
+                        decimation=None,
+                        oversampling=None,
+                        cut_border=False,
+                        tiles=None,
+                        partition='uv',
+                        processes=None,
+                        memory_budget=None,
+                        verbose=False):
+    """ Split a mesh in two parts based on a given texture. """
 
-    return displaced_vertices, faces, diff_vertices, diff_faces
+    parts = {name: (vertices, faces) for name, vertices, faces in iter_bicolor_mesh(
+        vertices, faces, normals, tcoords, texture, threshold, depth, reverse, min_area, decimation,
+        oversampling=oversampling, cut_border=cut_border, tiles=tiles, partition=partition, processes=processes,
+        memory_budget=memory_budget, verbose=verbose)}
+
+    return (*parts['displaced'], *parts['difference'])
 
 
 def main():
     import argparse
+    import contextlib
     import os
+    import sys
 
     # Command-line parameters
     parser = argparse.ArgumentParser(
@@ -76,32 +226,84 @@ def main():
                         help="Clean the mesh before processing")
     parser.add_argument("--depth", type=float, default=defaults['depth'],
                         help="Displacement depth")
+    parser.add_argument("--reorder", type=str, choices=['morton', 'hilbert'], default=None,
+                        help="Reorder the mesh along a space-filling curve for memory locality (faster on scanned meshes)")
+    parser.add_argument("--no_cache", action="store_true",
+                        help="Always read (and clean) the mesh instead of using the binary mesh cache")
+    parser.add_argument("--cache_dir", type=str, default='',
+                        help="Directory of the binary mesh cache (default to ~/.cache/meshdd)")
+    parser.add_argument("--cache_size", type=float, default=defaults['cache_size'],
+                        help="Maximal size of the binary mesh cache (in MB)")
+    parser.add_argument("--min_area", type=float, default=None,
+                        help="Remove the islands and holes of the carved region smaller than this area")
+    parser.add_argument("--decimate", type=float, default=None,
+                        help="Simplify the uniform regions of the mesh with this maximal geometric error")
+    parser.add_argument("--oversampling", type=float, default=None,
+                        help="Read the texture at a reduced scale (JPEG or pyramidal TIFF) keeping this number of pixels per mesh edge")
+    parser.add_argument("--cut_border", action="store_true",
+                        help="Cut the faces along the threshold iso-line for a smooth border of the carved region")
+    parser.add_argument("--tiles", type=int, default=None,
+                        help="Calculate the parts by this number of tiles in separate processes")
+    parser.add_argument("--partition", choices=('uv', 'space', 'index'), default='uv',
+                        help="Tiles along a space-filling curve of the texture coordinates (uv) or vertices (space), or ranges of faces (index)")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="Number of processes calculating the tiles (number of CPUs by default)")
+    parser.add_argument("--writers", type=int, default=1,
+                        help="Number of parts written concurrently")
+    parser.add_argument("--dry_run", action="store_true",
+                        help="Only predict the size of the parts and the peak memory")
+    parser.add_argument("--validate", action="store_true",
+                        help="Check that the parts are closed and manifold before writing them")
+    parser.add_argument("--preview", type=str, default=None,
+                        help="Render the parts from a few viewpoints in this image (e.g. preview.png)")
+    parser.add_argument("--max_memory", "--max-memory", type=meshdd.tools.planner.parse_size, default=None,
+                        help="Memory budget (e.g. 8G) that the textures and chunks are fitted to, checked at each stage")
+    parser.add_argument("--backend", type=str, default='auto',
+                        choices=['auto'] + list(meshdd.tools.backends.interfaces),
+                        help="Mesh library used to read and write the meshes (auto: fastest installed one, measured once)")
     parser.add_argument("--output", type=str, default="mesh.stl",
-                        help="Output file name")
+                        help="Output file name (all parts in one file for the 3MF format)")
     options = parser.parse_args()
 
     # Mesh interface
-    #mesh_interface = meshdd.tools.MeshIOInterface()
-    #mesh_interface = meshdd.tools.PyMeshInterface()
-    mesh_interface = meshdd.tools.TriMeshInterface()
-
-    # Reading mesh
-    print("Reading mesh... ", end='', flush=True)
-    vertices, faces, normals, tcoords = mesh_interface.read(options.mesh[0])
-    print("Done.")
-
-    # Optional mesh for the normals
-    if options.normals:
-        print("Reading mesh for the normals... ", end='', flush=True)
-        _, _, normals, _ = mesh_interface.read(options.normals)
+    mesh_interface = meshdd.tools.get_mesh_interface(options.backend)
+
+    if not options.no_cache:
+        # Reading (and cleaning) mesh through the binary cache
+        print("Reading mesh (cached)... ", end='', flush=True)
+        mesh_cache = meshdd.tools.MeshCache(mesh_interface,
+                                            cache_dir=options.cache_dir or None,
+                                            max_size=int(options.cache_size * 2**20))
+        vertices, faces, normals, tcoords = mesh_cache.read(options.mesh[0],
+                                                            normals_file=options.normals or None,
+                                                            clean=options.clean,
+                                                            reorder=options.reorder)
+        print("Done.")
+
+    else:
+        # Reading mesh
+        print("Reading mesh... ", end='', flush=True)
+        vertices, faces, normals, tcoords = mesh_interface.read(options.mesh[0])
         print("Done.")
 
-    # Cleaning mesh
-    if options.clean:
-        print("Cleaning mesh... ", end='', flush=True)
-        num_vertices, num_faces = vertices.shape[0], faces.shape[0]
-        vertices, faces, normals, tcoords = mesh_interface.clean(vertices, faces, normals, tcoords)
-        print(f"Done ({vertices.shape[0] - num_vertices} vertices & {faces.shape[0] - num_faces} faces).")
+        # Optional mesh for the normals
+        if options.normals:
+            print("Reading mesh for the normals... ", end='', flush=True)
+            _, _, normals, _ = mesh_interface.read(options.normals)
+            print("Done.")
+
+        # Cleaning mesh
+        if options.clean:
+            print("Cleaning mesh... ", end='', flush=True)
+            num_vertices, num_faces = vertices.shape[0], faces.shape[0]
+            vertices, faces, normals, tcoords = mesh_interface.clean(vertices, faces, normals, tcoords)
+            print(f"Done ({vertices.shape[0] - num_vertices} vertices & {faces.shape[0] - num_faces} faces).")
+
+        # Reordering mesh
+        if options.reorder:
+            print("Reordering mesh... ", end='', flush=True)
+            vertices, faces, normals, tcoords = meshdd.tools.reorder_mesh(vertices, faces, normals, tcoords, options.reorder)
+            print("Done.")
 
     # Checking mesh
     print("Checking mesh... ", end='', flush=True)
@@ -123,24 +325,60 @@ def main():
     print(f"Mesh bounds: min={np.amin(vertices, axis=0)} max={np.amax(vertices, axis=0)}")
     print(f"UV bounds: min={np.amin(tcoords, axis=0)} max={np.amax(tcoords, axis=0)}")
 
-    # Generating meshes
-    displaced_vertices, displaced_faces, diff_vertices, diff_faces = create_bicolor_mesh(
-        vertices, faces, normals, tcoords, options.texture[0],
-        threshold=options.threshold,
-        depth=options.depth,
-        reverse=options.reverse,
-        verbose=True)
+    # Generating meshes, each part being written in background while calculating the next one
+    plan = meshdd.tools.Plan() if options.dry_run else None
+    memory_budget = meshdd.tools.MemoryBudget(options.max_memory) if options.max_memory is not None and plan is None else None
+    with contextlib.nullcontext() if memory_budget is None else memory_budget:
+        parts = iter_bicolor_mesh(
+            vertices, faces, normals, tcoords, options.texture[0],
+            threshold=options.threshold,
+            depth=options.depth,
+            reverse=options.reverse,
+            min_area=options.min_area,
+            decimation=options.decimate,
+            oversampling=options.oversampling,
+            cut_border=options.cut_border,
+            tiles=options.tiles,
+            partition=options.partition,
+            processes=options.processes,
+            plan=plan,
+            memory_budget=memory_budget,
+            verbose=True)
 
-    # Writing resulting mesh
-    filename_prefix, filename_extension = os.path.splitext(options.output)
+        # Dry run: reporting the predicted sizes instead of writing the parts
+        if plan is not None:
+            for _ in parts:
+                pass
+            plan.report(available_nbytes=options.max_memory)
+            return
 
-    print("Writing displaced mesh... ", end='', flush=True)
-    mesh_interface.write(filename_prefix + "_displaced" + filename_extension, displaced_vertices, displaced_faces)
-    print("Done.")
+        if options.validate:
+            parts = meshdd.tools.iter_validated(parts)
+        if options.preview is not None:
+            parts = meshdd.tools.iter_previewed(parts, options.preview, colors)
+
+        # Writing resulting mesh
+        filename_prefix, filename_extension = os.path.splitext(options.output)
+
+        if filename_extension == '.3mf':
+            bodies = [(name, part_vertices, part_faces, colors[name]) for name, part_vertices, part_faces in parts]
+            print("Writing 3MF mesh... ", end='', flush=True)
+            write_3mf(options.output, bodies)
+            print("Done.")
+            if memory_budget is not None:
+                memory_budget.report()
+            return
+
+        with meshdd.tools.BackgroundWriter(mesh_interface, max_workers=options.writers) as writer:
+            for name, part_vertices, part_faces in parts:
+                print(f"Writing {name} mesh in background.")
+                writer.write(filename_prefix + "_" + name + filename_extension, part_vertices, part_faces)
+
+            print("Waiting for the writes to finish... ", end='', flush=True)
+        print("Done.")
 
-    print("Writing difference mesh... ", end='', flush=True)
-    mesh_interface.write(filename_prefix + "_difference" + filename_extension, diff_vertices, diff_faces)
-    print("Done.")
+        if memory_budget is not None:
+            memory_budget.report()
 
 
 if __name__ == "__main__":
@@ -4,6 +4,9 @@ import numpy as np
 
 import meshdd
 from meshdd.tools import shapes
+from meshdd.tools.image_reader import read_texture
+from meshdd.tools.mesh_3mf import write_3mf
+from meshdd.tools.decimation import decimate
 
 
 # Default values for the parameters
@@ -15,58 +18,177 @@ defaults = {
     'depth': 1.2,
 }
 
+# Colors of each part when exporting to 3MF
+colors = {
+    'displaced': '#E0E0E0',
+    'difference': '#C83232',
+}
 
-def create_bicolor_sphere(texture,
-                          Ntheta=defaults['Ntheta'],
-                          Nphi=defaults['Nphi'],
-                          radius=defaults['radius'],
-                          threshold=defaults['threshold'],
-                          reverse=False,
-                          depth=defaults['depth'],
-                          verbose=False):
-    """ Split a sphere in two parts based on a given texture. """
+
+def iter_bicolor_sphere(texture,
+                        Ntheta=defaults['Ntheta'],
+                        Nphi=defaults['Nphi'],
+                        radius=defaults['radius'],
+                        threshold=defaults['threshold'],
+                        reverse=False,
+                        depth=defaults['depth'],
+                        min_area=None,
+                        decimation=None,
+                        oversampling=None,
+                        cut_border=False,
+                        quads=False,
+                        plan=None,
+                        memory_budget=None,
+                        verbose=False):
+    """
+    Split a sphere in two parts based on a given texture.
+
+    Yields each part as (name, vertices, faces) as soon as it is calculated.
+
+    Set min_area to remove the islands and holes of the displacement mask
+    smaller than this area, see `meshdd.remove_small_components`.
+
+    Set decimation to the maximal geometric error to simplify the uniform
+    regions of the mesh, see `meshdd.tools.decimation.decimate`.
+
+    Set oversampling to read the texture image at a reduced scale (JPEG or
+    pyramidal TIFF) keeping this number of pixels per mesh edge, see
+    `meshdd.get_texture_resolution` and `meshdd.tools.read_texture`.
+
+    Set cut_border to True to cut the faces along the threshold iso-line of
+    the texture, so that the border of the carved region is smooth instead
+    of following the mesh edges, see `meshdd.cut_border_faces`.
+
+    Set quads to True to use a mesh of quadrangles (half the faces, see
+    `meshdd.tools.shapes.create_sphere`), triangulated when writing.
+
+    Set plan to a `meshdd.tools.Plan` to predict the size of the parts
+    instead of calculating them (dry run, nothing is yielded). The sizes are
+    upper bounds when decimating.
+
+    Set memory_budget to a `meshdd.tools.MemoryBudget` to decode the
+    texture at a reduced scale if it doesn't fit, displace the vertices by
+    chunks, check before the displacement and the difference that their
+    predicted memory fits (see `meshdd.tools.MemoryBudget.reserve`) and check
+    the memory used by each stage.
+    """
 
     # Verbose messages
     def info(*args, **kwargs):
         if verbose:
             print(*args, **kwargs)
 
+    # Memory used by each stage, and predicted memory checked before the large ones
+    def check(stage):
+        if memory_budget is not None:
+            memory_budget.check(stage)
+
+    def reserve(stage, nbytes):
+        if memory_budget is not None:
+            memory_budget.reserve(stage, nbytes)
+
     # Creating sphere mesh
     info("Creating sphere mesh... ", end='', flush=True)
-    vertices, faces, normals, tcoords = shapes.create_sphere(Ntheta, Nphi)
+    vertices, faces, normals, tcoords = shapes.create_sphere(Ntheta, Nphi, quads)
     vertices *= radius
     info("Done.")
+    check("mesh")
 
     # Reading texture image if needed
     if type(texture) is str:
         info("Reading texture... ", end='', flush=True)
-        import imageio
-        texture = meshdd.get_texture_from_image(imageio.imread(texture))
+        min_shape = None if oversampling is None else meshdd.get_texture_resolution(tcoords, faces, oversampling)
+        max_nbytes = None if memory_budget is None else memory_budget.get_available(0.25)
+        texture = read_texture(texture, min_shape=min_shape, max_nbytes=max_nbytes)
         info("Done.")
+        check("texture")
 
     # Displacing mesh
     info("Displacing mesh... ", end='', flush=True)
     vertex_color = meshdd.get_vertex_color_from_texture(tcoords, texture)
-    if vertex_color.ndim > 1:
-        vertex_color = np.mean(vertex_color, axis=1)
 
-    displace_mask = vertex_color >= threshold
+    # Thresholding the channels mean (lookup table for integer textures)
+    displace_mask = meshdd.map_vertex_color(vertex_color, lambda value: value >= threshold)
     if reverse:
         displace_mask = np.logical_not(displace_mask)
+    if min_area is not None:
+        displace_mask = meshdd.remove_small_components(vertices, faces, displace_mask, min_area)
+
+    # Cutting the border faces along the iso-line of the channels mean
+    if cut_border:
+        values = vertex_color.mean(axis=1) if vertex_color.ndim > 1 else vertex_color
+        faces, displace_mask, vertices, normals, tcoords = meshdd.cut_border_faces(
+            faces, displace_mask, values, threshold, vertices, normals, tcoords)
 
-    displaced_vertices = meshdd.displace_vertices(vertices, normals, -depth, displace_mask)
+    # Dry run: predicting the parts instead of calculating them
+    if plan is not None:
+        info("Skipped (dry run).")
+        plan.add_stage("mesh", vertices, faces, normals, tcoords)
+        plan.add_stage("texture", texture)
+        plan.add_stage("displacement mask", displace_mask, temporary=(vertex_color,))
+        plan.add_part("displaced", vertices.shape[0], faces.shape[0], vertices.nbytes, 2 * vertices.nbytes)
+        plan.add_part("difference", **meshdd.estimate_boolean_difference(faces, displace_mask, vertices.shape[1], vertices.dtype))
+        return
+
+    reserve("displacement", vertices.nbytes)
+    chunk_size = None if memory_budget is None else memory_budget.get_chunk_size(2 * vertices[0].nbytes)
+    displaced_vertices = meshdd.displace_vertices(vertices, normals, -depth, displace_mask, chunk_size=chunk_size)
     info("Done.")
+    check("displacement")
+
+    # Decimating the uniform regions (the borders of the displacement mask are kept unchanged)
+    if decimation is not None:
+        info("Decimating mesh... ", end='', flush=True)
+        faces = meshdd.triangulate_faces(faces)
+        border_faces_mask = meshdd.get_border_faces_mask(faces, displace_mask)
+        locked_mask = np.logical_or(
+            meshdd.get_border_vertices_mask(faces, displace_mask, border_faces_mask),
+            meshdd.get_border_vertices_mask(faces, displace_mask, border_faces_mask, outside=True))
+        num_faces = faces.shape[0]
+        faces, vertices_id = decimate((vertices, displaced_vertices), faces, locked_mask, max_error=decimation)
+        vertices, displaced_vertices, displace_mask = vertices[vertices_id], displaced_vertices[vertices_id], displace_mask[vertices_id]
+        info(f"Done ({faces.shape[0] - num_faces} faces).")
+        check("decimation")
+
+    yield "displaced", displaced_vertices, faces
 
     # Difference mesh
     info("Difference mesh... ", end='', flush=True)
+    if memory_budget is not None:
+        reserve("difference", meshdd.estimate_boolean_difference(faces, displace_mask, vertices.shape[1], vertices.dtype)['peak_nbytes'])
     diff_vertices, diff_faces = meshdd.get_boolean_difference(vertices, displaced_vertices, faces, displace_mask)
     info("Done.")
+    check("difference")
+
+    yield "difference", diff_vertices, diff_faces
+
+
+def create_bicolor_sphere(texture,
+                          Ntheta=defaults['Ntheta'],
+                          Nphi=defaults['Nphi'],
+                          radius=defaults['radius'],
+                          threshold=defaults['threshold'],
+                          reverse=False,
+                          depth=defaults['depth'],
+                          min_area=None,
+                          decimation=None,
+                          oversampling=None,
+                          cut_border=False,
+                          quads=False,
+                          memory_budget=None,
+                          verbose=False):
+    """ Split a sphere in two parts based on a given texture. """
+
+    parts = {name: (vertices, faces) for name, vertices, faces in iter_bicolor_sphere(
+        texture, Ntheta, Nphi, radius, threshold, reverse, depth, min_area, decimation,
+        oversampling=oversampling, cut_border=cut_border, quads=quads, memory_budget=memory_budget, verbose=verbose)}
 
-    return displaced_vertices, faces, diff_vertices, diff_faces
+    return (*parts['displaced'], *parts['difference'])
 
 
 def main():
     import argparse
+    import contextlib
     import os
 
     # Command-line parameters
@@ -88,32 +210,87 @@ def main():
                         help="Vertices below the threshold are carved.")
     parser.add_argument("--depth", type=float, default=defaults['depth'],
                         help="Displacement depth")
+    parser.add_argument("--min_area", type=float, default=None,
+                        help="Remove the islands and holes of the carved region smaller than this area")
+    parser.add_argument("--decimate", type=float, default=None,
+                        help="Simplify the uniform regions of the mesh with this maximal geometric error")
+    parser.add_argument("--oversampling", type=float, default=None,
+                        help="Read the texture at a reduced scale (JPEG or pyramidal TIFF) keeping this number of pixels per mesh edge")
+    parser.add_argument("--cut_border", action="store_true",
+                        help="Cut the faces along the threshold iso-line for a smooth border of the carved region")
+    parser.add_argument("--quads", action="store_true",
+                        help="Use quadrangles instead of triangles (triangulated when writing)")
+    parser.add_argument("--writers", type=int, default=1,
+                        help="Number of parts written concurrently")
+    parser.add_argument("--dry_run", action="store_true",
+                        help="Only predict the size of the parts and the peak memory")
+    parser.add_argument("--validate", action="store_true",
+                        help="Check that the parts are closed and manifold before writing them")
+    parser.add_argument("--preview", type=str, default=None,
+                        help="Render the parts from a few viewpoints in this image (e.g. preview.png)")
+    parser.add_argument("--max_memory", "--max-memory", type=meshdd.tools.planner.parse_size, default=None,
+                        help="Memory budget (e.g. 8G) that the textures and chunks are fitted to, checked at each stage")
+    parser.add_argument("--backend", type=str, default='auto',
+                        choices=['auto'] + list(meshdd.tools.backends.interfaces),
+                        help="Mesh library used to read and write the meshes (auto: fastest installed one, measured once)")
     parser.add_argument("--output", type=str, default="sphere.stl",
-                        help="Output file name")
+                        help="Output file name (all parts in one file for the 3MF format)")
     options = parser.parse_args()
 
-    # Generating meshes
-    displaced_vertices, displaced_faces, diff_vertices, diff_faces = create_bicolor_sphere(
-        texture=options.texture[0],
-        Ntheta=options.Ntheta, Nphi=options.Nphi,
-        radius=options.radius, threshold=options.threshold,
-        reverse=options.reverse, depth=options.depth,
-        verbose=True)
-
-    # Writing resulting mesh
+    # Output files
     filename_prefix, filename_extension = os.path.splitext(options.output)
 
-    #mesh_interface = meshdd.tools.MeshIOInterface()
-    #mesh_interface = meshdd.tools.PyMeshInterface()
-    mesh_interface = meshdd.tools.TriMeshInterface()
+    mesh_interface = meshdd.tools.get_mesh_interface(options.backend)
+
+    # Generating meshes, each part being written in background while calculating the next one
+    plan = meshdd.tools.Plan() if options.dry_run else None
+    memory_budget = meshdd.tools.MemoryBudget(options.max_memory) if options.max_memory is not None and plan is None else None
+    with contextlib.nullcontext() if memory_budget is None else memory_budget:
+        parts = iter_bicolor_sphere(
+            texture=options.texture[0],
+            Ntheta=options.Ntheta, Nphi=options.Nphi,
+            radius=options.radius, threshold=options.threshold,
+            reverse=options.reverse, depth=options.depth,
+            min_area=options.min_area,
+            decimation=options.decimate,
+            oversampling=options.oversampling,
+            cut_border=options.cut_border,
+            quads=options.quads,
+            plan=plan,
+            memory_budget=memory_budget,
+            verbose=True)
+
+        # Dry run: reporting the predicted sizes instead of writing the parts
+        if plan is not None:
+            for _ in parts:
+                pass
+            plan.report(available_nbytes=options.max_memory)
+            return
+
+        if options.validate:
+            parts = meshdd.tools.iter_validated(parts)
+        if options.preview is not None:
+            parts = meshdd.tools.iter_previewed(parts, options.preview, colors)
+
+        if filename_extension == '.3mf':
+            bodies = [(name, vertices, faces, colors[name]) for name, vertices, faces in parts]
+            print("Writing 3MF mesh... ", end='', flush=True)
+            write_3mf(options.output, bodies)
+            print("Done.")
+            if memory_budget is not None:
+                memory_budget.report()
+            return
+
+        with meshdd.tools.BackgroundWriter(mesh_interface, max_workers=options.writers) as writer:
+            for name, vertices, faces in parts:
+                print(f"Writing {name} mesh in background.")
+                writer.write(filename_prefix + "_" + name + filename_extension, vertices, faces)
 
-    print("Writing displaced mesh... ", end='', flush=True)
-    mesh_interface.write(filename_prefix + "_displaced" + filename_extension, displaced_vertices, displaced_faces)
-    print("Done.")
+            print("Waiting for the writes to finish... ", end='', flush=True)
+        print("Done.")
 
-    print("Writing difference mesh... ", end='', flush=True)
-    mesh_interface.write(filename_prefix + "_difference" + filename_extension, diff_vertices, diff_faces)
-    print("Done.")
+        if memory_budget is not None:
+            memory_budget.report()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,276 @@
+import numpy as np
+
+import meshdd
+
+
+def partition_mesh(faces, points, tiles_cnt, curve='morton', bits=8):
+    """
+    Partitions the faces of a mesh in spatially compact tiles
+
+    Faces are ordered along a space-filling curve through their first
+    vertex (see `meshdd.get_space_filling_codes`) and split in tiles of the same
+    number of faces.
+
+    Parameters
+    ----------
+    faces: (n, d) int
+        Mesh faces defined by vertices indexes
+    points: (m, k) float
+        Position of the vertices used to partition the faces, e.g. the
+        vertices (spatial partition) or the texture coordinates (UV partition)
+    tiles_cnt: int
+        Number of tiles
+    curve: str
+        'morton' or 'hilbert' space-filling curve
+    bits: int
+        Number of bits per axis of the curve (a coarse grid is enough for tiles)
+
+    Returns
+    -------
+    tiles: list of (k) int
+        Indexes of the faces of each tile (sorted)
+    """
+
+    order = np.argsort(meshdd.get_space_filling_codes(points, curve, bits)[faces[:, 0]], kind='stable')
+
+    bounds = np.linspace(0, faces.shape[0], tiles_cnt + 1).astype(np.int64)
+    return [np.sort(order[start:stop]) for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+def get_tile_mesh(faces, faces_id, *vertex_arrays):
+    """
+    Extracts the faces of a tile with their vertices
+
+    Returns the global indexes of the vertices of the tile, the faces of the
+    tile renumbered on these vertices and the given vertex arrays (e.g.
+    vertices, normals, ...) restricted to these vertices.
+    """
+
+    tile_faces = faces[faces_id]
+    vertices_mask = np.zeros(np.amax(tile_faces) + 1, dtype=bool)
+    vertices_mask[tile_faces] = True
+    vertices_id = np.flatnonzero(vertices_mask)
+    tile_faces = (np.cumsum(vertices_mask) - 1)[tile_faces]
+    return (vertices_id, tile_faces, *(None if array is None else array[vertices_id] for array in vertex_arrays))
+
+
+def get_difference_keys(vertices_id, vertices_cnt, displace_mask, diff_faces, vertices_index):
+    """
+    Global keys of the vertices of the difference of a tile, see `stitch_difference`
+
+    Parameters
+    ----------
+    vertices_id: (m) int
+        Global indexes of the vertices of the tile
+    vertices_cnt: int
+        Number of vertices of the whole mesh
+    displace_mask: (m) bool
+        Displacement mask of the tile
+    diff_faces, vertices_index:
+        Difference of the tile with vertices indexes (see the return_index
+        parameter of `meshdd.get_boolean_difference`)
+
+    Returns
+    -------
+    keys: (k, d) int
+        Faces of the difference of the tile defined by vertices keys
+    """
+
+    index = vertices_index[diff_faces]
+    local_id = index % vertices_id.size
+    category = (index >= vertices_id.size).astype(np.int64) + displace_mask[local_id]
+    return vertices_id[local_id] + vertices_cnt * category
+
+
+def stitch_difference(vertices, displaced_vertices, tiles_difference):
+    """
+    Stitches the difference meshes calculated on tiles
+
+    Vertices are identified by keys built from their global index so that
+    the vertices on the border between tiles are shared exactly: the index
+    for the outside border vertices, plus the number of vertices for the
+    displaced vertices before displacement and twice this number after
+    displacement. They are thus ordered like in `meshdd.get_boolean_difference`
+    on the whole mesh (faces are grouped by tile instead).
+
+    Parameters
+    ----------
+    vertices, displaced_vertices: (n, 3) float
+        Vertices of the whole original and displaced meshes
+    tiles_difference: list of (k, d) int
+        Faces of the difference of each tile defined by vertices keys (see
+        `get_difference_keys`), front faces first
+
+    Returns
+    -------
+    diff_vertices: (p, 3) float
+        Vertices of the difference mesh
+    diff_faces: (q, d) int
+        Faces of the difference mesh (front faces of each tile, then back faces)
+    """
+
+    n = vertices.shape[0]
+    front_faces = [faces[:faces.shape[0] // 2] for faces in tiles_difference]
+    back_faces = [faces[faces.shape[0] // 2:] for faces in tiles_difference]
+    diff_faces = np.concatenate(front_faces + back_faces)
+    del front_faces, back_faces
+
+    used_mask = np.zeros(3 * n, dtype=bool)
+    used_mask[diff_faces] = True
+    used_id = np.flatnonzero(used_mask)
+    diff_faces = (np.cumsum(used_mask) - 1)[diff_faces]
+    del used_mask
+
+    # Keys being sorted, the displaced vertices come last
+    displaced_start = np.searchsorted(used_id, 2 * n)
+    diff_vertices = vertices[used_id % n]
+    diff_vertices[displaced_start:] = displaced_vertices[used_id[displaced_start:] - 2 * n]
+
+    return diff_vertices, diff_faces
+
+
+def _bicolor_tile(vertices_id, vertices_cnt, vertices, faces, normals, tcoords, texture, texture_offset, texture_shape,
+                  threshold, depth, reverse):
+    """ Samples, displaces and calculates the difference of a tile (see `get_bicolor_tiles`) """
+
+    i, j = meshdd.get_texture_indexes(tcoords, texture_shape)
+    vertex_color = texture[i - texture_offset[0], j - texture_offset[1], ...]
+
+    displace_mask = meshdd.map_vertex_color(vertex_color, lambda value: value >= threshold)
+    if reverse:
+        displace_mask = np.logical_not(displace_mask)
+
+    displaced_vertices = meshdd.displace_vertices(vertices, normals, -depth, displace_mask)
+    _, diff_faces, vertices_index = meshdd.get_boolean_difference(vertices, displaced_vertices, faces, displace_mask,
+                                                                  return_index=True)
+
+    return (displace_mask, displaced_vertices[displace_mask],
+            get_difference_keys(vertices_id, vertices_cnt, displace_mask, diff_faces, vertices_index))
+
+
+def get_bicolor_tiles(vertices, faces, normals, tcoords, texture, threshold, depth, reverse=False,
+                      tiles_cnt=16, partition='uv', executor=None, processes=None, max_nbytes=None):
+    """
+    Displacement and difference of a mesh calculated by tiles in parallel
+
+    The mesh is partitioned in tiles (see `partition_mesh`) that go through
+    the texture sampling, the displacement and the boolean difference in
+    separate processes, each tile getting only the part of the texture that
+    covers it. The displacement and the difference being local to each
+    vertex and face, tiles don't need to overlap. The results are stitched back
+    by global vertex indexes (see `stitch_difference`) and are the same as
+    for the whole mesh, up to the order of the difference faces.
+
+    Parameters
+    ----------
+    vertices, faces, normals, tcoords:
+        Mesh (see `meshdd.tools.bicolor_mesh.iter_bicolor_mesh`)
+    texture: (p, q,) any
+        Array of the texture color
+    threshold, depth, reverse:
+        Displacement parameters (see `meshdd.tools.bicolor_mesh.iter_bicolor_mesh`)
+    tiles_cnt: int
+        Number of tiles (more tiles than processes balance the load and reduce
+        the memory of each process)
+    partition: str
+        'uv' to partition along a space-filling curve of the texture
+        coordinates (compact tiles and texture parts whatever the order of
+        the faces), 'space' along a space-filling curve of the vertices
+        positions, or 'index' for ranges of consecutive faces (only compact
+        if the mesh is ordered, e.g. generated or reordered by
+        `meshdd.reorder_mesh`)
+    executor: concurrent.futures.Executor or None
+        Executor running the tiles (e.g. a cluster client implementing
+        `submit`), a local process pool if None
+    processes: int or None
+        Number of processes of the local pool, or of workers of the given
+        executor (number of CPUs if None)
+    max_nbytes: int or None
+        Memory available to the tiles being processed at once (e.g. from a
+        `meshdd.tools.MemoryBudget`): the number of tiles is increased so that
+        the predicted memory of the tiles submitted at once (their inputs
+        copied to the workers, the displacement and the difference) fits
+
+    Returns
+    -------
+    displace_mask: (n) bool
+        Displacement mask
+    displaced_vertices: (n, 3) float
+        Vertices of the displaced mesh
+    diff_vertices, diff_faces:
+        Difference mesh
+    """
+
+    import os
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+    assert partition in ('index', 'uv', 'space'), "Unknown partition kind!"
+    processes = processes or os.cpu_count() or 1
+
+    # Tiles small enough for the 2 * processes tiles submitted at once: inputs
+    # (copied when submitted and in the worker), displaced vertices and
+    # difference (at most three times the vertices and twice the faces)
+    if max_nbytes is not None:
+        inputs_nbytes = vertices.nbytes + faces.nbytes + normals.nbytes + tcoords.nbytes + texture.nbytes
+        mesh_nbytes = 2 * inputs_nbytes + 4 * vertices.nbytes + 4 * faces.nbytes
+        tiles_cnt = max(tiles_cnt, -(-2 * processes * mesh_nbytes // max(1, max_nbytes)))
+    tiles_cnt = max(1, min(tiles_cnt, faces.shape[0]))
+
+    def iter_tiles():
+        """ Global indexes of the vertices of each tile, its renumbered faces and the selection of its vertices """
+        if partition == 'index':
+            # Range of vertices (may include vertices of other tiles that are then calculated twice, identically)
+            bounds = np.linspace(0, faces.shape[0], tiles_cnt + 1).astype(np.int64)
+            for start, stop in zip(bounds[:-1], bounds[1:]):
+                tile_faces = faces[start:stop]
+                lower, upper = np.amin(tile_faces), np.amax(tile_faces) + 1
+                yield np.arange(lower, upper), tile_faces - lower, slice(lower, upper)
+        else:
+            for faces_id in partition_mesh(faces, tcoords if partition == 'uv' else vertices, tiles_cnt):
+                vertices_id, tile_faces = get_tile_mesh(faces, faces_id)
+                yield vertices_id, tile_faces, vertices_id
+
+    displace_mask = np.zeros(vertices.shape[0], dtype=bool)
+    displaced_vertices = vertices.copy()
+    tiles_difference = [None] * tiles_cnt
+
+    def collect(tile_index, vertices_id, future):
+        tile_mask, tile_displaced, tiles_difference[tile_index] = future.result()
+        displace_mask[vertices_id[tile_mask]] = True
+        displaced_vertices[vertices_id[tile_mask]] = tile_displaced
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=processes)
+
+    try:
+        # Submitting the tiles as the previous ones finish (only a few tiles in memory at once)
+        pending = {}
+        for tile_index, (vertices_id, tile_faces, selection) in enumerate(iter_tiles()):
+            tile_vertices, tile_normals, tile_tcoords = vertices[selection], normals[selection], tcoords[selection]
+
+            # Texture part covering the tile (indexes are monotonic in the texture coordinates)
+            lower = meshdd.get_texture_indexes(np.amin(tile_tcoords, axis=0)[None, :], texture.shape)
+            upper = meshdd.get_texture_indexes(np.amax(tile_tcoords, axis=0)[None, :], texture.shape)
+            offset = (int(lower[0][0]), int(lower[1][0]))
+            tile_texture = texture[offset[0]:int(upper[0][0]) + 1, offset[1]:int(upper[1][0]) + 1, ...]
+
+            future = executor.submit(_bicolor_tile, vertices_id, vertices.shape[0], tile_vertices, tile_faces, tile_normals, tile_tcoords,
+                                     tile_texture, offset, texture.shape[:2], threshold, depth, reverse)
+            pending[future] = (tile_index, vertices_id)
+
+            while len(pending) >= 2 * processes:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(*pending.pop(future), future)
+
+        for future in list(pending):
+            collect(*pending.pop(future), future)
+
+    finally:
+        if own_executor:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    diff_vertices, diff_faces = stitch_difference(vertices, displaced_vertices, tiles_difference)
+
+    return displace_mask, displaced_vertices, diff_vertices, diff_faces.astype(faces.dtype, copy=False)
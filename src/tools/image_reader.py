@@ -0,0 +1,154 @@
+import os
+
+import numpy as np
+
+import meshdd
+
+
+def _read_tiff(file_name, max_pixels=None, min_shape=None, workers=None, max_nbytes=None):
+    """
+    Reads a TIFF image with tifffile
+
+    Strips and tiles are decoded in parallel and, for pyramidal images, the
+    smallest level that keeps min_shape is read (or the largest one smaller
+    than max_nbytes). Returns the image and its scale relatively to the full
+    resolution, or None if the image should be read by Pillow.
+    """
+
+    import tifffile
+
+    with tifffile.TiffFile(file_name) as tif:
+        # Other photometric interpretations (e.g. palette) are converted by Pillow
+        if tif.pages[0].photometric not in (tifffile.PHOTOMETRIC.MINISBLACK, tifffile.PHOTOMETRIC.RGB):
+            return None
+
+        levels = tif.series[0].levels
+        full_shape = levels[0].shape[:2]
+
+        level = levels[0]
+        if min_shape is not None:
+            level = min((level for level in levels if level.shape[0] >= min_shape[0] and level.shape[1] >= min_shape[1]),
+                        key=lambda level: level.shape[0] * level.shape[1], default=level)
+        if max_nbytes is not None and level.nbytes > max_nbytes:
+            level = max((level for level in levels if level.nbytes <= max_nbytes),
+                        key=lambda level: level.nbytes, default=level)
+
+        height, width = level.shape[:2]
+        if max_pixels is not None and width * height > max_pixels:
+            raise ValueError(f"Image {file_name} has {width * height} pixels, more than {max_pixels}!")
+        if max_nbytes is not None and level.nbytes > max_nbytes:
+            raise ValueError(f"Image {file_name} needs {level.nbytes} bytes, more than {max_nbytes}!")
+
+        return level.asarray(maxworkers=workers), height / full_shape[0]
+
+
+def read_image(file_name, max_pixels=None, min_shape=None, workers=None, return_scale=False, max_nbytes=None):
+    """
+    Reads an image as an array, with a limit on its number of pixels
+
+    Pillow only provides a process-wide limit (`PIL.Image.MAX_IMAGE_PIXELS`)
+    that is left untouched so that images can be read concurrently with
+    different limits: the formats registered in Pillow are opened by their
+    plugin and the given limit is checked from the header, before decoding.
+    Other files are read by imageio (with the process-wide limit).
+
+    If min_shape is given, the image may be decoded at a reduced scale when
+    the format allows it, keeping at least this shape: JPEG images are
+    decoded at 1/2, 1/4 or 1/8 scale (DCT scaling, the pixels being averaged)
+    and the levels of pyramidal TIFF images are used. TIFF images are read by
+    tifffile if installed, that decodes the strips or tiles in parallel.
+
+    If max_nbytes is given, larger images are decoded at the largest reduced
+    scale that fits (same formats), other images are refused.
+
+    Parameters
+    ----------
+    file_name: str
+        Image file name
+    max_pixels: int or None
+        Maximal number of decoded pixels (None for no limit)
+    min_shape: (int, int) or None
+        Minimal shape (rows, columns) of a reduced-scale image (None for the full resolution)
+    workers: int or None
+        Number of threads decoding the strips or tiles of TIFF images (tifffile default if None)
+    return_scale: bool
+        If True, also returns the scale of the decoded image relatively to the full resolution
+    max_nbytes: int or None
+        Maximal size of the decoded image in bytes (None for no limit)
+
+    Returns
+    -------
+    image: (q, p,) any
+        Image array (palette images are converted to RGB or RGBA)
+    scale: float
+        Scale of the image (if return_scale is True)
+    """
+
+    import importlib.util
+    import PIL.Image
+
+    def result(image, scale=1.):
+        return (image, scale) if return_scale else image
+
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension in ('.tif', '.tiff') and importlib.util.find_spec('tifffile') is not None:
+        tiff = _read_tiff(file_name, max_pixels, min_shape, workers, max_nbytes)
+        if tiff is not None:
+            return result(*tiff)
+
+    PIL.Image.init()
+    image_format = PIL.Image.registered_extensions().get(extension)
+
+    if image_format in PIL.Image.OPEN:
+        factory, _ = PIL.Image.OPEN[image_format]
+        with open(file_name, 'rb') as file:
+            try:
+                image = factory(file, file_name)
+            except SyntaxError:
+                image = None # e.g. wrong extension
+
+            if image is not None:
+                width, height = image.size
+                full_width = width
+
+                # Size of a decoded pixel (palette images being converted to RGB or RGBA)
+                bands = 4 if image.mode == 'P' else len(image.getbands())
+                pixel_nbytes = bands * {'I;16': 2, 'I': 4, 'F': 4}.get(image.mode, 1)
+
+                # Reduced-scale decoding (JPEG only, ignored by other formats)
+                # The DCT scaling divides the size by 2, 4 or 8, keeping at least the requested size
+                requested = (width, height)
+                if min_shape is not None:
+                    requested = (max(1, int(min_shape[1])), max(1, int(min_shape[0])))
+                if max_nbytes is not None:
+                    reduction = next((k for k in (1, 2, 4, 8)
+                                      if -(-width // k) * -(-height // k) * pixel_nbytes <= max_nbytes), 8)
+                    requested = (min(requested[0], -(-width // reduction)), min(requested[1], -(-height // reduction)))
+                if requested != (width, height) and image_format == 'JPEG':
+                    image.draft(image.mode, requested)
+
+                width, height = image.size
+                if max_pixels is not None and width * height > max_pixels:
+                    raise ValueError(f"Image {file_name} has {width * height} pixels, more than {max_pixels}!")
+                if max_nbytes is not None and width * height * pixel_nbytes > max_nbytes:
+                    raise ValueError(f"Image {file_name} needs {width * height * pixel_nbytes} bytes, more than {max_nbytes}!")
+
+                if image.mode == 'P':
+                    image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+                return result(np.asarray(image), width / full_width)
+
+    import imageio
+    return result(imageio.imread(file_name))
+
+
+def read_texture(file_name, max_pixels=None, min_shape=None, workers=None, return_scale=False, max_nbytes=None):
+    """
+    Reads an image as a texture, see `read_image` and `meshdd.get_texture_from_image`
+
+    min_shape is the minimal shape of the texture (e.g. from `meshdd.get_texture_resolution`).
+    """
+
+    image, scale = read_image(file_name, max_pixels, None if min_shape is None else tuple(min_shape)[::-1],
+                              workers, return_scale=True, max_nbytes=max_nbytes)
+    texture = meshdd.get_texture_from_image(image)
+    return (texture, scale) if return_scale else texture
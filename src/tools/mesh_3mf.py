@@ -0,0 +1,148 @@
+import numpy as np
+
+import meshdd
+
+_content_types = """<?xml version="1.0" encoding="UTF-8"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+ <Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+ <Default Extension="model" ContentType="application/vnd.ms-package.3dmanufacturing-3dmodel+xml"/>
+</Types>
+"""
+
+_relationships = """<?xml version="1.0" encoding="UTF-8"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+ <Relationship Target="/3D/3dmodel.model" Id="rel0" Type="http://schemas.microsoft.com/3dmanufacturing/2013/01/3dmodel"/>
+</Relationships>
+"""
+
+_model_header = """<?xml version="1.0" encoding="UTF-8"?>
+<model unit="{unit}" xml:lang="en-US" xmlns="http://schemas.microsoft.com/3dmanufacturing/core/2015/02">
+ <resources>
+  <basematerials id="1">
+"""
+
+
+def _get_color(color):
+    """ Returns the 3MF color (#RRGGBBAA) from a string or a RGB(A) tuple of floats in [0, 1] """
+
+    if isinstance(color, str):
+        color = color.lstrip('#')
+        return '#' + color.upper() + 'FF' * (len(color) == 6)
+
+    color = np.clip(np.round(np.asarray(color) * 255), 0, 255).astype(int)
+    return '#' + ''.join(f'{c:02X}' for c in color) + 'FF' * (color.size == 3)
+
+
+def _write_rows(stream, row_format, rows, chunk_size):
+    """ Writes rows of an array in chunks using given format for each row """
+
+    for i in range(0, rows.shape[0], chunk_size):
+        chunk = rows[i:i + chunk_size]
+        stream.write(((row_format * chunk.shape[0]) % tuple(chunk.ravel().tolist())).encode())
+
+
+def _merge_vertices(bodies):
+    """
+    Merges the vertices of all bodies in one buffer
+
+    Vertices that are exactly equal (e.g. on the border between a displaced
+    mesh and its difference mesh) are stored once, in order of first appearance.
+    Faces that become degenerated are removed.
+    """
+
+    all_vertices = np.concatenate([vertices for _, vertices, _, _ in bodies])
+    _, first_index, inverse = np.unique(all_vertices, axis=0, return_index=True, return_inverse=True)
+
+    # Keeping order of first appearance
+    order = np.argsort(first_index)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(order.size)
+    inverse = rank[inverse.ravel()]
+
+    all_faces = []
+    offset = 0
+    for _, vertices, faces, _ in bodies:
+        faces = inverse[offset + faces]
+        faces = faces[(faces[:, 0] != faces[:, 1]) & (faces[:, 0] != faces[:, 2]) & (faces[:, 1] != faces[:, 2])]
+        all_faces.append(faces)
+        offset += vertices.shape[0]
+
+    return all_vertices[first_index[order]], all_faces
+
+
+def write_3mf(mesh_file, bodies, shared_vertices=False, unit='millimeter', chunk_size=2**16):
+    """
+    Writes multiple colored bodies in one 3MF file
+
+    The XML content is generated by chunks and directly streamed into the
+    compressed archive so that no intermediate mesh objects are created.
+
+    Parameters
+    ----------
+    mesh_file: str
+        Output file name
+    bodies: list of (name, vertices, faces, color)
+        Bodies to write: name (str), vertices ((n, 3) float), faces
+        ((m, d) int, see `meshdd.triangulate_faces`) and color (`#RRGGBB` string or RGB tuple in [0, 1])
+    shared_vertices: bool
+        If False, each body is written as a separate (closed) object.
+        If True, all bodies are written as one object with a single vertex
+        buffer where vertices common to multiple bodies are stored once, the
+        body of each triangle being given by its material (smaller file, but
+        the faces shared by touching bodies, e.g. a displaced mesh and its
+        difference, make this object non-manifold, which slicers may reject
+        or repair).
+    unit: str
+        Unit of the vertices coordinates
+    chunk_size: int
+        Number of vertices or faces formatted at once
+    """
+
+    import zipfile
+
+    # 3MF only supports triangles
+    bodies = [(name, vertices, meshdd.triangulate_faces(faces), color) for name, vertices, faces, color in bodies]
+
+    with zipfile.ZipFile(mesh_file, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', _content_types)
+        archive.writestr('_rels/.rels', _relationships)
+
+        with archive.open('3D/3dmodel.model', 'w', force_zip64=True) as stream:
+            stream.write(_model_header.format(unit=unit).encode())
+
+            # Materials (one per body)
+            for name, _, _, color in bodies:
+                stream.write(f'   <base name="{name}" displaycolor="{_get_color(color)}"/>\n'.encode())
+            stream.write(b'  </basematerials>\n')
+
+            vertex_format = '     <vertex x="%.9g" y="%.9g" z="%.9g"/>\n'
+
+            if shared_vertices:
+                vertices, all_faces = _merge_vertices(bodies)
+
+                stream.write(b'  <object id="2" type="model" pid="1" pindex="0">\n   <mesh>\n    <vertices>\n')
+                _write_rows(stream, vertex_format, vertices, chunk_size)
+                stream.write(b'    </vertices>\n    <triangles>\n')
+                for material, faces in enumerate(all_faces):
+                    triangle_format = f'     <triangle v1="%d" v2="%d" v3="%d" pid="1" p1="{material}"/>\n'
+                    _write_rows(stream, triangle_format, faces, chunk_size)
+                stream.write(b'    </triangles>\n   </mesh>\n  </object>\n')
+
+                objects_id = [2]
+
+            else:
+                objects_id = []
+                for material, (name, vertices, faces, _) in enumerate(bodies):
+                    object_id = 2 + material
+                    stream.write(f'  <object id="{object_id}" name="{name}" type="model" pid="1" pindex="{material}">\n'.encode())
+                    stream.write(b'   <mesh>\n    <vertices>\n')
+                    _write_rows(stream, vertex_format, vertices, chunk_size)
+                    stream.write(b'    </vertices>\n    <triangles>\n')
+                    _write_rows(stream, '     <triangle v1="%d" v2="%d" v3="%d"/>\n', faces, chunk_size)
+                    stream.write(b'    </triangles>\n   </mesh>\n  </object>\n')
+                    objects_id.append(object_id)
+
+            stream.write(b' </resources>\n <build>\n')
+            for object_id in objects_id:
+                stream.write(f'  <item objectid="{object_id}"/>\n'.encode())
+            stream.write(b' </build>\n</model>\n')
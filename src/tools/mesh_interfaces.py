@@ -1,8 +1,36 @@
 import numpy as np
 
+import meshdd
+
+def _get_cells(faces):
+    """
+    Cells blocks of meshio from faces
+
+    Quadrangles repeating a vertex are written as triangles and other
+    polygonal faces are triangulated (see `meshdd.triangulate_faces`).
+    """
+
+    if faces.shape[1] == 3:
+        return [("triangle", faces)]
+    if faces.shape[1] != 4:
+        return [("triangle", meshdd.triangulate_faces(faces))]
+
+    repeated = faces == np.roll(faces, -1, axis=1)
+    repeated_cnt = np.sum(repeated, axis=1)
+    triangles = faces[repeated_cnt == 1][~repeated[repeated_cnt == 1]].reshape(-1, 3)
+    cells = [("quad", faces[repeated_cnt == 0]), ("triangle", triangles)]
+
+    return [(kind, data) for kind, data in cells if data.shape[0] > 0]
+
+
 class MeshIOInterface:
     """ Mesh reader/writer interface for meshio """
 
+    @staticmethod
+    def writes_polygons(extension):
+        """ True if the polygonal faces are written as such to a file format (triangulated otherwise) """
+        return extension.lower() != '.stl'
+
     def read(self, mesh_file):
         assert mesh_file[-4:] == '.ply', "Only PLY format for input mesh"
 
@@ -32,7 +60,11 @@ class MeshIOInterface:
 
     def write(self, mesh_file, vertices, faces):
         import meshio
-        meshio.write_points_cells(mesh_file, vertices, [("triangle", faces)])
+
+        # Polygonal faces are kept, except for STL that only supports triangles
+        if not self.writes_polygons(mesh_file[-4:]):
+            faces = meshdd.triangulate_faces(faces)
+        meshio.write_points_cells(mesh_file, vertices, _get_cells(faces))
 
 
 class PyMeshInterface:
@@ -99,7 +131,7 @@ class PyMeshInterface:
 
     def write(self, mesh_file, vertices, faces):
         import pymesh
-        pymesh.save_mesh_raw(mesh_file, vertices, faces)
+        pymesh.save_mesh_raw(mesh_file, vertices, meshdd.triangulate_faces(faces))
 
 class TriMeshInterface:
     """ Mesh reader/writer interface for trimesh """
@@ -155,9 +187,16 @@ class TriMeshInterface:
             mesh.vertex_attributes['normals'] = normals
 
         # Cleaning
-        trimesh.constants.tol.merge = tol
-        mesh.merge_vertices()
-        mesh.remove_degenerate_faces()
+        # Same as setting trimesh.constants.tol.merge to tol, which is process-wide
+        mesh.merge_vertices(digits_vertex=trimesh.util.decimal_to_digits(tol))
+
+        # Degenerated triangles: edge shorter than tol or height shorter than 1e-8
+        # (see trimesh.triangles.nondegenerate)
+        triangles = mesh.triangles
+        edges_length = np.sum((triangles[:, 1:] - triangles[:, :1])**2, axis=2)**.5
+        with np.errstate(divide='ignore', invalid='ignore'):
+            heights = (mesh.area_faces[:, None] * 2) / edges_length
+        mesh.update_faces(np.all((edges_length > tol) & (heights > 1e-8), axis=1))
 
         return (mesh.vertices,
                 mesh.faces,
@@ -168,12 +207,233 @@ class TriMeshInterface:
     def write(self, mesh_file, vertices, faces):
         import trimesh
 
-        # Creating mesh
+        # Creating mesh (triangulated)
         mesh = trimesh.Trimesh(vertices=vertices,
-                               faces=faces,
+                               faces=meshdd.triangulate_faces(faces),
                                process=False)
 
         trimesh.exchange.export.export_mesh(mesh, mesh_file)
 
 
 
+
+
+def reorder_mesh(vertices, faces, normals=None, tcoords=None, curve='hilbert'):
+    """
+    Reorders a mesh and its attributes for memory locality
+
+    See `meshdd.reorder_mesh`. Returns the reordered vertices, faces,
+    normals and tcoords (None if not given), like the `clean` method of the
+    interfaces.
+    """
+
+    faces, vertices_order, _ = meshdd.reorder_mesh(vertices, faces, curve)
+    normals = None if normals is None else normals[vertices_order]
+    tcoords = None if tcoords is None else tcoords[vertices_order]
+
+    return vertices[vertices_order], faces, normals, tcoords
+
+
+class MeshCache:
+    """
+    Cache of read (and optionally cleaned) meshes as NumPy binary files
+
+    Each entry is a directory of `.npy` files (vertices, faces, normals and
+    tcoords) that are memory-mapped when reading so that a cached mesh
+    is opened almost instantly. Entries are identified by the path, the
+    modification time and the size of the source files, by the cleaning
+    tolerance and by the reordering curve. Least recently used entries are removed when the total size
+    of the cache exceeds the given limit.
+
+    The cache can be used by several threads or processes at once (entries
+    are written atomically and may be evicted by another user at any time).
+
+    Parameters
+    ----------
+    mesh_interface: object
+        Mesh reader interface (e.g. TriMeshInterface) used on cache miss
+    cache_dir: str or None
+        Cache directory (defaults to `$XDG_CACHE_HOME/meshdd` or `~/.cache/meshdd`)
+    max_size: int
+        Maximal total size of the cache in bytes
+    """
+
+    fields = ('vertices', 'faces', 'normals', 'tcoords')
+
+    def __init__(self, mesh_interface, cache_dir=None, max_size=2**33):
+        import os
+
+        if cache_dir is None:
+            cache_dir = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'meshdd')
+
+        self.mesh_interface = mesh_interface
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def get_key(self, mesh_file, normals_file=None, clean=False, tol=1e-12, reorder=None):
+        """ Returns the cache key of a mesh """
+        import os
+        import hashlib
+
+        description = []
+        for file_name in (mesh_file, normals_file):
+            if file_name is not None:
+                stat = os.stat(file_name)
+                description.append(f"{os.path.abspath(file_name)}:{stat.st_mtime_ns}:{stat.st_size}")
+        description.append(f"clean={tol if clean else None}")
+        if reorder is not None:
+            description.append(f"reorder={reorder}")
+
+        return hashlib.sha1('|'.join(description).encode()).hexdigest()
+
+    def read(self, mesh_file, normals_file=None, clean=False, tol=1e-12, reorder=None):
+        """
+        Reads a mesh from the cache, or from the file and then cache it
+
+        Parameters
+        ----------
+        mesh_file: str
+            Mesh file name
+        normals_file: str or None
+            Get normals from this mesh file instead
+        clean: bool
+            True to clean the mesh (see the `clean` method of the interfaces)
+        tol: float
+            Tolerance used when cleaning the mesh
+        reorder: str or None
+            Space-filling curve ('morton' or 'hilbert') used to reorder the
+            vertices and faces for memory locality (see `meshdd.reorder_mesh`)
+
+        Returns
+        -------
+        vertices, faces, normals, tcoords:
+            Memory-mapped arrays (copy-on-write) of the mesh, normals and tcoords
+            being None if not available
+        """
+        import os
+
+        entry_dir = os.path.join(self.cache_dir, self.get_key(mesh_file, normals_file, clean, tol, reorder))
+
+        try:
+            os.utime(entry_dir) # Marking as recently used
+            return self._load(entry_dir)
+        except FileNotFoundError:
+            pass # Not cached yet (or concurrently evicted)
+
+        # Reading and cleaning mesh
+        vertices, faces, normals, tcoords = self.mesh_interface.read(mesh_file)
+        if normals_file is not None:
+            _, _, normals, _ = self.mesh_interface.read(normals_file)
+        if clean:
+            vertices, faces, normals, tcoords = self.mesh_interface.clean(vertices, faces, normals, tcoords, tol)
+        if reorder is not None:
+            vertices, faces, normals, tcoords = reorder_mesh(vertices, faces, normals, tcoords, reorder)
+
+        self._store(entry_dir, (vertices, faces, normals, tcoords))
+        self._evict(keep=entry_dir)
+
+        return self._load(entry_dir)
+
+    def _load(self, entry_dir):
+        import os
+
+        result = []
+        for field in self.fields:
+            file_name = os.path.join(entry_dir, field + '.npy')
+            # Only normals and tcoords are optional (raises if the entry was removed meanwhile)
+            if field in ('vertices', 'faces') or os.path.exists(file_name):
+                result.append(np.load(file_name, mmap_mode='c'))
+            else:
+                result.append(None)
+
+        return tuple(result)
+
+    def _store(self, entry_dir, arrays):
+        import os
+        import shutil
+        import tempfile
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # Writing in a temporary directory first so that entries are always complete
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix='.tmp')
+        try:
+            for field, array in zip(self.fields, arrays):
+                if array is not None:
+                    np.save(os.path.join(tmp_dir, field + '.npy'), np.asarray(array))
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # e.g. entry concurrently created by another process
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def _evict(self, keep=None):
+        """ Removes least recently used entries (except keep) until the cache fits in the size limit """
+        import os
+        import shutil
+
+        def get_size(path):
+            return sum(f.stat().st_size for f in os.scandir(path))
+
+        entries = []
+        total_size = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_dir() and not entry.name.startswith('.'):
+                try:
+                    size = get_size(entry.path)
+                    if entry.path != keep:
+                        entries.append((entry.stat().st_mtime, size, entry.path))
+                except FileNotFoundError:
+                    continue # Concurrently removed
+                total_size += size
+
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total_size -= size
+
+
+class BackgroundWriter:
+    """
+    Writes meshes on a background thread using a given mesh interface
+
+    So that the next parts of a pipeline are calculated while the previous
+    ones are written. Exiting the context waits for all the writes to
+    finish and raises the first error that happened.
+
+    Written arrays must not be modified until the writes are finished.
+
+    Parameters
+    ----------
+    mesh_interface: object
+        Mesh writer interface (e.g. TriMeshInterface)
+    max_workers: int
+        Number of meshes written concurrently
+    """
+
+    def __init__(self, mesh_interface, max_workers=1):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.mesh_interface = mesh_interface
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._futures = []
+
+    def write(self, mesh_file, vertices, faces):
+        """ Schedules the writing of a mesh """
+        self._futures.append(self._executor.submit(self.mesh_interface.write, mesh_file, vertices, faces))
+
+    def wait(self):
+        """ Waits for all the scheduled writes to finish """
+        futures, self._futures = self._futures, []
+        for future in futures:
+            future.result()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.wait()
+        finally:
+            self._executor.shutdown(wait=True)
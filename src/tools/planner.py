@@ -0,0 +1,304 @@
+import os
+import sys
+import threading
+
+
+def get_available_memory():
+    """ Available physical memory in bytes (None if unknown) """
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_AVPHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def parse_size(text):
+    """ Size in bytes from a string with an optional unit (e.g. '8G', '512MB' or '1000000') """
+
+    units = {'': 1, 'K': 2**10, 'M': 2**20, 'G': 2**30, 'T': 2**40}
+    text = text.strip().upper().removesuffix('B').removesuffix('I')
+    unit = text[-1:] if text[-1:] in units else ''
+    return int(float(text[:len(text) - len(unit)]) * units[unit])
+
+
+def _format_size(nbytes):
+    """ Human readable size """
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(nbytes) < 1024:
+            return f"{nbytes:.1f} {unit}" if unit != 'B' else f"{nbytes} B"
+        nbytes /= 1024
+    return f"{nbytes:.1f} TB"
+
+
+class Plan:
+    """
+    Memory plan of a pipeline, filled instead of calculating the parts (dry run)
+
+    The pipelines (e.g. `iter_bicolor_sphere`) record the arrays that they
+    keep at each stage and predict the size of each part (see
+    `meshdd.estimate_boolean_difference`) without calculating them.
+    Arrays and parts are assumed to be kept until the end of the pipeline
+    (e.g. by a background writer) so that the peak memory is an upper bound.
+    The plan tells whether the pipeline fits in memory and how many parts
+    can be written concurrently, the chunk sizes and the number of tiles
+    being chosen at run time from a `MemoryBudget`.
+
+    Parameters
+    ----------
+    write_factor: float
+        Memory used to write a part, relatively to its size
+        (mesh libraries usually copy the arrays)
+    """
+
+    def __init__(self, write_factor=2.):
+        self.write_factor = write_factor
+        self.stages = []
+        self.parts = []
+        self.nbytes = 0
+
+    def add_stage(self, name, *arrays, temporary=()):
+        """
+        Records a stage from the arrays it keeps and its temporary arrays
+
+        Parameters
+        ----------
+        name: str
+            Stage name
+        arrays: numpy.ndarray
+            Arrays allocated by the stage and kept until the end (None are ignored)
+        temporary: list of numpy.ndarray
+            Arrays used during the stage only
+        """
+
+        nbytes = sum(a.nbytes for a in arrays if a is not None)
+        temporary_nbytes = sum(a.nbytes for a in temporary if a is not None)
+        self._add(name, nbytes, nbytes + temporary_nbytes)
+
+    def add_part(self, name, vertices_cnt, faces_cnt, nbytes, peak_nbytes=None):
+        """
+        Records a part of the pipeline output
+
+        Parameters
+        ----------
+        name: str
+            Part name
+        vertices_cnt, faces_cnt: int
+            Number of vertices and faces of the part
+        nbytes: int
+            Size of the arrays allocated for the part
+            (e.g. faces shared with the input mesh are not counted)
+        peak_nbytes: int or None
+            Peak memory used to calculate the part (nbytes if None)
+        """
+
+        self.parts.append((name, vertices_cnt, faces_cnt, nbytes))
+        self._add(name, nbytes, nbytes if peak_nbytes is None else peak_nbytes)
+
+    def _add(self, name, nbytes, peak_nbytes):
+        self.stages.append((name, nbytes, self.nbytes + peak_nbytes))
+        self.nbytes += nbytes
+
+    @property
+    def peak_nbytes(self):
+        """ Predicted peak memory of the pipeline (in bytes) """
+        return max((peak for _, _, peak in self.stages), default=0)
+
+    def fits(self, available_nbytes=None):
+        """ True if the peak memory and the writing of the largest part fit in the available memory (see `get_available_memory` if None) """
+
+        if available_nbytes is None:
+            available_nbytes = get_available_memory()
+        return available_nbytes is None or self.peak_nbytes + self._get_write_nbytes() <= available_nbytes
+
+    def get_max_writers(self, available_nbytes=None):
+        """
+        Number of parts that can be written concurrently (see `BackgroundWriter`)
+
+        Parameters
+        ----------
+        available_nbytes: int or None
+            Available memory in bytes (see `get_available_memory` if None)
+
+        Returns
+        -------
+        max_writers: int
+            Number of writers whose copies of the largest part fit in the
+            memory left by the peak of the pipeline (at least 1)
+        """
+
+        if available_nbytes is None:
+            available_nbytes = get_available_memory()
+        if available_nbytes is None:
+            return 1
+
+        write_nbytes = self._get_write_nbytes()
+        remaining_nbytes = available_nbytes - self.peak_nbytes - write_nbytes
+        max_writers = 1 + max(0, int(remaining_nbytes // max(write_nbytes, 1)))
+        return max(1, min(max_writers, len(self.parts)))
+
+    def _get_write_nbytes(self):
+        return max((self.write_factor * nbytes for *_, nbytes in self.parts), default=0)
+
+    def report(self, available_nbytes=None, file=sys.stdout):
+        """ Prints the stages, the parts and the recommended number of writers """
+
+        print("Stages:", file=file)
+        for name, nbytes, peak_nbytes in self.stages:
+            print(f"  {name:<24} kept={_format_size(nbytes):>10}  peak={_format_size(peak_nbytes):>10}", file=file)
+
+        print("Parts:", file=file)
+        for name, vertices_cnt, faces_cnt, _ in self.parts:
+            print(f"  {name:<24} #vertex={vertices_cnt} #faces={faces_cnt}", file=file)
+
+        if available_nbytes is None:
+            available_nbytes = get_available_memory()
+
+        print(f"Predicted peak memory: {_format_size(self.peak_nbytes)}", end='', file=file)
+        if available_nbytes is not None:
+            print(f" (available: {_format_size(available_nbytes)})", end='', file=file)
+        print(file=file)
+
+        if not self.fits(available_nbytes):
+            print("Not enough memory: reduce the mesh resolution or the texture size, or set a memory budget "
+                  "(--max_memory) to decode the texture at a reduced scale and displace the vertices by chunks.", file=file)
+        print(f"Recommended number of writers: {self.get_max_writers(available_nbytes)}", file=file)
+
+
+# Tracing of the allocations shared by the memory budgets (see `MemoryBudget`)
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_own_tracing = False
+
+
+def _start_tracing():
+    """ Starts tracing the allocations if needed, for one more user """
+    global _tracing_users, _own_tracing
+    import tracemalloc
+
+    with _tracing_lock:
+        if _tracing_users == 0:
+            _own_tracing = not tracemalloc.is_tracing()
+            if _own_tracing:
+                tracemalloc.start()
+        _tracing_users += 1
+
+
+def _stop_tracing():
+    """ Stops tracing the allocations when its last user stops (if started by the budgets) """
+    global _tracing_users
+    import tracemalloc
+
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0 and _own_tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+class MemoryBudget:
+    """
+    Memory budget of a pipeline, enforced by tracking the allocations of each stage
+
+    The allocations (including NumPy arrays) made after the creation of the
+    budget are traced with `tracemalloc`. The pipelines (e.g.
+    `iter_bicolor_sphere`) choose the decoding scale of the textures and the
+    chunk sizes of the core functions from the remaining memory. Before the
+    large stages, the memory predicted as for a `Plan` is reserved: a
+    MemoryError is raised before allocating it if it doesn't fit (see
+    `reserve`). Each stage is then recorded and a MemoryError is raised at
+    its end if its peak still exceeded the budget (see `check`). Tracing
+    slows down the allocation of Python objects (e.g. by the mesh writers).
+
+    Tracing is process-wide: it is shared by the budgets (started by the
+    first one and stopped when the last one is closed) and its peak is never
+    reset. Budgets can thus be used by concurrent pipelines, each budget
+    counting the allocations of the whole process since its creation (a
+    conservative limit) and the peak of a stage being only known when it
+    raises the peak of the process (the memory kept otherwise).
+
+    Parameters
+    ----------
+    nbytes: int
+        Budget in bytes
+    """
+
+    def __init__(self, nbytes):
+        import tracemalloc
+
+        self.nbytes = nbytes
+        self.stages = []
+        self._lock = threading.Lock()
+        _start_tracing()
+        self._closed = False
+        self._start_nbytes, self._peak_nbytes = tracemalloc.get_traced_memory()
+
+    def close(self):
+        """ Stops tracing the allocations (if started by the budgets and no other budget is open) """
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                _stop_tracing()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def used_nbytes(self):
+        """ Memory currently allocated since the creation of the budget (in bytes) """
+        import tracemalloc
+        return tracemalloc.get_traced_memory()[0] - self._start_nbytes
+
+    def get_available(self, fraction=1.):
+        """ Share of the remaining memory (in bytes) """
+        return max(0, int(fraction * (self.nbytes - self.used_nbytes)))
+
+    def get_chunk_size(self, item_nbytes, fraction=0.25, minimum=1024):
+        """ Number of items (e.g. rows of an array) whose temporaries fit in a share of the remaining memory """
+        return max(minimum, self.get_available(fraction) // max(1, int(item_nbytes)))
+
+    def reserve(self, name, nbytes):
+        """
+        Checks that a stage fits in the remaining memory before running it
+
+        Raises a MemoryError if the predicted memory of the stage (e.g. the
+        peak memory of a part, see `Plan.add_part`) exceeds the remaining budget.
+        """
+
+        available_nbytes = self.get_available()
+        if nbytes > available_nbytes:
+            raise MemoryError(f"Stage {name} needs about {_format_size(nbytes)}, more than the remaining "
+                              f"{_format_size(available_nbytes)} of the budget of {_format_size(self.nbytes)}!")
+
+    def check(self, name):
+        """
+        Records the memory used by a stage since the previous one
+
+        Raises a MemoryError if the peak memory of the stage exceeded the budget.
+        """
+
+        import tracemalloc
+
+        with self._lock:
+            nbytes, peak_nbytes = tracemalloc.get_traced_memory()
+
+            # The peak of the process was raised during this stage, or else the stage peak is unknown
+            stage_peak_nbytes = peak_nbytes if peak_nbytes > self._peak_nbytes else nbytes
+            self._peak_nbytes = max(self._peak_nbytes, peak_nbytes)
+
+            nbytes, peak_nbytes = nbytes - self._start_nbytes, stage_peak_nbytes - self._start_nbytes
+            self.stages.append((name, nbytes, peak_nbytes))
+
+        if peak_nbytes > self.nbytes:
+            raise MemoryError(f"Stage {name} used {_format_size(peak_nbytes)}, "
+                              f"more than the budget of {_format_size(self.nbytes)}!")
+
+    def report(self, file=sys.stdout):
+        """ Prints the memory kept and the peak memory of each stage """
+
+        print("Stages:", file=file)
+        for name, nbytes, peak_nbytes in self.stages:
+            print(f"  {name:<24} kept={_format_size(nbytes):>10}  peak={_format_size(peak_nbytes):>10}", file=file)
+
+        peak_nbytes = max((peak for _, _, peak in self.stages), default=0)
+        print(f"Peak memory: {_format_size(peak_nbytes)} (budget: {_format_size(self.nbytes)})", file=file)
@@ -0,0 +1,251 @@
+import numpy as np
+
+import meshdd
+
+# Default viewpoints (azimuth and elevation in degrees): three sides and the top
+default_views = ((0, 20), (120, 20), (240, 20), (0, 90))
+
+
+def _get_rgb(color):
+    """ RGB color in [0, 1] from a `#RRGGBB` string or a RGB(A) tuple of floats in [0, 1] """
+
+    if isinstance(color, str):
+        color = color.lstrip('#')
+        return np.array([int(color[k:k + 2], 16) for k in (0, 2, 4)]) / 255.
+    return np.asarray(color, dtype=float)[:3]
+
+
+def simplify_mesh(vertices, faces, cell_size):
+    """
+    Simplifies a mesh by vertex clustering (e.g. for display)
+
+    Vertices are merged by cells of a regular grid, at their mean position,
+    and the faces that collapse are removed. The result is not manifold in
+    general (surfaces closer than the cell size are merged) but is enough to
+    render the mesh at a resolution of about one cell per pixel.
+
+    Parameters
+    ----------
+    vertices: (n, 3) float
+        Mesh vertices
+    faces: (m, d) int
+        Mesh faces defined by vertices indexes
+    cell_size: float
+        Size of the grid cells
+
+    Returns
+    -------
+    vertices: (p, 3) float
+        Vertices of the simplified mesh
+    triangles: (k, 3) int
+        Triangles of the simplified mesh
+    """
+
+    cells = np.floor((vertices - np.amin(vertices, axis=0)) / cell_size).astype(np.int64)
+    cells_cnt = np.amax(cells, axis=0) + 1
+    _, cluster_id = np.unique(np.ravel_multi_index(cells.T, cells_cnt), return_inverse=True)
+    cluster_id = cluster_id.reshape(-1)
+
+    count = np.bincount(cluster_id)
+    vertices = np.stack([np.bincount(cluster_id, weights=vertices[:, k]) / count for k in range(3)], axis=1)
+
+    triangles = cluster_id[meshdd.triangulate_faces(faces)]
+    triangles = triangles[(triangles[:, 0] != triangles[:, 1])
+                          & (triangles[:, 1] != triangles[:, 2])
+                          & (triangles[:, 2] != triangles[:, 0])]
+
+    return vertices, triangles
+
+
+def get_view_matrix(azimuth, elevation):
+    """
+    Rotation from the mesh coordinates to the view coordinates (right, up, towards the viewer)
+
+    The viewer looks at the origin from the given azimuth and elevation (in degrees), the z axis being up.
+    """
+
+    azimuth, elevation = np.radians(azimuth), np.radians(elevation)
+    towards = np.array([np.cos(elevation) * np.cos(azimuth), np.cos(elevation) * np.sin(azimuth), np.sin(elevation)])
+    right = np.array([-np.sin(azimuth), np.cos(azimuth), 0.])
+    return np.stack((right, np.cross(towards, right), towards))
+
+
+def rasterize(points, triangles, colors, shape, background=1., max_pixels=2**22):
+    """
+    Renders triangles with a depth buffer
+
+    Each triangle is expanded to the pixels of its bounding box, the pixels
+    inside the triangle keep their depth (interpolated from the vertices) and
+    the nearest triangle is kept for each pixel. Triangles are processed by
+    chunks of at most max_pixels candidate pixels.
+
+    Parameters
+    ----------
+    points: (n, 3) float
+        Vertices in pixel coordinates (column, row and depth, the nearest being the smallest)
+    triangles: (m, 3) int
+        Triangles defined by vertices indexes
+    colors: (m, 3) float
+        Color of each triangle in [0, 1]
+    shape: (int, int)
+        Image shape (rows, columns)
+    background: float or (3) float
+        Background color in [0, 1]
+    max_pixels: int
+        Maximal number of candidate pixels per chunk
+
+    Returns
+    -------
+    image: (rows, columns, 3) uint8
+        Rendered image
+    """
+
+    height, width = shape
+    depth = np.full(height * width, np.inf)
+    image = np.empty((height * width, 3))
+    image[:] = background
+
+    # Bounding boxes of the triangles, in pixels (centers at integer coordinates)
+    corners = [points[triangles[:, k]] for k in range(3)]
+    lower = np.ceil(np.minimum(np.minimum(corners[0][:, :2], corners[1][:, :2]), corners[2][:, :2]))
+    upper = np.floor(np.maximum(np.maximum(corners[0][:, :2], corners[1][:, :2]), corners[2][:, :2]))
+    lower = np.maximum(lower, 0).astype(np.int64)
+    upper = np.minimum(upper, [width - 1, height - 1]).astype(np.int64)
+    box_shape = np.maximum(upper - lower + 1, 0)
+    pixels_cnt = box_shape[:, 0] * box_shape[:, 1]
+
+    # Chunks of triangles with a bounded number of candidate pixels (at least one triangle per chunk)
+    cumulated = np.cumsum(pixels_cnt)
+    total = cumulated[-1] if cumulated.size > 0 else 0
+    bounds = np.unique(np.concatenate(([0], np.searchsorted(cumulated, np.arange(max_pixels, total, max_pixels)),
+                                       [triangles.shape[0]])))
+
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        counts = pixels_cnt[start:stop]
+        triangle_id = np.repeat(np.arange(start, stop), counts)
+        offset = np.arange(triangle_id.size) - np.repeat(np.cumsum(counts) - counts, counts)
+        columns = lower[triangle_id, 0] + offset % box_shape[triangle_id, 0]
+        rows = lower[triangle_id, 1] + offset // box_shape[triangle_id, 0]
+
+        # Barycentric coordinates of the pixels
+        a, b, c = (corner[triangle_id] for corner in corners)
+        area = (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            wa = ((b[:, 0] - columns) * (c[:, 1] - rows) - (b[:, 1] - rows) * (c[:, 0] - columns)) / area
+            wb = ((c[:, 0] - columns) * (a[:, 1] - rows) - (c[:, 1] - rows) * (a[:, 0] - columns)) / area
+        wc = 1. - wa - wb
+        inside = (wa >= 0) & (wb >= 0) & (wc >= 0)
+
+        pixel = (rows * width + columns)[inside]
+        z = (wa * a[:, 2] + wb * b[:, 2] + wc * c[:, 2])[inside]
+        triangle_id = triangle_id[inside]
+
+        # Nearest triangle for each pixel of the chunk, then against the depth buffer
+        order = np.lexsort((z, pixel))
+        pixel, z, triangle_id = pixel[order], z[order], triangle_id[order]
+        first = np.flatnonzero(np.diff(pixel, prepend=-1))
+        pixel, z, triangle_id = pixel[first], z[first], triangle_id[first]
+        nearer = z < depth[pixel]
+        depth[pixel[nearer]] = z[nearer]
+        image[pixel[nearer]] = colors[triangle_id[nearer]]
+
+    return np.round(np.clip(image, 0, 1) * 255).astype(np.uint8).reshape(height, width, 3)
+
+
+def render_views(bodies, size=300, views=default_views, light=(-0.3, 0.5, 1.), ambient=0.3):
+    """
+    Renders colored bodies from several viewpoints, side by side
+
+    Orthographic projections of the bodies (fitted to a sphere enclosing them)
+    with flat Lambert shading from a light attached to the viewer.
+
+    Parameters
+    ----------
+    bodies: list of (vertices, triangles, color)
+        Bodies with their vertices ((n, 3) float), triangles ((m, 3) int) and
+        color (`#RRGGBB` string or RGB tuple in [0, 1])
+    size: int
+        Size of each view in pixels
+    views: list of (float, float)
+        Azimuth and elevation of each view in degrees (see `get_view_matrix`)
+    light: (3) float
+        Light direction in view coordinates (right, up, towards the viewer)
+    ambient: float
+        Ambient light intensity in [0, 1]
+
+    Returns
+    -------
+    image: (size, len(views) * size, 3) uint8
+        Rendered views
+    """
+
+    # Bodies merged in one mesh with the unit normal and the color of each triangle
+    offsets = np.cumsum([0] + [vertices.shape[0] for vertices, _, _ in bodies])
+    vertices = np.concatenate([vertices for vertices, _, _ in bodies])
+    triangles = np.concatenate([triangles + offset for (_, triangles, _), offset in zip(bodies, offsets)])
+    colors = np.concatenate([np.tile(_get_rgb(color), (triangles.shape[0], 1)) for _, triangles, color in bodies])
+
+    a, b, c = (vertices[triangles[:, k]] for k in range(3))
+    normals = np.cross(b - a, c - a)
+    normals /= np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), np.finfo(float).tiny)
+    del a, b, c
+
+    center = (np.amin(vertices, axis=0) + np.amax(vertices, axis=0)) / 2
+    radius = max(np.sqrt(np.amax(np.sum((vertices - center) ** 2, axis=1))), np.finfo(float).tiny)
+    scale = 0.95 * (size - 1) / (2 * radius)
+
+    light = np.asarray(light, dtype=float) / np.linalg.norm(light)
+
+    images = []
+    for azimuth, elevation in views:
+        matrix = get_view_matrix(azimuth, elevation)
+        view = (vertices - center) @ matrix.T
+
+        # Flat shading (two-sided, the orientation of the faces doesn't matter)
+        lambert = np.abs(normals @ (matrix.T @ light))
+        shaded_colors = (ambient + (1 - ambient) * lambert)[:, None] * colors
+
+        # Pixel coordinates: columns to the right, rows downwards, depth away from the viewer
+        points = np.stack(((size - 1) / 2 + scale * view[:, 0], (size - 1) / 2 - scale * view[:, 1], -view[:, 2]), axis=1)
+        images.append(rasterize(points, triangles, shaded_colors, (size, size)))
+
+    return np.hstack(images)
+
+
+def iter_previewed(parts, file_name, colors, size=300, views=default_views, verbose=True):
+    """
+    Renders the parts of a pipeline in a PNG image as they are generated, see `render_views`
+
+    A simplified copy of each part (see `simplify_mesh`, one cell per pixel)
+    is kept and the parts are yielded unchanged. The image is written once
+    all parts have been generated.
+
+    Parameters
+    ----------
+    parts: iterable of (name, vertices, faces)
+        Parts of a pipeline (e.g. from `iter_bicolor_sphere`)
+    file_name: str
+        Image file name (any format supported by Pillow)
+    colors: dict
+        Color of each part by name (e.g. `meshdd.tools.bicolor_sphere.colors`)
+    size, views:
+        Size and viewpoints of the views (see `render_views`)
+    verbose: bool
+        Prints a message when writing the image
+    """
+
+    import PIL.Image
+
+    bodies = []
+    for name, vertices, faces in parts:
+        if vertices.shape[0] > 0:
+            cell_size = max(np.linalg.norm(np.ptp(vertices, axis=0)) / size, np.finfo(float).tiny)
+            bodies.append((*simplify_mesh(vertices, faces, cell_size), colors[name]))
+        yield name, vertices, faces
+
+    if verbose:
+        print(f"Writing preview {file_name}... ", end='', flush=True)
+    if bodies:
+        PIL.Image.fromarray(render_views(bodies, size, views)).save(file_name)
+    if verbose:
+        print("Done.")
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import meshdd
+from meshdd.tools import bicolor_sphere, tricolor_earth, bicolor_mesh, topo_bathy_earth
+from meshdd.tools.image_reader import read_texture
+from meshdd.tools.mesh_3mf import write_3mf
+
+# Default values for the parameters
+defaults = {
+    'host': '127.0.0.1',
+    'port': 8642,
+    'cache_size': 4096,
+    'max_pixels': 20000**2,
+}
+
+# Pipelines that can be run and the colors of their parts
+pipelines = {
+    'bicolor_sphere': (bicolor_sphere.iter_bicolor_sphere, bicolor_sphere.colors),
+    'tricolor_earth': (tricolor_earth.iter_tricolor_earth, tricolor_earth.colors),
+    'bicolor_mesh': (bicolor_mesh.iter_bicolor_mesh, bicolor_mesh.colors),
+    'topo_bathy_earth': (topo_bathy_earth.iter_topo_bathy_earth, topo_bathy_earth.colors),
+}
+
+# Pipeline parameters given as image file names
+texture_parameters = ('texture', 'topo_texture', 'bathy_texture')
+
+
+class ArrayCache:
+    """
+    Thread-safe cache of arrays with a least recently used eviction policy
+
+    Parameters
+    ----------
+    max_nbytes: int
+        Maximal total size of the cached arrays in bytes
+    """
+
+    def __init__(self, max_nbytes):
+        self.max_nbytes = max_nbytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, function):
+        """ Returns the cached value (array or tuple of arrays) for given key, calculating it if needed """
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key][0]
+            self.misses += 1
+
+        # Calculated outside of the lock so that other entries stay available
+        value = function()
+        arrays = value if isinstance(value, tuple) else (value,)
+        nbytes = sum(a.nbytes for a in arrays if a is not None)
+
+        with self._lock:
+            if key not in self._cache:
+                self._cache[key] = (value, nbytes)
+                self.nbytes += nbytes
+            while self.nbytes > self.max_nbytes and len(self._cache) > 1:
+                _, (_, evicted_nbytes) = self._cache.popitem(last=False)
+                self.nbytes -= evicted_nbytes
+
+        return value
+
+    def stats(self):
+        """ Number of entries, size, hits and misses """
+        with self._lock:
+            return {'entries': len(self._cache), 'nbytes': self.nbytes, 'hits': self.hits, 'misses': self.misses}
+
+
+def _get_file_key(file_name):
+    """ Identifies a file by its path, modification time and size """
+    stat = os.stat(file_name)
+    return os.path.abspath(file_name), stat.st_mtime_ns, stat.st_size
+
+
+class JobRunner:
+    """
+    Runs the pipelines while keeping the read textures and meshes in memory
+
+    Jobs are dictionaries with the pipeline name (`pipeline`), its
+    parameters (`parameters`, textures given as file names) and optionally
+    an output file name (`output`, written like the command-line tools) or
+    a dry run flag (`dry_run`). Textures and meshes are identified by their
+    path, modification time and size so that a modified file is read again.
+    Jobs can be run concurrently (see the thread safety section of the README).
+
+    For the `bicolor_mesh` pipeline, the mesh is given by the `mesh`
+    parameter, with optional `normals`, `clean`, `reorder` and `scale`
+    parameters (see `meshdd.tools.bicolor_mesh.main`).
+
+    Parameters
+    ----------
+    cache_nbytes: int
+        Maximal size of the textures and meshes kept in memory (in bytes)
+    max_pixels: int or None
+        Maximal number of pixels of the read images
+    mesh_interface: object or None
+        Mesh reader/writer interface (fastest installed backend if None, see `meshdd.tools.AutoInterface`)
+    """
+
+    def __init__(self, cache_nbytes=defaults['cache_size'] * 2**20, max_pixels=defaults['max_pixels'], mesh_interface=None):
+        self.textures = ArrayCache(cache_nbytes // 2)
+        self.meshes = ArrayCache(cache_nbytes // 2)
+        self.max_pixels = max_pixels
+        self.mesh_interface = mesh_interface if mesh_interface is not None else meshdd.tools.get_mesh_interface()
+
+    def read_texture(self, file_name):
+        """ Texture from an image file, see `meshdd.tools.read_texture` """
+        return self.textures.get(_get_file_key(file_name),
+                                 lambda: read_texture(file_name, self.max_pixels))
+
+    def read_mesh(self, mesh_file, normals_file=None, clean=False, reorder=None):
+        """ Vertices, faces, normals and tcoords of a mesh file, see `meshdd.tools.MeshCache.read` """
+
+        def read():
+            vertices, faces, normals, tcoords = self.mesh_interface.read(mesh_file)
+            if normals_file is not None:
+                _, _, normals, _ = self.mesh_interface.read(normals_file)
+            if clean:
+                vertices, faces, normals, tcoords = self.mesh_interface.clean(vertices, faces, normals, tcoords)
+            if reorder is not None:
+                vertices, faces, normals, tcoords = meshdd.tools.reorder_mesh(vertices, faces, normals, tcoords, reorder)
+            return vertices, faces, normals, tcoords
+
+        key = (_get_file_key(mesh_file), normals_file and _get_file_key(normals_file), clean, reorder)
+        return self.meshes.get(key, read)
+
+    def iter_parts(self, pipeline, parameters, plan=None):
+        """ Yields the parts (name, vertices, faces) of a pipeline, see the `iter_*` functions """
+
+        assert pipeline in pipelines, "Unknown pipeline!"
+        iter_pipeline, _ = pipelines[pipeline]
+        parameters = dict(parameters)
+
+        for name in texture_parameters:
+            if isinstance(parameters.get(name), str):
+                parameters[name] = self.read_texture(parameters[name])
+
+        args = ()
+        if pipeline == 'bicolor_mesh':
+            vertices, faces, normals, tcoords = self.read_mesh(parameters.pop('mesh'),
+                                                               parameters.pop('normals', None),
+                                                               parameters.pop('clean', False),
+                                                               parameters.pop('reorder', None))
+            assert tcoords is not None and normals is not None, "Missing texture coordinates or normals!"
+            vertices = vertices * parameters.pop('scale', bicolor_mesh.defaults['scale']) # Cached vertices are kept unchanged
+            args = (vertices, faces, normals, tcoords, parameters.pop('texture'))
+
+        return iter_pipeline(*args, plan=plan, **parameters)
+
+    def run(self, job):
+        """
+        Runs a job
+
+        Returns
+        -------
+        result: dict or list
+            Summary of the written (or predicted, for a dry run) parts if an
+            output is given, or else the list of the parts (name, vertices, faces)
+        """
+
+        pipeline = job['pipeline']
+        parameters = job.get('parameters', {})
+        output = job.get('output')
+
+        # Dry run: predicted sizes
+        if job.get('dry_run', False):
+            plan = meshdd.tools.Plan()
+            for _ in self.iter_parts(pipeline, parameters, plan):
+                pass
+            return {
+                'parts': [{'name': name, 'vertices': vertices_cnt, 'faces': faces_cnt}
+                          for name, vertices_cnt, faces_cnt, _ in plan.parts],
+                'peak_nbytes': plan.peak_nbytes,
+            }
+
+        parts = self.iter_parts(pipeline, parameters)
+        if output is None:
+            return list(parts)
+
+        # Writing parts like the command-line tools
+        summary = []
+        filename_prefix, filename_extension = os.path.splitext(output)
+        if filename_extension == '.3mf':
+            _, colors = pipelines[pipeline]
+            bodies = [(name, vertices, faces, colors[name]) for name, vertices, faces in parts]
+            write_3mf(output, bodies)
+            summary = [{'name': name, 'file': output, 'vertices': vertices.shape[0], 'faces': faces.shape[0]}
+                       for name, vertices, faces, _ in bodies]
+        else:
+            with meshdd.tools.BackgroundWriter(self.mesh_interface) as writer:
+                for name, vertices, faces in parts:
+                    file_name = filename_prefix + "_" + name + filename_extension
+                    writer.write(file_name, vertices, faces)
+                    summary.append({'name': name, 'file': file_name, 'vertices': vertices.shape[0], 'faces': faces.shape[0]})
+
+        return {'parts': summary}
+
+    def stats(self):
+        """ Statistics of the textures and meshes caches """
+        return {'textures': self.textures.stats(), 'meshes': self.meshes.stats()}
+
+
+def create_server(runner, host=defaults['host'], port=defaults['port'], socket_file=None):
+    """
+    HTTP server running the jobs of a `JobRunner`
+
+    `POST /jobs` runs the job given as JSON in the request body and returns a
+    JSON summary (output or dry run) or else the parts as a NumPy `.npz`
+    archive (`<name>_vertices` and `<name>_faces` arrays). `GET /status`
+    returns the cache statistics. Requests are handled in separate threads.
+
+    Parameters
+    ----------
+    runner: JobRunner
+        Runner of the jobs
+    host, port: str, int
+        Address of the server (local only by default)
+    socket_file: str or None
+        Listen on this Unix socket instead
+    """
+
+    import io
+    import socketserver
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def address_string(self):
+            return self.client_address[0] if self.client_address else socket_file
+
+        def _send(self, code, body, content_type='application/json'):
+            if content_type == 'application/json':
+                body = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path != '/status':
+                return self._send(404, {'error': "Unknown path!"})
+            self._send(200, runner.stats())
+
+        def do_POST(self):
+            if self.path != '/jobs':
+                return self._send(404, {'error': "Unknown path!"})
+
+            try:
+                job = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                result = runner.run(job)
+            except Exception as error:
+                return self._send(400, {'error': f"{type(error).__name__}: {error}"})
+
+            if isinstance(result, dict):
+                return self._send(200, result)
+
+            buffer = io.BytesIO()
+            np.savez(buffer, **{f"{name}_{field}": array
+                                for name, vertices, faces in result
+                                for field, array in (('vertices', vertices), ('faces', faces))})
+            self._send(200, buffer.getvalue(), 'application/octet-stream')
+
+    if socket_file is None:
+        return ThreadingHTTPServer((host, port), Handler)
+
+    class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    return UnixHTTPServer(socket_file, Handler)
+
+
+def main():
+    import argparse
+
+    # Command-line parameters
+    parser = argparse.ArgumentParser(
+        description="Serve the pipelines while keeping the textures and meshes in memory between jobs",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--host", type=str, default=defaults['host'],
+                        help="Address of the HTTP server")
+    parser.add_argument("--port", type=int, default=defaults['port'],
+                        help="Port of the HTTP server")
+    parser.add_argument("--socket", type=str, default='',
+                        help="Listen on this Unix socket instead of a TCP port")
+    parser.add_argument("--cache_size", type=float, default=defaults['cache_size'],
+                        help="Maximal size of the textures and meshes kept in memory (in MB)")
+    parser.add_argument("--max_pixels", type=int, default=defaults['max_pixels'],
+                        help="Maximal number of pixels of the texture images")
+    parser.add_argument("--backend", type=str, default='auto',
+                        choices=['auto'] + list(meshdd.tools.backends.interfaces),
+                        help="Mesh library used to read and write the meshes (auto: fastest installed one, measured once)")
+    options = parser.parse_args()
+
+    runner = JobRunner(int(options.cache_size * 2**20), options.max_pixels,
+                       meshdd.tools.get_mesh_interface(options.backend))
+    server = create_server(runner, options.host, options.port, options.socket or None)
+
+    print(f"Serving on {options.socket or f'http://{options.host}:{options.port}'} (Ctrl+C to stop).")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if options.socket:
+            os.remove(options.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-def create_sphere(Nphi, Ntheta):
+def create_sphere(Nphi, Ntheta, quads=False):
     """
     Generates the mesh of an UV sphere
 
@@ -8,12 +8,16 @@ def create_sphere(Nphi, Ntheta):
         Number of discretization points for the longitude
     Ntheta: int
         Number of discretization points for the latitude
+    quads: bool
+        True to generate quadrangles instead of pairs of triangles (half the
+        faces, the triangles at the poles repeating their last vertex),
+        see `meshdd.triangulate_faces`
 
     Returns
     -------
     vertices: (n, 3) float
         Vertices of the sphere mesh
-    faces: (m, 3) int
+    faces: (m, 3) or (m, 4) int
         Vertices index composing each face
     normals: (n, 3) float
         Sphere normal for each vertice
@@ -45,6 +49,9 @@ def create_sphere(Nphi, Ntheta):
     vertices[:, 1] = np.cos(tcoords[:, 1]) * np.sin(tcoords[:, 0])
     vertices[:, 2] = np.sin(tcoords[:, 1])
 
+    if quads:
+        return vertices, _create_sphere_quads(phi.size, theta.size), vertices.copy(), (tcoords + [0, np.pi/2]) / [2*np.pi, np.pi]
+
     # Assembling triangles
     triangles = np.empty((num_triangles, 3), dtype=np.int64)
 
@@ -74,7 +81,36 @@ def create_sphere(Nphi, Ntheta):
     return vertices, triangles, vertices.copy(), (tcoords + [0, np.pi/2]) / [2*np.pi, np.pi]
 
 
-def create_torus(Nx, Ny, R=1., r=0.4):
+def _create_sphere_quads(Nphi, Ntheta):
+    """ Quadrangles of an UV sphere with Nphi x Ntheta vertices besides the poles (see `create_sphere`) """
+
+    import numpy as np
+
+    num_vertices = Nphi * Ntheta + 2
+    middle_size = Nphi * (Ntheta - 1)
+    quads = np.empty((2 * Nphi + middle_size, 4), dtype=np.int64)
+
+    # South pole (triangles)
+    quad_archetype = np.array([0, 2, 1, 1], dtype=np.int64)
+    quads[:Nphi, :] = quad_archetype + np.arange(Nphi).reshape(-1, 1)
+    quads[:Nphi, 0] = 0
+    quads[Nphi-1, 1] -= Nphi
+
+    # Middle part (same diagonals as the triangles)
+    quad_archetype = 1 + np.array([Nphi, 0, 1, 1 + Nphi], dtype=np.int64)
+    quads[Nphi:Nphi + middle_size, :] = quad_archetype + np.arange(middle_size).reshape(-1, 1)
+    quads[2*Nphi-1:Nphi + middle_size:Nphi, 2:4] -= Nphi
+
+    # North pole (triangles)
+    quad_archetype = middle_size + 1 + np.array([0, 1, 0, 0], dtype=np.int64)
+    quads[-Nphi:, :] = quad_archetype + np.arange(Nphi).reshape(-1, 1)
+    quads[-Nphi:, 2:4] = num_vertices - 1
+    quads[-1, 1] -= Nphi
+
+    return quads
+
+
+def create_torus(Nx, Ny, R=1., r=0.4, quads=False):
     """
     Generates the mesh of a torus
 
@@ -88,12 +124,14 @@ def create_torus(Nx, Ny, R=1., r=0.4):
         The major radius
     r: float
         The minor radius
+    quads: bool
+        True to generate quadrangles instead of pairs of triangles (half the faces)
 
     Returns
     -------
     vertices: (n, 3) float
         Vertices of the torus mesh
-    faces: (m, 3) int
+    faces: (m, 3) or (m, 4) int
         Vertices index composing each face
     normals: (n, 3) float
         Sphere normal for each vertice
@@ -127,6 +165,13 @@ def create_torus(Nx, Ny, R=1., r=0.4):
     normals[:, 1] = np.cos(tcoords[:, 1]) * np.sin(tcoords[:, 0])
     normals[:, 2] = np.sin(tcoords[:, 1])
 
+    # Assembling quadrangles (same diagonals as the triangles)
+    if quads:
+        quads = np.array([Nx, 0, 1, Nx + 1], dtype=np.int64) + np.arange(num_vertices).reshape(-1, 1)
+        quads[Nx - 1::Nx, 2:] -= Nx
+        quads[-Nx:, [0, 3]] -= num_vertices
+        return vertices, quads, normals, tcoords / (2 * np.pi)
+
     # Assembling triangles
     triangles = np.empty((num_triangles, 3), dtype=np.int64)
 
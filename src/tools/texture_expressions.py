@@ -0,0 +1,284 @@
+import abc
+
+import numpy as np
+
+import meshdd
+from meshdd.tools.texture_sampler import TextureSampler
+
+
+def _reflect_index(index, size):
+    """
+    Maps pixel indexes that are outside [0, size) back into the texture
+
+    Uses the half-sample symmetric reflection (d c b a | a b c d | d c b a),
+    i.e. the default 'reflect' mode of `scipy.ndimage`.
+    """
+
+    index = np.mod(index, 2 * size)
+    return np.where(index >= size, 2 * size - 1 - index, index)
+
+
+def _gaussian_kernel(sigma, truncate):
+    """ Normalized 1D Gaussian kernel, same as `scipy.ndimage.gaussian_filter` """
+
+    radius = int(truncate * sigma + 0.5)
+    if radius == 0:
+        return np.ones(1)
+
+    x = np.arange(-radius, radius + 1)
+    kernel = np.exp(-0.5 / sigma**2 * x**2)
+    return kernel / kernel.sum()
+
+
+class TextureExpression(abc.ABC):
+    """
+    Lazy expression built from textures and evaluated at given pixels only.
+
+    Expressions are built using the usual arithmetic and comparison operators
+    (except `==` and `!=`), the logical operators `&`, `|` and `~`,
+    and the methods below. Nothing is calculated until `sample` (or `evaluate`)
+    is called so that the work is proportional to the number of sampled
+    vertices instead of the number of pixels in the texture.
+
+    Texture values are indexed like the texture arrays: the two first axes
+    are the pixel position and the remaining axes are the channels.
+    Subclasses implement `evaluate`.
+    """
+
+    #: Spatial shape (p, q) of the textures involved in the expression
+    shape = None
+
+    #: Number of pixels evaluated per sampled pixel
+    footprint = 1
+
+    @abc.abstractmethod
+    def evaluate(self, i, j):
+        """
+        Evaluates the expression at given pixels
+
+        Parameters
+        ----------
+        i: (...) int
+            Pixel indexes along the first texture axis
+        j: (...) int
+            Pixel indexes along the second texture axis (broadcastable with i)
+
+        Returns
+        -------
+        values: (..., ...) any
+            Expression value at each pixel, followed by the channel axes
+        """
+
+    def sample(self, tcoords, max_pixels=2**22):
+        """
+        Evaluates the expression at given texture coordinates
+
+        Texture coordinates are mapped to pixels like in
+        `meshdd.get_vertex_color_from_texture`.
+
+        Parameters
+        ----------
+        tcoords: (n, 2) float or TextureSampler
+            Texture coordinates for each vertice (or a sampler that caches
+            the corresponding pixel indexes)
+        max_pixels: int
+            Maximal number of pixels evaluated at once (bounds the memory
+            used by the windows of the smoothing operators)
+
+        Returns
+        -------
+        vertex_color: (n,) any
+            Expression sampled at each texture coordinate
+        """
+
+        if isinstance(tcoords, TextureSampler):
+            i, j = tcoords.get_indexes(self.shape)
+        else:
+            i, j = meshdd.get_texture_indexes(tcoords, self.shape)
+
+        step = max(1, max_pixels // self.footprint)
+        if i.size <= step:
+            return self.evaluate(i, j)
+
+        return np.concatenate([self.evaluate(i[k:k + step], j[k:k + step])
+                               for k in range(0, i.size, step)])
+
+    # Channels
+    def channel(self, key):
+        """ Selects channels (e.g. `-1` or `slice(0, 2)`) """
+        return _Unary(lambda values: values[..., key], self)
+
+    def mean(self):
+        """ Mean over the last channel axis """
+        return _Unary(lambda values: np.mean(values, axis=-1), self)
+
+    def max(self):
+        """ Maximum over the last channel axis """
+        return _Unary(lambda values: np.max(values, axis=-1), self)
+
+    def min(self):
+        """ Minimum over the last channel axis """
+        return _Unary(lambda values: np.min(values, axis=-1), self)
+
+    def astype(self, dtype):
+        """ Casts the values to given datatype """
+        return _Unary(lambda values: values.astype(dtype), self)
+
+    # Smoothing
+    def gaussian(self, sigma, truncate=4.):
+        """
+        Gaussian blur along the two pixel axes
+
+        Same as `scipy.ndimage.gaussian_filter` in 'reflect' mode but
+        calculated on a local window around each evaluated pixel.
+
+        Parameters
+        ----------
+        sigma: float or (2,) float
+            Standard deviation of the Gaussian kernel
+        truncate: float
+            Truncate the kernel at this many standard deviations
+        """
+        return _Gaussian(self, sigma, truncate)
+
+    # Operators
+    def __neg__(self):
+        return _Unary(np.negative, self)
+
+    def __invert__(self):
+        return _Unary(np.invert, self)
+
+    def __add__(self, other):
+        return _Binary(np.add, self, other)
+
+    def __radd__(self, other):
+        return _Binary(np.add, other, self)
+
+    def __sub__(self, other):
+        return _Binary(np.subtract, self, other)
+
+    def __rsub__(self, other):
+        return _Binary(np.subtract, other, self)
+
+    def __mul__(self, other):
+        return _Binary(np.multiply, self, other)
+
+    def __rmul__(self, other):
+        return _Binary(np.multiply, other, self)
+
+    def __truediv__(self, other):
+        return _Binary(np.true_divide, self, other)
+
+    def __rtruediv__(self, other):
+        return _Binary(np.true_divide, other, self)
+
+    def __and__(self, other):
+        return _Binary(np.bitwise_and, self, other)
+
+    def __rand__(self, other):
+        return _Binary(np.bitwise_and, other, self)
+
+    def __or__(self, other):
+        return _Binary(np.bitwise_or, self, other)
+
+    def __ror__(self, other):
+        return _Binary(np.bitwise_or, other, self)
+
+    def __lt__(self, other):
+        return _Binary(np.less, self, other)
+
+    def __le__(self, other):
+        return _Binary(np.less_equal, self, other)
+
+    def __gt__(self, other):
+        return _Binary(np.greater, self, other)
+
+    def __ge__(self, other):
+        return _Binary(np.greater_equal, self, other)
+
+
+class LazyTexture(TextureExpression):
+    """
+    Texture leaf of a lazy texture expression
+
+    Parameters
+    ----------
+    texture: (p, q,) any
+        Array of the texture color (see `meshdd.get_texture_from_image`)
+    """
+
+    def __init__(self, texture):
+        self.texture = texture
+        self.shape = texture.shape[:2]
+
+    def evaluate(self, i, j):
+        return self.texture[i, j, ...]
+
+
+class _Constant(TextureExpression):
+    """ Scalar or array broadcasted over the pixels """
+
+    def __init__(self, value):
+        self.value = value
+
+    def evaluate(self, i, j):
+        return self.value
+
+
+def _as_expression(value):
+    return value if isinstance(value, TextureExpression) else _Constant(value)
+
+
+class _Unary(TextureExpression):
+    """ Function applied on the values of an expression """
+
+    def __init__(self, function, operand):
+        self.function = function
+        self.operand = operand
+        self.shape = operand.shape
+        self.footprint = operand.footprint
+
+    def evaluate(self, i, j):
+        return self.function(self.operand.evaluate(i, j))
+
+
+class _Binary(TextureExpression):
+    """ Function applied on the values of two expressions """
+
+    def __init__(self, function, left, right):
+        self.function = function
+        self.left = _as_expression(left)
+        self.right = _as_expression(right)
+
+        shapes = [e.shape for e in (self.left, self.right) if e.shape is not None]
+        assert all(s == shapes[0] for s in shapes), "Textures must have the same size!"
+        self.shape = shapes[0] if shapes else None
+        self.footprint = self.left.footprint + self.right.footprint
+
+    def evaluate(self, i, j):
+        return self.function(self.left.evaluate(i, j), self.right.evaluate(i, j))
+
+
+class _Gaussian(TextureExpression):
+    """ Gaussian blur calculated on a window around each evaluated pixel """
+
+    def __init__(self, operand, sigma, truncate):
+        assert operand.shape is not None, "Cannot smooth a constant expression!"
+        self.operand = operand
+        self.shape = operand.shape
+        self.kernels = [_gaussian_kernel(s, truncate) for s in np.broadcast_to(sigma, 2)]
+        self.footprint = operand.footprint * self.kernels[0].size * self.kernels[1].size
+
+    def evaluate(self, i, j):
+        i, j = np.broadcast_arrays(i, j)
+        ndim = i.ndim
+
+        # Window of pixels around each evaluated pixel
+        ri, rj = (k.size // 2 for k in self.kernels)
+        ii = _reflect_index(i[..., None, None] + np.arange(-ri, ri + 1)[:, None], self.shape[0])
+        jj = _reflect_index(j[..., None, None] + np.arange(-rj, rj + 1), self.shape[1])
+        values = self.operand.evaluate(ii, jj)
+
+        # Separable convolution on the window axes
+        values = np.tensordot(values, self.kernels[1], axes=([ndim + 1], [0]))
+        return np.tensordot(values, self.kernels[0], axes=([ndim], [0]))
@@ -0,0 +1,145 @@
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+
+import meshdd
+
+
+class TextureSampler:
+    """
+    Samples textures at fixed texture coordinates.
+
+    The pixel indexes (and bilinear weights) only depend on the texture
+    coordinates and on the texture shape so that they are calculated once per
+    shape and cached, with a least recently used eviction policy.
+
+    A sampler can be shared between threads (the cache is protected by a lock).
+
+    Parameters
+    ----------
+    tcoords: (n, 2) float
+        Texture coordinates for each vertice
+    cache_size: int
+        Maximal number of cached entries (one per texture shape and interpolation kind)
+    """
+
+    def __init__(self, tcoords, cache_size=4):
+        self.tcoords = tcoords
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = Lock()
+
+    def _cached(self, key, function):
+        """ Returns cached value for given key, calculating it if needed """
+        with self._lock:
+            try:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+            except KeyError:
+                pass
+
+        # Calculated outside of the lock (concurrent calculations give the same value)
+        value = function()
+        with self._lock:
+            self._cache[key] = value
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        return value
+
+    def get_indexes(self, shape):
+        """
+        Pixel indexes of the texture coordinates, see `meshdd.get_texture_indexes`
+
+        Parameters
+        ----------
+        shape: (p, q,) int
+            Shape of the texture (only the two first dimensions are used)
+
+        Returns
+        -------
+        i: (n,) int
+            Pixel index along the first texture axis
+        j: (n,) int
+            Pixel index along the second texture axis
+        """
+
+        shape = tuple(shape[:2])
+        return self._cached(('nearest', shape),
+                            lambda: meshdd.get_texture_indexes(self.tcoords, shape))
+
+    def get_bilinear_weights(self, shape):
+        """
+        Pixel indexes and weights for a bilinear interpolation
+
+        Pixel centers are located at `(k + 0.5) / size` and the texture is
+        extended by its border values.
+
+        Parameters
+        ----------
+        shape: (p, q,) int
+            Shape of the texture (only the two first dimensions are used)
+
+        Returns
+        -------
+        i: (2, n) int
+            Lower and upper pixel indexes along the first texture axis
+        j: (2, n) int
+            Lower and upper pixel indexes along the second texture axis
+        weights: (2, 2, n) float
+            Weight of each of the four neighbour pixels
+        """
+
+        def calculate():
+            size = np.asarray(shape[:2])
+            position = self.tcoords * size - 0.5
+            lower = np.floor(position)
+            ratio = position - lower
+
+            lower = lower.astype(np.int64)
+            indexes = np.clip(np.stack((lower, lower + 1)), 0, size - 1)
+            weights = np.stack((1 - ratio, ratio))
+
+            return (indexes[:, :, 0],
+                    indexes[:, :, 1],
+                    weights[:, None, :, 0] * weights[None, :, :, 1])
+
+        return self._cached(('bilinear', tuple(shape[:2])), calculate)
+
+    def sample(self, *textures, interpolation='nearest'):
+        """
+        Samples one or more textures at the texture coordinates
+
+        Textures of the same shape share the same pixel indexes so that
+        sampling several of them costs a single index calculation.
+
+        Parameters
+        ----------
+        textures: (p, q,) any
+            Arrays of the texture color
+        interpolation: str
+            'nearest' (same as `meshdd.get_vertex_color_from_texture`)
+            or 'bilinear'
+
+        Returns
+        -------
+        vertex_color: (n,) any
+            Texture sampled at each texture coordinate (a tuple if more than
+            one texture is given)
+        """
+
+        assert interpolation in ('nearest', 'bilinear'), "Unknown interpolation kind!"
+
+        result = []
+        for texture in textures:
+            if interpolation == 'nearest':
+                i, j = self.get_indexes(texture.shape)
+                result.append(texture[i, j, ...])
+            else:
+                i, j, weights = self.get_bilinear_weights(texture.shape)
+                weights = weights.reshape(weights.shape + (1,) * (texture.ndim - 2))
+                result.append(sum(weights[a, b] * texture[i[a], j[b], ...]
+                                  for a in range(2) for b in range(2)))
+
+        return result[0] if len(result) == 1 else tuple(result)
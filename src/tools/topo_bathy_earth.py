@@ -4,6 +4,9 @@ import numpy as np
 
 import meshdd
 from meshdd.tools import shapes
+from meshdd.tools.image_reader import read_texture
+from meshdd.tools.texture_sampler import TextureSampler
+from meshdd.tools.mesh_3mf import write_3mf
 
 # Default values for the parameters
 # Tuned for https://visibleearth.nasa.gov/images/73963
@@ -21,105 +24,235 @@ defaults = {
     'bathy_threshold': 5,
     'bathy_reverse': True,
     'bathy_sigma': 10,
+    'smoothing': 'texture',
+    'max_pixels': 20000**2,
 }
 
+# Colors of each part when exporting to 3MF
+colors = {
+    'land': '#8C7850',
+    'sea': '#2850A0',
+}
 
-def create_topo_bathy_earth(topo_texture, bathy_texture,
-                            Ntheta=defaults['Ntheta'],
-                            Nphi=defaults['Nphi'],
-                            radius=defaults['radius'],
-                            topo_depth=defaults['topo_depth'],
-                            topo_threshold=defaults['topo_threshold'],
-                            topo_reverse=defaults['topo_reverse'],
-                            topo_sigma=defaults['topo_sigma'],
-                            bathy_depth=defaults['bathy_depth'],
-                            bathy_threshold=defaults['bathy_threshold'],
-                            bathy_reverse=defaults['bathy_reverse'],
-                            bathy_sigma=defaults['bathy_sigma'],
-                            verbose=False):
+
+def iter_topo_bathy_earth(topo_texture, bathy_texture,
+                          Ntheta=defaults['Ntheta'],
+                          Nphi=defaults['Nphi'],
+                          radius=defaults['radius'],
+                          topo_depth=defaults['topo_depth'],
+                          topo_threshold=defaults['topo_threshold'],
+                          topo_reverse=defaults['topo_reverse'],
+                          topo_sigma=defaults['topo_sigma'],
+                          bathy_depth=defaults['bathy_depth'],
+                          bathy_threshold=defaults['bathy_threshold'],
+                          bathy_reverse=defaults['bathy_reverse'],
+                          bathy_sigma=defaults['bathy_sigma'],
+                          smoothing=defaults['smoothing'],
+                          min_area=None,
+                          max_pixels=defaults['max_pixels'],
+                          oversampling=None,
+                          quads=False,
+                          plan=None,
+                          memory_budget=None,
+                          verbose=False):
     """
     From topography and bathymetry textures, split land and sea and displace
     following the depth and altitude.
+
+    Yields each part as (name, vertices, faces) as soon as it is calculated
+    (sea and then land).
+
+    The textures are smoothed with a Gaussian blur (smoothing set to
+    'texture') or with its approximation by a Laplacian smoothing of the
+    sampled values on the mesh (smoothing set to 'mesh', much faster for
+    large textures), see `meshdd.smooth_vertices_values`.
+
+    Set min_area to remove the islands and lakes of the sea mask smaller than
+    this area, see `meshdd.remove_small_components`.
+
+    Texture images with more than max_pixels pixels are refused (None for
+    no limit, e.g. if the images are from a trusted source).
+
+    Set oversampling to read the texture image at a reduced scale (JPEG or
+    pyramidal TIFF) keeping this number of pixels per mesh edge, see
+    `meshdd.get_texture_resolution` and `meshdd.tools.read_texture`.
+
+    Set quads to True to use a mesh of quadrangles (half the faces, see
+    `meshdd.tools.shapes.create_sphere`), triangulated when writing.
+
+    Set plan to a `meshdd.tools.Plan` to predict the size of the parts
+    instead of calculating them (dry run, nothing is yielded).
+
+    Set memory_budget to a `meshdd.tools.MemoryBudget` to decode the
+    texture at a reduced scale if it doesn't fit, displace the vertices by
+    chunks, check before the displacement and the difference that their
+    predicted memory fits (see `meshdd.tools.MemoryBudget.reserve`) and check
+    the memory used by each stage.
     """
 
-    from scipy.ndimage.filters import gaussian_filter
+    assert smoothing in ('texture', 'mesh'), "Unknown smoothing kind!"
 
     # Verbose messages
     def info(*args, **kwargs):
         if verbose:
             print(*args, **kwargs)
 
+    # Memory used by each stage, and predicted memory checked before the large ones
+    def check(stage):
+        if memory_budget is not None:
+            memory_budget.check(stage)
+
+    def reserve(stage, nbytes):
+        if memory_budget is not None:
+            memory_budget.reserve(stage, nbytes)
+
     # Creating sphere mesh
     info("Creating sphere mesh... ", end='', flush=True)
-    vertices, faces, normals, tcoords = shapes.create_sphere(Ntheta, Nphi)
+    vertices, faces, normals, tcoords = shapes.create_sphere(Ntheta, Nphi, quads)
     vertices *= radius
+    sampler = TextureSampler(tcoords)
     info("Done.")
+    check("mesh")
 
-    def read_texture(file_name):
-        import imageio
-        import PIL.Image
-        PIL.Image.MAX_IMAGE_PIXELS = 20000**2 # Should also be None if the image is from trusted source...
-        return meshdd.get_texture_from_image(imageio.imread(file_name))
-
-    from scipy.ndimage.filters import gaussian_filter
+    # Sigmas are given in pixels of the full resolution images
+    min_shape = None if oversampling is None else meshdd.get_texture_resolution(tcoords, faces, oversampling)
 
     # Reading topography texture image if needed
     if type(topo_texture) is str:
         info("Reading topography texture... ", end='', flush=True)
-        topo_texture = read_texture(topo_texture)
+        max_nbytes = None if memory_budget is None else memory_budget.get_available(0.25)
+        topo_texture, scale = read_texture(topo_texture, max_pixels, min_shape, return_scale=True, max_nbytes=max_nbytes)
+        topo_sigma = None if topo_sigma is None else topo_sigma * scale
         info("Done.")
-
-    if topo_reverse:
-        topo_texture = 255 - topo_texture
+        check("topography texture")
 
     # Reading bathymetry texture image if needed
     if type(bathy_texture) is str:
         info("Reading bathymetry texture... ", end='', flush=True)
-        bathy_texture = read_texture(bathy_texture)
+        max_nbytes = None if memory_budget is None else memory_budget.get_available(0.25)
+        bathy_texture, scale = read_texture(bathy_texture, max_pixels, min_shape, return_scale=True, max_nbytes=max_nbytes)
+        bathy_sigma = None if bathy_sigma is None else bathy_sigma * scale
         info("Done.")
-
-    if bathy_reverse:
-        bathy_texture = 255 - bathy_texture
+        check("bathymetry texture")
 
     # Smoothing textures
-    info("Smoothing textures... ", end='', flush=True)
-    if topo_sigma is not None:
-        topo_texture = gaussian_filter(topo_texture.astype(float), sigma=topo_sigma)
-    if bathy_sigma is not None:
-        bathy_texture = gaussian_filter(bathy_texture.astype(float), sigma=bathy_sigma)
-    info("Done.")
+    # The values are reversed along with the conversion to float, or else only once sampled
+    if smoothing == 'texture':
+        info("Smoothing textures... ", end='', flush=True)
+        from scipy.ndimage.filters import gaussian_filter
+
+        def blur(texture, sigma, reverse):
+            if memory_budget is None:
+                return gaussian_filter(255. - texture if reverse else texture.astype(float), sigma=sigma)
+            # Single precision, filtering the integer values directly
+            return gaussian_filter(np.subtract(255, texture, dtype=np.float32) if reverse else texture,
+                                   sigma=sigma, output=np.float32)
+
+        if topo_sigma is not None:
+            topo_texture = blur(topo_texture, topo_sigma, topo_reverse)
+            topo_reverse = False
+        if bathy_sigma is not None:
+            bathy_texture = blur(bathy_texture, bathy_sigma, bathy_reverse)
+            bathy_reverse = False
+        info("Done.")
+        check("smoothing")
+
+    def get_displacement(texture, sigma, reverse, threshold, depth):
+        vertex_color = sampler.sample(texture)
+        if reverse:
+            vertex_color = 255 - vertex_color
+
+        # Smoothing on the mesh
+        if smoothing == 'mesh' and sigma is not None:
+            vertex_color = meshdd.map_vertex_color(vertex_color, lambda value: value)
+            iterations = meshdd.get_smoothing_iterations(tcoords * texture.shape[:2], faces, sigma)
+            vertex_color = meshdd.smooth_vertices_values(faces, vertex_color, iterations)
+
+        # Lookup tables if the values are still integers
+        displace_mask = meshdd.map_vertex_color(vertex_color, lambda value: value >= threshold)
+        length = meshdd.map_vertex_color(vertex_color, lambda value: depth * value / 255.)
+        return displace_mask, length
 
     # Carving the sea
     info("Carving the sea... ", end='', flush=True)
-    vertex_color = meshdd.get_vertex_color_from_texture(tcoords, bathy_texture)
-    if vertex_color.ndim > 1:
-        vertex_color = np.mean(vertex_color, axis=1)
+    displace_mask, length = get_displacement(bathy_texture, bathy_sigma, bathy_reverse, bathy_threshold, -bathy_depth)
+    if min_area is not None:
+        displace_mask = meshdd.remove_small_components(vertices, faces, displace_mask, min_area)
+    check("sea mask")
+
+    # Dry run: predicting the parts instead of calculating them
+    if plan is not None:
+        info("Skipped (dry run).")
+        plan.add_stage("mesh", vertices, faces, normals, tcoords)
+        plan.add_stage("textures", topo_texture, bathy_texture)
+        plan.add_stage("sea mask", displace_mask, temporary=(length,))
+        plan.add_part("sea", **meshdd.estimate_boolean_difference(faces, displace_mask, vertices.shape[1], vertices.dtype))
+        plan.add_part("land", vertices.shape[0], faces.shape[0], 2 * vertices.nbytes, 3 * vertices.nbytes)
+        return
 
-    displace_mask = vertex_color >= bathy_threshold
-    land_vertices = meshdd.displace_vertices(vertices, normals, -bathy_depth * vertex_color / 255., displace_mask)
+    reserve("sea displacement", vertices.nbytes)
+    chunk_size = None if memory_budget is None else memory_budget.get_chunk_size(2 * vertices[0].nbytes)
+    land_vertices = meshdd.displace_vertices(vertices, normals, length, displace_mask, chunk_size=chunk_size)
     info("Done.")
+    check("sea displacement")
 
     # Sea mesh as the difference with the sphere
     info("Sea mesh... ", end='', flush=True)
+    if memory_budget is not None:
+        reserve("sea", meshdd.estimate_boolean_difference(faces, displace_mask, vertices.shape[1], vertices.dtype)['peak_nbytes'])
     sea_vertices, sea_faces = meshdd.get_boolean_difference(vertices, land_vertices, faces, displace_mask)
     info("Done.")
+    check("sea")
+
+    yield "sea", sea_vertices, sea_faces
 
     # Bringing the mountains out
     info("Bringing the mountains out... ", end='', flush=True)
-    vertex_color = meshdd.get_vertex_color_from_texture(tcoords, topo_texture)
-    if vertex_color.ndim > 1:
-        vertex_color = np.mean(vertex_color, axis=1)
-
-    displace_mask = vertex_color >= topo_threshold
-    land_vertices = meshdd.displace_vertices(land_vertices, normals, topo_depth * vertex_color / 255., displace_mask)
+    displace_mask, length = get_displacement(topo_texture, topo_sigma, topo_reverse, topo_threshold, topo_depth)
+    land_vertices = meshdd.displace_vertices(land_vertices, normals, length, displace_mask,
+                                             out=land_vertices, chunk_size=chunk_size)
     info("Done.")
+    check("land")
+
+    yield "land", land_vertices, faces
+
+
+def create_topo_bathy_earth(topo_texture, bathy_texture,
+                            Ntheta=defaults['Ntheta'],
+                            Nphi=defaults['Nphi'],
+                            radius=defaults['radius'],
+                            topo_depth=defaults['topo_depth'],
+                            topo_threshold=defaults['topo_threshold'],
+                            topo_reverse=defaults['topo_reverse'],
+                            topo_sigma=defaults['topo_sigma'],
+                            bathy_depth=defaults['bathy_depth'],
+                            bathy_threshold=defaults['bathy_threshold'],
+                            bathy_reverse=defaults['bathy_reverse'],
+                            bathy_sigma=defaults['bathy_sigma'],
+                            smoothing=defaults['smoothing'],
+                            min_area=None,
+                            max_pixels=defaults['max_pixels'],
+                            oversampling=None,
+                            quads=False,
+                            memory_budget=None,
+                            verbose=False):
+    """
+    From topography and bathymetry textures, split land and sea and displace
+    following the depth and altitude.
+    """
 
-    return (land_vertices, faces,
-            sea_vertices, sea_faces)
+    parts = {name: (vertices, faces) for name, vertices, faces in iter_topo_bathy_earth(
+        topo_texture, bathy_texture, Ntheta, Nphi, radius,
+        topo_depth, topo_threshold, topo_reverse, topo_sigma,
+        bathy_depth, bathy_threshold, bathy_reverse, bathy_sigma,
+        smoothing, min_area, max_pixels=max_pixels, oversampling=oversampling, quads=quads, memory_budget=memory_budget, verbose=verbose)}
+
+    return (*parts['land'], *parts['sea'])
 
 
 def main():
     import argparse
+    import contextlib
     import os
 
     # Command-line parameters
@@ -152,40 +285,95 @@ def main():
                         help="Standard deviation of the Gaussian blur kernel applied to topography texture")
     parser.add_argument("--bathy_sigma", type=float, default=defaults['bathy_sigma'],
                         help="Standard deviation of the Gaussian blur kernel applied to bathymetry texture")
+    parser.add_argument("--smoothing", type=str, choices=['texture', 'mesh'], default=defaults['smoothing'],
+                        help="Smooth the textures before sampling or the sampled values on the mesh (faster)")
+    parser.add_argument("--min_area", type=float, default=None,
+                        help="Remove the islands and lakes of the sea smaller than this area")
+    parser.add_argument("--max_pixels", type=int, default=defaults['max_pixels'],
+                        help="Maximal number of pixels of the texture images")
+    parser.add_argument("--oversampling", type=float, default=None,
+                        help="Read the texture at a reduced scale (JPEG or pyramidal TIFF) keeping this number of pixels per mesh edge")
+    parser.add_argument("--quads", action="store_true",
+                        help="Use quadrangles instead of triangles (triangulated when writing)")
+    parser.add_argument("--writers", type=int, default=1,
+                        help="Number of parts written concurrently")
+    parser.add_argument("--dry_run", action="store_true",
+                        help="Only predict the size of the parts and the peak memory")
+    parser.add_argument("--validate", action="store_true",
+                        help="Check that the parts are closed and manifold before writing them")
+    parser.add_argument("--preview", type=str, default=None,
+                        help="Render the parts from a few viewpoints in this image (e.g. preview.png)")
+    parser.add_argument("--max_memory", "--max-memory", type=meshdd.tools.planner.parse_size, default=None,
+                        help="Memory budget (e.g. 8G) that the textures and chunks are fitted to, checked at each stage")
+    parser.add_argument("--backend", type=str, default='auto',
+                        choices=['auto'] + list(meshdd.tools.backends.interfaces),
+                        help="Mesh library used to read and write the meshes (auto: fastest installed one, measured once)")
     parser.add_argument("--output", type=str, default="earth.stl",
-                        help="Output file name")
+                        help="Output file name (all parts in one file for the 3MF format)")
     options = parser.parse_args()
 
-    # Generating meshes
-    land_vertices, land_faces, sea_vertices, sea_faces = create_topo_bathy_earth(
-        topo_texture=options.topo_texture[0],
-        bathy_texture=options.bathy_texture[0],
-        Ntheta=options.Ntheta, Nphi=options.Nphi,
-        radius=options.radius,
-        topo_depth=options.topo_depth,
-        topo_threshold=options.topo_threshold,
-        topo_reverse=options.topo_reverse,
-        topo_sigma=options.topo_sigma,
-        bathy_depth=options.bathy_depth,
-        bathy_threshold=options.bathy_threshold,
-        bathy_reverse=options.bathy_reverse,
-        bathy_sigma=options.bathy_sigma,
-        verbose=True)
-
-    # Writing resulting mesh
+    # Output files
     filename_prefix, filename_extension = os.path.splitext(options.output)
 
-    #mesh_interface = meshdd.tools.MeshIOInterface()
-    #mesh_interface = meshdd.tools.PyMeshInterface()
-    mesh_interface = meshdd.tools.TriMeshInterface()
+    mesh_interface = meshdd.tools.get_mesh_interface(options.backend)
+
+    # Generating meshes, each part being written in background while calculating the next one
+    plan = meshdd.tools.Plan() if options.dry_run else None
+    memory_budget = meshdd.tools.MemoryBudget(options.max_memory) if options.max_memory is not None and plan is None else None
+    with contextlib.nullcontext() if memory_budget is None else memory_budget:
+        parts = iter_topo_bathy_earth(
+            topo_texture=options.topo_texture[0],
+            bathy_texture=options.bathy_texture[0],
+            Ntheta=options.Ntheta, Nphi=options.Nphi,
+            radius=options.radius,
+            topo_depth=options.topo_depth,
+            topo_threshold=options.topo_threshold,
+            topo_reverse=options.topo_reverse,
+            topo_sigma=options.topo_sigma,
+            bathy_depth=options.bathy_depth,
+            bathy_threshold=options.bathy_threshold,
+            bathy_reverse=options.bathy_reverse,
+            bathy_sigma=options.bathy_sigma,
+            smoothing=options.smoothing,
+            min_area=options.min_area,
+            max_pixels=options.max_pixels,
+            oversampling=options.oversampling,
+            quads=options.quads,
+            plan=plan,
+            memory_budget=memory_budget,
+            verbose=True)
+
+        # Dry run: reporting the predicted sizes instead of writing the parts
+        if plan is not None:
+            for _ in parts:
+                pass
+            plan.report(available_nbytes=options.max_memory)
+            return
+
+        if options.validate:
+            parts = meshdd.tools.iter_validated(parts)
+        if options.preview is not None:
+            parts = meshdd.tools.iter_previewed(parts, options.preview, colors)
+
+        if filename_extension == '.3mf':
+            bodies = [(name, vertices, faces, colors[name]) for name, vertices, faces in parts]
+            print("Writing 3MF mesh... ", end='', flush=True)
+            write_3mf(options.output, bodies)
+            print("Done.")
+            if memory_budget is not None:
+                memory_budget.report()
+            return
+
+        with meshdd.tools.BackgroundWriter(mesh_interface, max_workers=options.writers) as writer:
+            for name, vertices, faces in parts:
+                print(f"Writing {name} mesh in background.")
+                writer.write(filename_prefix + "_" + name + filename_extension, vertices, faces)
 
-    print("Writing land mesh... ", end='', flush=True)
-    mesh_interface.write(filename_prefix + "_land" + filename_extension, land_vertices, land_faces)
-    print("Done.")
+            print("Waiting for the writes to finish... ", end='', flush=True)
+        print("Done.")
 
-    print("Writing sea mesh... ", end='', flush=True)
-    mesh_interface.write(filename_prefix + "_sea" + filename_extension, sea_vertices, sea_faces)
-    print("Done.")
+        if memory_budget is not None:
+            memory_budget.report()
 
 
 if __name__ == "__main__":
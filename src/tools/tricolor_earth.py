@@ -4,6 +4,10 @@ import numpy as np
 
 import meshdd
 from meshdd.tools import shapes
+from meshdd.tools.image_reader import read_texture
+from meshdd.tools.texture_expressions import LazyTexture
+from meshdd.tools.texture_sampler import TextureSampler
+from meshdd.tools.mesh_3mf import write_3mf
 
 # Default values for the parameters
 defaults = {
@@ -12,73 +16,187 @@ defaults = {
     'radius': 50,
     'depth': 1.2,
     'sigma': 1,
+    'smoothing': 'texture',
 }
 
+# Colors of each part when exporting to 3MF
+colors = {
+    'land': '#3C8C3C',
+    'sea': '#2850A0',
+    'ice': '#F0F0F0',
+}
 
-def create_tricolor_earth(texture,
-                          Ntheta=defaults['Ntheta'],
-                          Nphi=defaults['Nphi'],
-                          radius=defaults['radius'],
-                          depth=defaults['depth'],
-                          sigma=defaults['sigma'],
-                          verbose=False):
+
+def iter_tricolor_earth(texture,
+                        Ntheta=defaults['Ntheta'],
+                        Nphi=defaults['Nphi'],
+                        radius=defaults['radius'],
+                        depth=defaults['depth'],
+                        sigma=defaults['sigma'],
+                        smoothing=defaults['smoothing'],
+                        min_area=None,
+                        oversampling=None,
+                        quads=False,
+                        plan=None,
+                        memory_budget=None,
+                        verbose=False):
     """
     From a texture, split a sphere in land, see and ice parts.
 
+    Yields each part as (name, vertices, faces) as soon as it is calculated
+    (sea, ice and then land).
+
+    The masks are smoothed with a Gaussian blur of the texture (smoothing
+    set to 'texture') or with its approximation by a Laplacian smoothing on
+    the mesh (smoothing set to 'mesh', faster for large textures),
+    see `meshdd.smooth_vertices_values`.
+
+    Set min_area to remove the sea and ice regions (and the holes in the sea)
+    smaller than this area, see `meshdd.remove_small_components`.
+
+    Set oversampling to read the texture image at a reduced scale (JPEG or
+    pyramidal TIFF) keeping this number of pixels per mesh edge, see
+    `meshdd.get_texture_resolution` and `meshdd.tools.read_texture`.
+
+    Set quads to True to use a mesh of quadrangles (half the faces, see
+    `meshdd.tools.shapes.create_sphere`), triangulated when writing.
+
+    Set plan to a `meshdd.tools.Plan` to predict the size of the parts
+    instead of calculating them (dry run, nothing is yielded).
+
+    Set memory_budget to a `meshdd.tools.MemoryBudget` to decode the
+    texture at a reduced scale if it doesn't fit, displace the vertices by
+    chunks, check before the displacement and the difference that their
+    predicted memory fits (see `meshdd.tools.MemoryBudget.reserve`) and check
+    the memory used by each stage.
+
     Tuned for Earth images from https://visibleearth.nasa.gov/images/57730
     """
 
-    from scipy.ndimage.filters import gaussian_filter
-
     # Verbose messages
     def info(*args, **kwargs):
         if verbose:
             print(*args, **kwargs)
 
+    # Memory used by each stage, and predicted memory checked before the large ones
+    def check(stage):
+        if memory_budget is not None:
+            memory_budget.check(stage)
+
+    def reserve(stage, nbytes):
+        if memory_budget is not None:
+            memory_budget.reserve(stage, nbytes)
+
     # Creating sphere mesh
     info("Creating sphere mesh...", end='', flush=True)
-    vertices, faces, normals, tcoords = shapes.create_sphere(Ntheta, Nphi)
+    vertices, faces, normals, tcoords = shapes.create_sphere(Ntheta, Nphi, quads)
     vertices *= radius
     info("Done.")
+    check("mesh")
 
     # Reading texture image if needed
     if type(texture) is str:
         info("Reading texture...", end='', flush=True)
-        import imageio
-        texture = meshdd.get_texture_from_image(imageio.imread(texture))
+        min_shape = None if oversampling is None else meshdd.get_texture_resolution(tcoords, faces, oversampling)
+        max_nbytes = None if memory_budget is None else memory_budget.get_available(0.25)
+        texture, scale = read_texture(texture, min_shape=min_shape, return_scale=True, max_nbytes=max_nbytes)
+        sigma = sigma * scale # In pixels of the full resolution image
         info("Done.")
+        check("texture")
 
     # Calculating land, sea and ice masks
+    # Lazily evaluated at the vertices only (the smoothing of the texture is calculated on a window around each vertex)
     info("Calculating land, sea and ice mask...", end='', flush=True)
-    ice_mask = np.logical_and(texture.mean(axis=2) >= 200, texture[:, :, -1] >= np.max(texture[:, :, :2], axis=2))
-    sea_mask = texture[:, :, -1] >= 1.5*np.max(texture[:, :, :1], axis=2)
-    land_mask = np.logical_not(np.logical_or(ice_mask, sea_mask))
-    land_mask = gaussian_filter(land_mask.astype(float), sigma=sigma) >= 0.5
-    ice_mask = gaussian_filter(ice_mask.astype(float), sigma=sigma) >= 0.5
-    sea_mask = np.logical_not(np.logical_or(land_mask, ice_mask))
+    texture = LazyTexture(texture)
+    ice_mask = (texture.mean() >= 200) & (texture.channel(-1) >= texture.channel(slice(None, 2)).max())
+    sea_mask = texture.channel(-1) >= 1.5 * texture.channel(slice(None, 1)).max()
+    land_mask = ~(ice_mask | sea_mask)
+    sampler = TextureSampler(tcoords)
+
+    assert smoothing in ('texture', 'mesh'), "Unknown smoothing kind!"
+    if smoothing == 'texture':
+        land_mask = (land_mask.astype(float).gaussian(sigma) >= 0.5).sample(sampler)
+        ice_mask = (ice_mask.astype(float).gaussian(sigma) >= 0.5).sample(sampler)
+    else:
+        edges = meshdd.get_edges(faces)
+        iterations = meshdd.get_smoothing_iterations(tcoords * texture.shape, faces, sigma)
+        land_mask = meshdd.smooth_vertices_values(faces, land_mask.sample(sampler), iterations, edges=edges) >= 0.5
+        ice_mask = meshdd.smooth_vertices_values(faces, ice_mask.sample(sampler), iterations, edges=edges) >= 0.5
+
+    sea_mask = ~(land_mask | ice_mask)
+
+    # Removing the small regions
+    # Holes of the ice are not filled so that the ice doesn't overlap the (already carved) sea
+    if min_area is not None:
+        sea_mask = meshdd.remove_small_components(vertices, faces, sea_mask, min_area)
+        ice_mask = np.logical_and(ice_mask, np.logical_not(sea_mask))
+        ice_mask = meshdd.remove_small_components(vertices, faces, ice_mask, min_area, fill=False)
     info("Done.")
+    check("masks")
+
+    # Dry run: predicting the parts instead of calculating them
+    if plan is not None:
+        plan.add_stage("mesh", vertices, faces, normals, tcoords)
+        plan.add_stage("texture", texture.texture)
+        plan.add_stage("masks", sea_mask, ice_mask)
+        for name, mask in (("sea", sea_mask), ("ice", ice_mask)):
+            plan.add_part(name, **meshdd.estimate_boolean_difference(faces, mask, vertices.shape[1], vertices.dtype))
+        plan.add_part("land", vertices.shape[0], faces.shape[0], 2 * vertices.nbytes, 3 * vertices.nbytes)
+        return
 
     # Displace and difference for the sea
     info("Displacing and difference for the sea part...", end='', flush=True)
-    displace_mask = meshdd.get_vertex_color_from_texture(tcoords, sea_mask)
-    tmp_vertices = meshdd.displace_vertices(vertices, normals, -depth, displace_mask)
-    sea_vertices, sea_faces = meshdd.get_boolean_difference(vertices, tmp_vertices, faces, displace_mask)
+    if memory_budget is not None:
+        reserve("sea", vertices.nbytes + meshdd.estimate_boolean_difference(faces, sea_mask, vertices.shape[1], vertices.dtype)['peak_nbytes'])
+    chunk_size = None if memory_budget is None else memory_budget.get_chunk_size(2 * vertices[0].nbytes)
+    tmp_vertices = meshdd.displace_vertices(vertices, normals, -depth, sea_mask, chunk_size=chunk_size)
+    sea_vertices, sea_faces = meshdd.get_boolean_difference(vertices, tmp_vertices, faces, sea_mask)
     info("Done.")
+    check("sea")
+
+    yield "sea", sea_vertices, sea_faces
 
     # Displace and difference for the ice
     info("Displacing and difference for the ice part...", end='', flush=True)
-    displace_mask = meshdd.get_vertex_color_from_texture(tcoords, ice_mask)
-    land_vertices = meshdd.displace_vertices(tmp_vertices, normals, -depth, displace_mask)
-    ice_vertices, ice_faces = meshdd.get_boolean_difference(tmp_vertices, land_vertices, faces, displace_mask)
+    if memory_budget is not None:
+        reserve("ice", vertices.nbytes + meshdd.estimate_boolean_difference(faces, ice_mask, vertices.shape[1], vertices.dtype)['peak_nbytes'])
+    land_vertices = meshdd.displace_vertices(tmp_vertices, normals, -depth, ice_mask, chunk_size=chunk_size)
+    ice_vertices, ice_faces = meshdd.get_boolean_difference(tmp_vertices, land_vertices, faces, ice_mask)
     info("Done.")
+    check("ice")
+
+    yield "ice", ice_vertices, ice_faces
+    yield "land", land_vertices, faces
+
+
+def create_tricolor_earth(texture,
+                          Ntheta=defaults['Ntheta'],
+                          Nphi=defaults['Nphi'],
+                          radius=defaults['radius'],
+                          depth=defaults['depth'],
+                          sigma=defaults['sigma'],
+                          smoothing=defaults['smoothing'],
+                          min_area=None,
+                          oversampling=None,
+                          quads=False,
+                          memory_budget=None,
+                          verbose=False):
+    """
+    From a texture, split a sphere in land, see and ice parts.
+
+    Tuned for Earth images from https://visibleearth.nasa.gov/images/57730
+    """
+
+    parts = {name: (vertices, faces) for name, vertices, faces in iter_tricolor_earth(
+        texture, Ntheta, Nphi, radius, depth, sigma, smoothing, min_area,
+        oversampling=oversampling, quads=quads, memory_budget=memory_budget, verbose=verbose)}
 
-    return (land_vertices, faces,
-            sea_vertices, sea_faces,
-            ice_vertices, ice_faces)
+    return (*parts['land'], *parts['sea'], *parts['ice'])
 
 
 def main():
     import argparse
+    import contextlib
     import os
 
     # Command-line parameters
@@ -97,36 +215,84 @@ def main():
                         help="Displacement depth")
     parser.add_argument("--sigma", type=float, default=defaults['sigma'],
                         help="Standard deviation used to define the Gaussian blur kernel when splitting texture")
+    parser.add_argument("--smoothing", type=str, choices=['texture', 'mesh'], default=defaults['smoothing'],
+                        help="Smooth the masks on the texture or on the mesh (faster)")
+    parser.add_argument("--min_area", type=float, default=None,
+                        help="Remove the sea and ice regions smaller than this area")
+    parser.add_argument("--oversampling", type=float, default=None,
+                        help="Read the texture at a reduced scale (JPEG or pyramidal TIFF) keeping this number of pixels per mesh edge")
+    parser.add_argument("--quads", action="store_true",
+                        help="Use quadrangles instead of triangles (triangulated when writing)")
+    parser.add_argument("--writers", type=int, default=1,
+                        help="Number of parts written concurrently")
+    parser.add_argument("--dry_run", action="store_true",
+                        help="Only predict the size of the parts and the peak memory")
+    parser.add_argument("--validate", action="store_true",
+                        help="Check that the parts are closed and manifold before writing them")
+    parser.add_argument("--preview", type=str, default=None,
+                        help="Render the parts from a few viewpoints in this image (e.g. preview.png)")
+    parser.add_argument("--max_memory", "--max-memory", type=meshdd.tools.planner.parse_size, default=None,
+                        help="Memory budget (e.g. 8G) that the textures and chunks are fitted to, checked at each stage")
+    parser.add_argument("--backend", type=str, default='auto',
+                        choices=['auto'] + list(meshdd.tools.backends.interfaces),
+                        help="Mesh library used to read and write the meshes (auto: fastest installed one, measured once)")
     parser.add_argument("--output", type=str, default="earth.stl",
-                        help="Output file name")
+                        help="Output file name (all parts in one file for the 3MF format)")
     options = parser.parse_args()
 
-    # Generating meshes
-    land_vertices, land_faces, sea_vertices, sea_faces, ice_vertices, ice_faces = create_tricolor_earth(
-        texture=options.texture[0],
-        Ntheta=options.Ntheta, Nphi=options.Nphi,
-        radius=options.radius, sigma=options.sigma,
-        depth=options.depth,
-        verbose=True)
-
-    # Writing resulting mesh
+    # Output files
     filename_prefix, filename_extension = os.path.splitext(options.output)
 
-    #mesh_interface = meshdd.tools.MeshIOInterface()
-    #mesh_interface = meshdd.tools.PyMeshInterface()
-    mesh_interface = meshdd.tools.TriMeshInterface()
+    mesh_interface = meshdd.tools.get_mesh_interface(options.backend)
+
+    # Generating meshes, each part being written in background while calculating the next one
+    plan = meshdd.tools.Plan() if options.dry_run else None
+    memory_budget = meshdd.tools.MemoryBudget(options.max_memory) if options.max_memory is not None and plan is None else None
+    with contextlib.nullcontext() if memory_budget is None else memory_budget:
+        parts = iter_tricolor_earth(
+            texture=options.texture[0],
+            Ntheta=options.Ntheta, Nphi=options.Nphi,
+            radius=options.radius, sigma=options.sigma,
+            smoothing=options.smoothing,
+            depth=options.depth,
+            min_area=options.min_area,
+            oversampling=options.oversampling,
+            quads=options.quads,
+            plan=plan,
+            memory_budget=memory_budget,
+            verbose=True)
+
+        # Dry run: reporting the predicted sizes instead of writing the parts
+        if plan is not None:
+            for _ in parts:
+                pass
+            plan.report(available_nbytes=options.max_memory)
+            return
+
+        if options.validate:
+            parts = meshdd.tools.iter_validated(parts)
+        if options.preview is not None:
+            parts = meshdd.tools.iter_previewed(parts, options.preview, colors)
+
+        if filename_extension == '.3mf':
+            bodies = [(name, vertices, faces, colors[name]) for name, vertices, faces in parts]
+            print("Writing 3MF mesh... ", end='', flush=True)
+            write_3mf(options.output, bodies)
+            print("Done.")
+            if memory_budget is not None:
+                memory_budget.report()
+            return
 
-    print("Writing land mesh... ", end='', flush=True)
-    mesh_interface.write(filename_prefix + "_land" + filename_extension, land_vertices, land_faces)
-    print("Done.")
+        with meshdd.tools.BackgroundWriter(mesh_interface, max_workers=options.writers) as writer:
+            for name, vertices, faces in parts:
+                print(f"Writing {name} mesh in background.")
+                writer.write(filename_prefix + "_" + name + filename_extension, vertices, faces)
 
-    print("Writing sea mesh... ", end='', flush=True)
-    mesh_interface.write(filename_prefix + "_sea" + filename_extension, sea_vertices, sea_faces)
-    print("Done.")
+            print("Waiting for the writes to finish... ", end='', flush=True)
+        print("Done.")
 
-    print("Writing ice mesh... ", end='', flush=True)
-    mesh_interface.write(filename_prefix + "_ice" + filename_extension, ice_vertices, ice_faces)
-    print("Done.")
+        if memory_budget is not None:
+            memory_budget.report()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,32 @@
+import meshdd
+
+
+def iter_validated(parts, strict=False, **kwargs):
+    """
+    Validates the parts of a pipeline as they are generated, see `meshdd.validate`
+
+    A report is printed for each part, that is then yielded unchanged.
+
+    Parameters
+    ----------
+    parts: iterable of (name, vertices, faces)
+        Parts of a pipeline (e.g. from `iter_bicolor_sphere`)
+    strict: bool
+        If True, raises a ValueError on the first invalid part
+    kwargs:
+        Additional parameters of `meshdd.validate`
+    """
+
+    for name, vertices, faces in parts:
+        print(f"Validating {name} mesh... ", end='', flush=True)
+        report = meshdd.validate(vertices, faces, **kwargs)
+        problems = [f"{values.shape[0]} {key.replace('_', ' ')}" for key, values in report.items() if values.shape[0] > 0]
+
+        if not problems:
+            print("closed and manifold.")
+        else:
+            print(", ".join(problems) + ".")
+            if strict:
+                raise ValueError(f"Invalid {name} mesh: " + ", ".join(problems) + "!")
+
+        yield name, vertices, faces
@@ -0,0 +1,76 @@
+import json
+import time
+
+import pytest
+
+from meshdd.tools import AutoInterface, register_interface, shapes
+from meshdd.tools.backends import interfaces
+
+
+class _Interface:
+    """ Fake interface taking a given time (in ms) to read or write """
+
+    duration = 1.
+
+    def read(self, mesh_file):
+        time.sleep(self.duration * 1e-3)
+        vertices, faces, normals, tcoords = shapes.create_sphere(10, 10)
+        return vertices, faces, normals, tcoords
+
+    def write(self, mesh_file, vertices, faces):
+        time.sleep(self.duration * 1e-3)
+        open(mesh_file, 'w').close()
+
+
+class SlowTriangles(_Interface):
+    duration = 20.
+
+
+class FastTriangles(_Interface):
+    duration = 1.
+
+
+class FastPolygons(_Interface):
+    duration = 0.
+
+    @staticmethod
+    def writes_polygons(extension):
+        return True
+
+
+@pytest.fixture
+def fake_interfaces():
+    names = {'slow_triangles': SlowTriangles, 'fast_polygons': FastPolygons, 'fast_triangles': FastTriangles}
+    for name, interface_class in names.items():
+        register_interface(name, interface_class)
+    yield list(names)
+    for name in names:
+        del interfaces[name]
+
+
+def test_select(tmp_path, fake_interfaces):
+    auto = AutoInterface(cache_file=str(tmp_path / 'backends.json'), candidates=fake_interfaces)
+
+    # Reading with the first interface, writing with the fastest one that writes the same faces
+    assert auto.select('.ply', 'read') == 'slow_triangles'
+    assert auto.select('.ply', 'write') == 'fast_triangles'
+
+
+def test_cache_versions(tmp_path, fake_interfaces):
+    cache_file = tmp_path / 'backends.json'
+    auto = AutoInterface(cache_file=str(cache_file), candidates=fake_interfaces)
+    auto.select('.ply', 'write')
+
+    cache = json.loads(cache_file.read_text())
+    assert set(cache['versions']) >= {'numpy', 'meshdd'}
+    assert set(cache['measures']) == {f"{name}:.ply:write" for name in ('slow_triangles', 'fast_triangles')}
+
+    # Cached measures are used as long as the versions are the same
+    cache['measures']['slow_triangles:.ply:write'] = 0.
+    cache_file.write_text(json.dumps(cache))
+    assert AutoInterface(cache_file=str(cache_file), candidates=fake_interfaces).select('.ply', 'write') == 'slow_triangles'
+
+    # and discarded when a version changes
+    cache['versions']['numpy'] = '0.0'
+    cache_file.write_text(json.dumps(cache))
+    assert AutoInterface(cache_file=str(cache_file), candidates=fake_interfaces).select('.ply', 'write') == 'fast_triangles'
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+import meshdd
+from meshdd.tools.bicolor_sphere import iter_bicolor_sphere
+from meshdd.tools.decimation import decimate
+
+
+def create_grid_cube(n):
+    """ Closed cube [-1, 1]^3 with n x n pairs of triangles per side """
+
+    t = np.linspace(-1, 1, n + 1)
+    u, v = np.meshgrid(t, t, indexing='ij')
+    index = np.arange((n + 1)**2).reshape(n + 1, n + 1)
+    quads = np.stack((index[:-1, :-1], index[1:, :-1], index[1:, 1:], index[:-1, 1:]), axis=-1).reshape(-1, 4)
+
+    vertices, faces = [], []
+    for axis in range(3):
+        for sign in (-1, 1):
+            side = np.empty((n + 1, n + 1, 3))
+            side[..., axis] = sign
+            side[..., (axis + 1) % 3] = u
+            side[..., (axis + 2) % 3] = v
+            side_quads = quads if sign > 0 else quads[:, ::-1]
+            faces.append(np.concatenate((side_quads[:, [0, 1, 2]], side_quads[:, [0, 2, 3]])) + len(vertices) * (n + 1)**2)
+            vertices.append(side.reshape(-1, 3))
+
+    # Merging the vertices shared by the sides
+    vertices = np.concatenate(vertices)
+    _, first, inverse = np.unique(np.round(vertices * n).astype(np.int64), axis=0, return_index=True, return_inverse=True)
+    return vertices[first], inverse.reshape(-1)[np.concatenate(faces)]
+
+
+def get_areas(vertices, faces):
+    a, b, c = (vertices[faces[:, k]] for k in range(3))
+    return np.linalg.norm(np.cross(b - a, c - a), axis=1) / 2
+
+
+@pytest.mark.parametrize("n", [10, 20, 40])
+@pytest.mark.parametrize("max_error", [1e-3, 1e-1])
+def test_decimate_flat_cube(n, max_error):
+    vertices, faces = create_grid_cube(n)
+    assert meshdd.validate(vertices, faces)['degenerate_faces'].size == 0
+
+    decimated_faces, vertices_id = decimate(vertices, faces, max_error=max_error)
+    decimated_vertices = vertices[vertices_id]
+
+    assert decimated_faces.shape[0] < faces.shape[0] // 4
+    report = meshdd.validate(decimated_vertices, decimated_faces)
+    assert all(value.size == 0 for value in report.values())
+    assert np.amin(get_areas(decimated_vertices, decimated_faces)) > 1e-6
+    assert np.all(np.amax(np.abs(decimated_vertices), axis=1) == 1.)
+
+
+@pytest.mark.parametrize("cut_border", [False, True])
+def test_decimate_bicolor_sphere(cut_border):
+    y, x = np.mgrid[0:100, 0:200] / 100.
+    texture = (128 + 100 * np.sin(3 * np.pi * x) * np.cos(2 * np.pi * y)).astype(np.uint8)
+
+    for name, vertices, faces in iter_bicolor_sphere(texture, 120, 120, cut_border=cut_border, decimation=1e-2):
+        faces = meshdd.triangulate_faces(faces)
+        report = meshdd.validate(vertices, faces)
+        assert report['degenerate_faces'].size == 0, name
+        assert report['boundary_edges'].size == 0, name
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+import meshdd
+from meshdd.tools import shapes
+from meshdd.tools.decomposition import partition_mesh, get_bicolor_tiles
+
+
+@pytest.fixture
+def mesh():
+    vertices, faces, normals, tcoords = shapes.create_sphere(100, 100)
+    tcoords = (tcoords + [0, np.pi / 2]) / [2 * np.pi, np.pi]
+    # Faces in a random order (e.g. read from a file)
+    faces = faces[np.random.default_rng(0).permutation(faces.shape[0])]
+    return vertices, faces, normals, tcoords
+
+
+def test_partition_mesh(mesh):
+    vertices, faces, _, tcoords = mesh
+    for points in (vertices, tcoords):
+        tiles = partition_mesh(faces, points, 7)
+        assert len(tiles) == 7
+        assert np.array_equal(np.sort(np.concatenate(tiles)), np.arange(faces.shape[0]))
+
+
+@pytest.mark.parametrize("partition", ['uv', 'space', 'index'])
+def test_get_bicolor_tiles(mesh, partition):
+    vertices, faces, normals, tcoords = mesh
+    texture = np.random.default_rng(0).integers(0, 256, (100, 200), dtype=np.uint8)
+
+    displace_mask = meshdd.get_vertex_color_from_texture(tcoords, texture) >= 128
+    displaced_vertices = meshdd.displace_vertices(vertices, normals, -0.5, displace_mask)
+    diff_vertices, diff_faces = meshdd.get_boolean_difference(vertices, displaced_vertices, faces, displace_mask)
+
+    tiles_mask, tiles_displaced, tiles_diff_vertices, tiles_diff_faces = get_bicolor_tiles(
+        vertices, faces, normals, tcoords, texture, 128, 0.5, tiles_cnt=4, partition=partition, processes=1)
+
+    assert np.array_equal(tiles_mask, displace_mask)
+    assert np.array_equal(tiles_displaced, displaced_vertices)
+    assert np.array_equal(tiles_diff_vertices, diff_vertices)
+    # Same faces, up to their order
+    assert np.array_equal(np.unique(tiles_diff_faces, axis=0), np.unique(diff_faces, axis=0))
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+import meshdd
+
+
+@pytest.mark.parametrize("dtype", [np.float64, np.uint8])
+def test_cut_border_faces(dtype):
+    vertices = np.array([[0., 0., 0.], [1., 0., 0.], [0., 1., 0.], [1., 1., 0.]])
+    faces = np.array([[0, 1, 2], [1, 3, 2]])
+    values = np.array([200, 100, 100, 100], dtype=dtype)
+    mask = values >= 128
+
+    cut_faces, cut_mask, cut_vertices = meshdd.cut_border_faces(faces, mask, values, 128, vertices)
+
+    # Edges (0, 1) and (0, 2) cut where the values reach the threshold
+    assert np.array_equal(cut_mask, [True, False, False, False, False, False])
+    assert np.allclose(cut_vertices[4:], [[0.72, 0., 0.], [0., 0.72, 0.]])
+    assert cut_faces.shape[0] == 4
+    assert meshdd.validate(cut_vertices, cut_faces)['degenerate_faces'].size == 0
+
+
+def test_cut_border_faces_integer_arrays():
+    faces = np.array([[0, 1, 2]])
+    values = np.array([0., 1., 1.])
+    colors = np.array([[200, 0, 255], [100, 255, 0], [100, 255, 0]], dtype=np.uint8)
+
+    _, _, cut_colors = meshdd.cut_border_faces(faces, values >= 0.5, values, 0.5, colors)
+
+    assert cut_colors.dtype == np.uint8
+    assert np.array_equal(cut_colors[3:], [[150, 127, 127], [150, 127, 127]])
+
+
+@pytest.mark.parametrize("dtype", [np.int32, np.int64])
+def test_cut_border_faces_large_mesh(dtype):
+    # Edge keys larger than the int32 range
+    n = 60000
+    vertices = np.random.default_rng(0).random((n, 3))
+    faces = np.array([[50000, 50001, 50002]], dtype=dtype)
+    values = np.zeros(n)
+    values[50000] = 1.
+    mask = values >= 0.5
+
+    cut_faces, cut_mask, cut_vertices = meshdd.cut_border_faces(faces, mask, values, 0.5, vertices)
+
+    assert cut_faces.dtype == dtype
+    assert np.allclose(cut_vertices[n:], [(vertices[50000] + vertices[50001]) / 2, (vertices[50000] + vertices[50002]) / 2])
+
+
+def test_reorder_mesh():
+    vertices = np.random.default_rng(0).random((100, 3))
+    faces = np.random.default_rng(1).integers(0, 100, (200, 3))
+
+    reordered_faces, vertices_order, faces_order = meshdd.reorder_mesh(vertices, faces)
+
+    # Same faces on the reordered vertices, sorted by their smallest vertex index
+    assert np.array_equal(vertices_order[reordered_faces], faces[faces_order])
+    assert np.all(np.diff(np.amin(reordered_faces, axis=1)) >= 0)
@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+from meshdd.tools import MemoryBudget, Plan, shapes
+from meshdd.tools.bicolor_mesh import iter_bicolor_mesh
+from meshdd.tools.bicolor_sphere import iter_bicolor_sphere
+
+
+@pytest.fixture
+def texture():
+    return np.random.default_rng(0).integers(0, 256, (200, 400), dtype=np.uint8)
+
+
+def test_reserve():
+    with MemoryBudget(2**20) as budget:
+        budget.reserve("small", 2**10)
+        with pytest.raises(MemoryError, match="large"):
+            budget.reserve("large", 2**21)
+
+
+def test_budget_before_stage(texture):
+    # The difference doesn't fit: the error is raised before calculating it
+    with MemoryBudget(2**26) as budget:
+        parts = iter_bicolor_sphere(texture, 500, 500, memory_budget=budget)
+        assert next(parts)[0] == "displaced"
+        with pytest.raises(MemoryError, match="Stage difference needs"):
+            next(parts)
+        assert [name for name, *_ in budget.stages] == ["mesh", "displacement"]
+
+
+def test_budget_tiles(texture):
+    vertices, faces, normals, tcoords = shapes.create_sphere(300, 300)
+    tcoords = (tcoords + [0, np.pi / 2]) / [2 * np.pi, np.pi]
+    expected = list(iter_bicolor_mesh(vertices, faces, normals, tcoords, texture))
+
+    # More tiles to fit in the budget, same parts
+    with MemoryBudget(2**25) as budget:
+        parts = list(iter_bicolor_mesh(vertices, faces, normals, tcoords, texture, tiles=2, processes=1, memory_budget=budget))
+    for (name, *mesh), (expected_name, *expected_mesh) in zip(parts, expected):
+        assert name == expected_name
+        assert np.array_equal(np.sort(mesh[0], axis=0), np.sort(expected_mesh[0], axis=0))
+        assert mesh[1].shape == expected_mesh[1].shape
+
+    with MemoryBudget(2**24) as budget:
+        with pytest.raises(MemoryError, match="Stage tiles needs"):
+            list(iter_bicolor_mesh(vertices, faces, normals, tcoords, texture, tiles=2, processes=1, memory_budget=budget))
+
+
+def test_plan(texture):
+    plan = Plan()
+    assert list(iter_bicolor_sphere(texture, 100, 100, plan=plan)) == []
+    assert [name for name, *_ in plan.parts] == ["displaced", "difference"]
+
+    assert plan.fits(10 * plan.peak_nbytes)
+    assert not plan.fits(plan.peak_nbytes // 2)
+    assert plan.get_max_writers(plan.peak_nbytes // 2) == 1
+    assert plan.get_max_writers(100 * plan.peak_nbytes) == 2
+
+
+def test_concurrent_budgets():
+    import tracemalloc
+
+    first = MemoryBudget(2**30)
+    with MemoryBudget(2**30) as second:
+        array = np.ones(2**20)
+        second.check("array")
+        # Closing a budget doesn't stop the tracing used by another one
+        first.close()
+        first.close()
+        assert tracemalloc.is_tracing()
+        del array
+        second.check("released")
+
+    assert not tracemalloc.is_tracing()
+    # Peak of the first stage seen by its budget even if another budget checked a stage before
+    assert second.stages[0][2] >= 2**23
+    assert second.stages[1][1] < 2**20
+
+
+def test_budget_threads(texture):
+    from concurrent.futures import ThreadPoolExecutor
+
+    def run(nbytes):
+        with MemoryBudget(nbytes) as budget:
+            parts = list(iter_bicolor_sphere(texture, 100, 100, memory_budget=budget))
+        return [part[1] for part in parts], [name for name, *_ in budget.stages]
+
+    expected = run(2**30)
+    with ThreadPoolExecutor(4) as executor:
+        for result in executor.map(run, [2**30] * 8):
+            assert all(np.array_equal(a, b) for a, b in zip(result[0], expected[0]))
+            assert result[1] == expected[1]
@@ -0,0 +1,73 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from meshdd.tools import shapes
+from meshdd.tools.bicolor_sphere import create_bicolor_sphere
+from meshdd.tools.mesh_interfaces import TriMeshInterface
+from meshdd.tools.topo_bathy_earth import create_topo_bathy_earth
+
+
+@pytest.fixture
+def textures(tmp_path):
+    import PIL.Image
+
+    y, x = np.mgrid[0:100, 0:200] / 100.
+    topo = (128 + 120 * np.sin(3 * np.pi * x) * np.cos(2 * np.pi * y)).astype(np.uint8)
+    bathy = (255 - topo).astype(np.uint8)
+
+    files = {}
+    for name, image in (('topo', topo), ('bathy', bathy), ('color', np.dstack((topo, bathy, topo)))):
+        files[name] = str(tmp_path / f"{name}.png")
+        PIL.Image.fromarray(image).save(files[name])
+    return files
+
+
+def get_jobs(textures):
+    """ Mixed jobs with different parameters (and different global settings before they were per call) """
+
+    vertices, faces, _, _ = shapes.create_sphere(60, 60)
+    noisy_vertices = np.concatenate((vertices, vertices + np.random.default_rng(0).normal(0, 1e-6, vertices.shape)))
+    noisy_faces = np.concatenate((faces, faces + vertices.shape[0]))
+
+    jobs = []
+    for threshold in (64, 128, 192):
+        jobs.append((create_bicolor_sphere, (textures['color'],), dict(Ntheta=80, Nphi=80, threshold=threshold)))
+    for sigma, max_pixels in ((2, 200 * 100), (5, 10**6), (None, 10**8)):
+        jobs.append((create_topo_bathy_earth, (textures['topo'], textures['bathy']),
+                     dict(Ntheta=80, Nphi=80, topo_sigma=sigma, bathy_sigma=sigma, max_pixels=max_pixels)))
+    for tol in (1e-12, 1e-5, 1e-2):
+        jobs.append((TriMeshInterface().clean, (noisy_vertices, noisy_faces), dict(tol=tol)))
+    return jobs
+
+
+def run(job):
+    function, args, kwargs = job
+    return function(*args, **kwargs)
+
+
+def test_concurrent_jobs(textures):
+    pytest.importorskip('trimesh')
+    pytest.importorskip('scipy')
+    import PIL.Image
+    import trimesh
+
+    tol_merge, max_image_pixels = trimesh.constants.tol.merge, PIL.Image.MAX_IMAGE_PIXELS
+
+    jobs = get_jobs(textures)
+    expected = [run(job) for job in jobs]
+
+    # Each job several times, interleaved in threads
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(run, jobs * 4))
+
+    for index, result in enumerate(results):
+        for array, expected_array in zip(result, expected[index % len(jobs)]):
+            assert (array is None and expected_array is None) or np.array_equal(array, expected_array)
+
+    # Different tolerances give different results
+    assert expected[-1][0].shape[0] < expected[-3][0].shape[0]
+
+    assert trimesh.constants.tol.merge == tol_merge
+    assert PIL.Image.MAX_IMAGE_PIXELS == max_image_pixels
@@ -0,0 +1,124 @@
+import io
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+
+from meshdd.tools import shapes
+from meshdd.tools.server import ArrayCache, JobRunner, create_server
+
+
+class CountingInterface:
+    """ Mesh interface reading a sphere whatever the file, counting the reads """
+
+    def __init__(self):
+        self.reads = 0
+
+    def read(self, mesh_file):
+        self.reads += 1
+        vertices, faces, normals, tcoords = shapes.create_sphere(60, 60)
+        return vertices, faces, normals, (tcoords + [0, np.pi / 2]) / [2 * np.pi, np.pi]
+
+
+@pytest.fixture
+def files(tmp_path):
+    import PIL.Image
+
+    y, x = np.mgrid[0:100, 0:200] / 100.
+    texture = (128 + 120 * np.sin(3 * np.pi * x) * np.cos(2 * np.pi * y)).astype(np.uint8)
+
+    files = {'texture': str(tmp_path / "texture.png"), 'mesh': str(tmp_path / "mesh.ply")}
+    PIL.Image.fromarray(texture).save(files['texture'])
+    open(files['mesh'], 'w').close()
+    return files
+
+
+def test_array_cache():
+    cache = ArrayCache(3000)
+    calls = []
+
+    def get(key, nbytes=1000):
+        return cache.get(key, lambda: calls.append(key) or np.zeros(nbytes, dtype=np.uint8))
+
+    for key in 'abc':
+        get(key)
+    assert cache.stats() == {'entries': 3, 'nbytes': 3000, 'hits': 0, 'misses': 3}
+
+    # 'a' becomes the most recently used, so 'b' is evicted by 'd'
+    get('a')
+    get('d')
+    assert calls == ['a', 'b', 'c', 'd']
+    assert cache.stats() == {'entries': 3, 'nbytes': 3000, 'hits': 1, 'misses': 4}
+    get('a')
+    get('b')
+    assert calls == ['a', 'b', 'c', 'd', 'b']
+
+    # Tuples of arrays are counted, and an entry larger than the cache is still kept alone
+    value = cache.get('e', lambda: (np.zeros(500, dtype=np.uint8), None, np.zeros(4000, dtype=np.uint8)))
+    assert cache.get('e', None) is value
+    assert cache.stats()['entries'] == 1
+    assert cache.stats()['nbytes'] == 4500
+
+
+def test_runner_reuses_inputs(files):
+    interface = CountingInterface()
+    runner = JobRunner(2**30, mesh_interface=interface)
+
+    def run(threshold):
+        return runner.run({'pipeline': 'bicolor_mesh',
+                           'parameters': {'mesh': files['mesh'], 'texture': files['texture'], 'threshold': threshold}})
+
+    first, second = run(64), run(192)
+    assert interface.reads == 1
+    assert runner.stats()['textures']['misses'] == 1 and runner.stats()['textures']['hits'] == 1
+    assert runner.stats()['meshes']['misses'] == 1 and runner.stats()['meshes']['hits'] == 1
+    assert first[1][2].shape != second[1][2].shape
+
+    # Same texture for other pipelines and parameters
+    runner.run({'pipeline': 'topo_bathy_earth',
+                'parameters': {'topo_texture': files['texture'], 'bathy_texture': files['texture'],
+                               'Ntheta': 60, 'Nphi': 60, 'topo_sigma': 2, 'bathy_sigma': 2}})
+    runner.run({'pipeline': 'topo_bathy_earth',
+                'parameters': {'topo_texture': files['texture'], 'bathy_texture': files['texture'],
+                               'Ntheta': 60, 'Nphi': 60, 'topo_sigma': 5, 'bathy_sigma': 5}})
+    assert runner.stats()['textures'] == {'entries': 1, 'nbytes': 200 * 100, 'hits': 5, 'misses': 1}
+
+
+def test_server(files):
+    runner = JobRunner(2**30, mesh_interface=CountingInterface())
+    server = create_server(runner, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    def post(job):
+        request = urllib.request.Request(url + "/jobs", json.dumps(job).encode(), {'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request) as response:
+            return response.read()
+
+    try:
+        job = {'pipeline': 'bicolor_sphere', 'parameters': {'texture': files['texture'], 'Ntheta': 60, 'Nphi': 60}}
+        archive = np.load(io.BytesIO(post(job)))
+        for name, vertices, faces in runner.run(job):
+            assert np.array_equal(archive[f"{name}_vertices"], vertices)
+            assert np.array_equal(archive[f"{name}_faces"], faces)
+
+        summary = json.loads(post(dict(job, dry_run=True)))
+        assert [part['name'] for part in summary['parts']] == ["displaced", "difference"]
+
+        with urllib.request.urlopen(url + "/status") as response:
+            assert json.loads(response.read())['textures']['entries'] == 1
+
+        with pytest.raises(urllib.error.HTTPError) as error:
+            post({'pipeline': 'unknown'})
+        assert error.value.code == 400
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(url + "/unknown")
+        assert error.value.code == 404
+
+    finally:
+        server.shutdown()
+        server.server_close()
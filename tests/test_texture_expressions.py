@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+
+from meshdd.tools import LazyTexture, TextureExpression, TextureSampler
+
+
+def test_abstract_expression():
+    with pytest.raises(TypeError):
+        TextureExpression()
+
+
+def test_sample():
+    texture = np.random.default_rng(0).integers(0, 256, (50, 100, 3), dtype=np.uint8)
+    tcoords = np.random.default_rng(1).random((1000, 2))
+    sampler = TextureSampler(tcoords)
+
+    expression = LazyTexture(texture)
+    values = ((expression.mean() >= 128) & (expression.channel(-1) > expression.channel(0))).sample(sampler)
+
+    colors = sampler.sample(texture)
+    assert np.array_equal(values, (colors.mean(axis=-1) >= 128) & (colors[:, -1] > colors[:, 0]))